@@ -4,9 +4,11 @@ import sys
 import numpy as np
 import cv2
 import os
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from typing import List, Tuple
 from aruco.aruco import Aruco
+from instrumentation import latency
 
 NUM_ID_CANDIDATES = 100
 ARUCO_PX_DIMS = 300
@@ -16,6 +18,20 @@ N_ANGLE_MARKS = 19
 OPT_IMAGE_WIDTH = 640
 OPT_IMAGE_HEIGHT = 480
 
+# Tiled detection: grid of tiles (rows, columns), overlap between neighbouring tiles (pixels) and number of parallel workers
+TILE_GRID = (2, 3)
+TILE_OVERLAP = 96
+TILE_WORKERS = os.cpu_count() or 4
+# Max distance between the centers of two detections of the same marker, relative to the marker size, to be taken as duplicates
+TILE_DUPLICATE_DISTANCE = 0.5
+
+# Marker axes drawing: colors (BGR) of the x, y, z axes and line thickness (as `cv2.aruco.drawAxis`)
+AXIS_COLORS = ((0, 0, 255), (0, 255, 0), (255, 0, 0))
+AXIS_THICKNESS = 3
+
+# Workers pool of tiled detection (created on first use)
+_tile_pool = None
+
 DICTIONARIES = set()
 # DICTIONARIES.add(cv2.aruco.DICT_4X4_50)
 # DICTIONARIES.add(cv2.aruco.DICT_4X4_100)
@@ -40,7 +56,7 @@ class ArucoDetection():
     """ Aruco detector class."""
 
     @staticmethod
-    def detect(image: np.ndarray, dictionaries: List[cv2.aruco_Dictionary] = None, marker_length: float = 0.02, matrix_coefficients: List[Tuple[float, float, float]] = MATRIX_COEFFICIENTS, distortion_coefficients: Tuple[float, float, float, float, float] = np.zeros((1, 5)), optimized: bool = False) -> List[Aruco]:
+    def detect(image: np.ndarray, dictionaries: List[cv2.aruco_Dictionary] = None, marker_length: float = 0.02, matrix_coefficients: List[Tuple[float, float, float]] = MATRIX_COEFFICIENTS, distortion_coefficients: Tuple[float, float, float, float, float] = np.zeros((1, 5)), optimized: bool = False, tiled: bool = False, scale: float = None, rois: List[Tuple[int, int, int, int]] = None, estimate_pose: bool = True) -> List[Aruco]:
         """ 
             Performs an Aruco detection on input image, and returns the markers found from the different dictionaries indicated. Params:
             * image: Input image
@@ -49,6 +65,10 @@ class ArucoDetection():
             * matrix_coefficients: Matrix of Camera coefficients. If `None` then uses default `MATRIX_COEFFICIENTS` value (not recomended)
             * distortion_coefficients: Distorsion coefficients array, by default all values are set to zero. 
             * optimized: Optimizes the aruco detection by reducing input image and rescaling the output detected markers locations. 
+            * tiled: Detects at full resolution on overlapping tiles of the image in parallel workers (see `TILE_GRID`), for small and distant markers. 
+            * scale: Detection scale (0-1). The input image is reduced by this factor instead of the `optimized` fixed resolution (see `ResolutionController`). 
+            * rois: Regions of interest (x0, y0, x1, y1). If set, detects only inside them at full resolution (see `DetectionGovernor`). 
+            * estimate_pose: Estimates the pose of each marker. If `False`, rotation and translation are `None` and the pose is left to the tracker (see `ArucoTracker`). 
         """
         # Aruco array initialization
         arucos = []
@@ -58,10 +78,28 @@ class ArucoDetection():
         # Creates aruco params
         if dictionaries:
             aruco_params = cv2.aruco.DetectorParameters_create()
-        if optimized:
+        if tiled or rois:
+            # Full resolution detection on tiles or regions of interest
+            with latency.span("detect/tiled" if tiled else "detect/roi"):
+                markers = ArucoDetection._detect_tiled(image, dictionaries, aruco_params) if tiled else ArucoDetection._detect_regions(image, dictionaries, aruco_params, rois)
+            for dictionary, corners, id in markers:
+                if not estimate_pose:
+                    arucos.append(Aruco(corners[0], None, None, dictionary, id))
+                    continue
+                # Estimation of each marker pose
+                with latency.span("pose"):
+                    rotation, translation, markerpoints = cv2.aruco.estimatePoseSingleMarkers(corners, marker_length, matrix_coefficients, distortion_coefficients)
+                arucos.append(Aruco(corners[0], rotation[0][0], translation[0][0], dictionary, id))
+            return arucos
+        resize_factor = 1.0
+        if scale is not None:
+            # Reduces input image resolution by the given scale
+            if scale < 1.0:
+                resize_factor = scale
+                image = cv2.resize(image, (0, 0), fx=resize_factor, fy=resize_factor)
+        elif optimized:
             # Reduces input image resolution
-            height, width, _ = image.shape
-            resize_factor = 1.0
+            height, width = image.shape[:2]
             if height > OPT_IMAGE_HEIGHT and width > OPT_IMAGE_WIDTH:
                 resize_factor = min(OPT_IMAGE_HEIGHT/height, OPT_IMAGE_WIDTH/width)
                 image = cv2.resize(image, (0, 0), fx=resize_factor, fy=resize_factor)
@@ -69,32 +107,128 @@ class ArucoDetection():
         for dictionary in dictionaries:
             aruco_dict = cv2.aruco.Dictionary_get(dictionary)
             # Detection of all arucos in the image
-            (aruco_corners, aruco_ids, rejected) = cv2.aruco.detectMarkers(image, aruco_dict, parameters=aruco_params)
-            if optimized:
+            with latency.span(f"detect/{dictionary}"):
+                (aruco_corners, aruco_ids, rejected) = cv2.aruco.detectMarkers(image, aruco_dict, parameters=aruco_params)
+            if resize_factor != 1.0:
                 aruco_corners = [corner/resize_factor for corner in aruco_corners]
             for i in range(0,len(aruco_corners)):
+                if not estimate_pose:
+                    arucos.append(Aruco(aruco_corners[i][0], None, None, dictionary, aruco_ids[i][0]))
+                    continue
                 # Estimation of each marker pose
-                rotation, translation, markerpoints = cv2.aruco.estimatePoseSingleMarkers(aruco_corners[i], marker_length, matrix_coefficients, distortion_coefficients)
+                with latency.span("pose"):
+                    rotation, translation, markerpoints = cv2.aruco.estimatePoseSingleMarkers(aruco_corners[i], marker_length, matrix_coefficients, distortion_coefficients)
                 arucos.append(Aruco(aruco_corners[i][0], rotation[0][0], translation[0][0], dictionary, aruco_ids[i][0]))
         return arucos
 
     @staticmethod
-    def draw_detected_markers(image: np.ndarray, arucos: List[Aruco], marker_length: float = 0.02, matrix_coefficients: List[Tuple[float, float, float]] = MATRIX_COEFFICIENTS, distortion_coefficients: Tuple[float, float, float, float, float] = np.zeros((1, 5)), draw_bounds: bool = True, draw_axis: bool = True, draw_ids: bool = True) -> np.ndarray:
+    def _detect_tiled(image: np.ndarray, dictionaries: List[cv2.aruco_Dictionary], aruco_params: cv2.aruco_DetectorParameters) -> List[Tuple[cv2.aruco_Dictionary, np.ndarray, int]]:
+        """ 
+            Detects the markers of each dictionary on overlapping full resolution tiles of the gray image, plus a reduced full image
+            for markers bigger than the tiles overlap, in parallel workers. Markers found in several tiles are de-duplicated. Params:
+            * image: Input image
+            * dictionaries: Arcuo dictionaries to detect
+            * aruco_params: Aruco detector parameters
+
+            Returns a list of (dictionary, corners, id) of the markers found.
+        """
+        global _tile_pool
+        if _tile_pool is None:
+            _tile_pool = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="aruco-tile")
+        # Single gray conversion for all the tiles
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        height, width = gray.shape
+        # Tiles as views of the gray image: (x offset, y offset, tile, scale)
+        tiles = []
+        rows, cols = TILE_GRID
+        tile_height, tile_width = -(-height//rows), -(-width//cols)
+        for row in range(rows):
+            for col in range(cols):
+                x0, y0 = max(col*tile_width - TILE_OVERLAP, 0), max(row*tile_height - TILE_OVERLAP, 0)
+                x1, y1 = min((col+1)*tile_width + TILE_OVERLAP, width), min((row+1)*tile_height + TILE_OVERLAP, height)
+                tiles.append((x0, y0, gray[y0:y1, x0:x1], 1.0))
+        # Reduced full image (markers that do not fit in the overlap)
+        resize_factor = min(OPT_IMAGE_HEIGHT/height, OPT_IMAGE_WIDTH/width, 1.0)
+        tiles.append((0, 0, cv2.resize(gray, (0, 0), fx=resize_factor, fy=resize_factor), resize_factor))
+        # One job per tile and dictionary
+        jobs = [(dictionary, tile, _tile_pool.submit(cv2.aruco.detectMarkers, tile[2], cv2.aruco.Dictionary_get(dictionary), parameters=aruco_params)) for tile in tiles for dictionary in dictionaries]
+        markers = []
+        for dictionary, (x0, y0, _, scale), job in jobs:
+            aruco_corners, aruco_ids, rejected = job.result()
+            for i in range(0,len(aruco_corners)):
+                # Corners in full image coordinates
+                corners = aruco_corners[i]/scale + np.float32([x0, y0])
+                # Full resolution detections go first, so they are kept over the reduced image ones
+                if not any(dictionary == marker[0] and aruco_ids[i][0] == marker[2] and ArucoDetection._same_marker(corners, marker[1]) for marker in markers):
+                    markers.append((dictionary, corners, aruco_ids[i][0]))
+        return markers
+
+    @staticmethod
+    def _detect_regions(image: np.ndarray, dictionaries: List[cv2.aruco_Dictionary], aruco_params: cv2.aruco_DetectorParameters, rois: List[Tuple[int, int, int, int]]) -> List[Tuple[cv2.aruco_Dictionary, np.ndarray, int]]:
+        """ 
+            Detects the markers of each dictionary inside the regions of interest of the image. Markers found in several regions are de-duplicated. Params:
+            * image: Input image
+            * dictionaries: Arcuo dictionaries to detect
+            * aruco_params: Aruco detector parameters
+            * rois: Regions of interest (x0, y0, x1, y1)
+
+            Returns a list of (dictionary, corners, id) of the markers found.
+        """
+        height, width = image.shape[:2]
+        markers = []
+        for x0, y0, x1, y1 in rois:
+            # Region limited to image bounds
+            x0, y0, x1, y1 = max(int(x0), 0), max(int(y0), 0), min(int(x1), width), min(int(y1), height)
+            if x1 <= x0 or y1 <= y0:
+                continue
+            for dictionary in dictionaries:
+                aruco_corners, aruco_ids, rejected = cv2.aruco.detectMarkers(image[y0:y1, x0:x1], cv2.aruco.Dictionary_get(dictionary), parameters=aruco_params)
+                for i in range(0,len(aruco_corners)):
+                    # Corners in full image coordinates
+                    corners = aruco_corners[i] + np.float32([x0, y0])
+                    if not any(dictionary == marker[0] and aruco_ids[i][0] == marker[2] and ArucoDetection._same_marker(corners, marker[1]) for marker in markers):
+                        markers.append((dictionary, corners, aruco_ids[i][0]))
+        return markers
+
+    @staticmethod
+    def _same_marker(corners: np.ndarray, other_corners: np.ndarray) -> bool:
+        """ Returns `True` if both corners arrays (1x4x2) belong to the same marker (centers closer than `TILE_DUPLICATE_DISTANCE` times the marker size). """
+        size = np.linalg.norm(corners[0][0] - corners[0][2])
+        return np.linalg.norm(corners[0].mean(axis=0) - other_corners[0].mean(axis=0)) <= TILE_DUPLICATE_DISTANCE*size
+
+    @staticmethod
+    def draw_detected_markers(image: np.ndarray, arucos: List[Aruco], marker_length: float = 0.02, matrix_coefficients: List[Tuple[float, float, float]] = MATRIX_COEFFICIENTS, distortion_coefficients: Tuple[float, float, float, float, float] = np.zeros((1, 5)), draw_bounds: bool = True, draw_axis: bool = True, draw_ids: bool = True, in_place: bool = False) -> np.ndarray:
         """ Draws a representation of the detected information of the edges and axes of each ArUco marker.
             * Draws an enclosing rectangle fitted to the boundaries of each marker. (`draw_bounds` must be `True`)
             * Draws the x,y,z set of vectors is drawn on each markers's surfaces. (`draw_axis` must be `True`)
+            * Draws on the input image instead of a copy (`in_place` must be `True`)
+
+            The outlines of all the markers are drawn in a single call, and the axes in a single projection and one call per axis.
         """
-        # Copies the image
-        output_image = image.copy()
-        for aruco in arucos:
-            if draw_bounds:
-                # Draws an enclosing rectangle fitted to the markers boundaries
-                output_image = cv2.aruco.drawDetectedMarkers(output_image, [np.array([aruco.corners])], np.array([aruco.id])) if draw_ids else cv2.aruco.drawDetectedMarkers(output_image, [np.array([aruco.corners])])
-            if draw_axis:
-                # Draws the axis of the x,y,z set vectors on markers's surfaces
-                output_image = cv2.aruco.drawAxis(output_image, matrix_coefficients, distortion_coefficients, aruco.rotation, aruco.translation, marker_length/2)
+        output_image = image if in_place else image.copy()
+        if draw_bounds and arucos:
+            # Draws an enclosing rectangle fitted to the markers boundaries
+            corners = [np.float32(aruco.corners).reshape(1, 4, 2) for aruco in arucos]
+            ids = np.array([[aruco.id] for aruco in arucos], dtype=np.int32) if draw_ids else None
+            cv2.aruco.drawDetectedMarkers(output_image, corners, ids)
+        if draw_axis:
+            # Draws the axis of the x,y,z set vectors on markers's surfaces
+            ArucoDetection._draw_axes(output_image, [aruco for aruco in arucos if aruco.rotation is not None], marker_length/2, matrix_coefficients, distortion_coefficients)
         return output_image
 
+    @staticmethod
+    def _draw_axes(image: np.ndarray, arucos: List[Aruco], axis_length: float, matrix_coefficients: np.ndarray, distortion_coefficients: np.ndarray) -> None:
+        """ Draws the x,y,z axes of the posed Arucos on the image: the axes of all the markers are moved to the camera frame and
+        projected together, and the axes of each color are drawn with a single `cv2.polylines` call. """
+        if not arucos:
+            return
+        axis_points = np.float64([[0, 0, 0], [axis_length, 0, 0], [0, axis_length, 0], [0, 0, axis_length]])
+        camera_points = np.concatenate([axis_points @ cv2.Rodrigues(np.float64(aruco.rotation))[0].T + np.reshape(aruco.translation, (1, 3)) for aruco in arucos])
+        image_points = cv2.projectPoints(camera_points, np.zeros(3), np.zeros(3), np.float64(matrix_coefficients), np.float64(distortion_coefficients))[0]
+        image_points = np.int32(np.round(image_points.reshape(-1, 4, 2)))
+        for axis, color in enumerate(AXIS_COLORS):
+            cv2.polylines(image, np.ascontiguousarray(image_points[:, [0, axis + 1]]), False, color, AXIS_THICKNESS)
+
     @staticmethod
     def generate_markers(num_markers, markers_name):
         '''
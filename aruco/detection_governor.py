@@ -0,0 +1,138 @@
+from math import dist
+from typing import Dict, List, Tuple, Any
+
+from aruco.aruco import Aruco
+from augmentation.aruco_tracker import ArucoTracker
+
+# Detection decisions
+FULL = "full"
+ROI = "roi"
+NONE = "none"
+
+# Pipeline stages with measured latency
+CAPTURE = "capture"
+DETECT_FULL = "detect_full"
+DETECT_ROI = "detect_roi"
+RENDER = "render"
+DISPLAY = "display"
+STAGES = (CAPTURE, DETECT_FULL, DETECT_ROI, RENDER, DISPLAY)
+
+# Weight of the last measurement in the latency moving averages
+LATENCY_SMOOTHING = 0.2
+# Max frames between two full detections (new markers discovery)
+FULL_INTERVAL = 10
+# Max frames reusing tracker poses without any detection
+MAX_SKIPPED_FRAMES = 3
+# Max marker speed (pixels/frame) to reuse tracker poses without detection
+STILL_SPEED = 2.0
+# Margin around each tracked marker of its region of interest, relative to marker size
+ROI_MARGIN = 0.5
+
+class DetectionGovernor():
+    """ Adaptive detection frame-skipping governor. Targets an output frame rate and decides for each frame whether to run a full
+    detection, a detection limited to regions of interest around tracked markers (ROI), or no detection at all (reusing tracker poses),
+    from the measured stage latencies and the markers speed. Constructor params:
+        * target_fps: Target output frames per second
+        * full_interval: Max frames between full detections
+        * max_skipped_frames: Max consecutive frames without detection
+        * still_speed: Max marker speed (pixels/frame) to skip detection
+
+    Each decision is reported with its reason in `decision`, and totals in `report()`.
+    """
+
+    def __init__(self, target_fps: float, full_interval: int = FULL_INTERVAL, max_skipped_frames: int = MAX_SKIPPED_FRAMES, still_speed: float = STILL_SPEED) -> None:
+        # Frame time budget (seconds)
+        self.frame_budget = 1/target_fps
+        # Decision limits
+        self.full_interval = full_interval
+        self.max_skipped_frames = max_skipped_frames
+        self.still_speed = still_speed
+        # Stage latencies moving averages (seconds)
+        self.latencies = {stage: None for stage in STAGES}
+        # Markers speed (uid -> (center, pixels/frame)) and frames since last motion update
+        self._motion = {}
+        self._motion_frames = 0
+        # Frames since last full detection and since last detection
+        self._since_full = 0
+        self._since_detection = 0
+        # Last decision (mode, regions of interest, reason) and decisions count
+        self.decision = (FULL, [], "")
+        self.decisions = {FULL: 0, ROI: 0, NONE: 0}
+        self.frames = 0
+
+    def record(self, stage: str, latency: float) -> None:
+        """ Records the latency of a pipeline stage. Params:
+            * stage: Stage name (`STAGES`)
+            * latency: Latency in seconds
+        """
+        previous = self.latencies[stage]
+        self.latencies[stage] = latency if previous is None else previous + LATENCY_SMOOTHING*(latency - previous)
+
+    def decide(self, tracker: ArucoTracker, image_shape: Tuple[int, ...]) -> Tuple[str, List[Tuple[int, int, int, int]]]:
+        """ Decides the detection of the next frame. Params:
+            * tracker: Aruco tracker with the tracked markers
+            * image_shape: Shape of the next frame
+
+            Returns the decision (`FULL`, `ROI` or `NONE`) and the regions of interest (x0, y0, x1, y1) of ROI detections.
+        """
+        self.frames += 1
+        self._motion_frames += 1
+        tracks = [entry["aruco"] for entry in tracker.register().values()] if tracker else []
+        # Time left for detection in the frame budget
+        others = sum(self.latencies[stage] or 0 for stage in (CAPTURE, RENDER, DISPLAY))
+        available = self.frame_budget - others
+        full_latency = self.latencies[DETECT_FULL]
+        speed = max((motion[1] for motion in self._motion.values()), default=0)
+        if not tracks or full_latency is None:
+            decision = (FULL, [], "no tracked markers")
+        elif self._since_full >= self.full_interval:
+            decision = (FULL, [], f"{self._since_full} frames since last full detection")
+        elif full_latency <= available:
+            decision = (FULL, [], f"full detection fits ({full_latency*1000:.1f} ms of {available*1000:.1f} ms)")
+        elif speed <= self.still_speed and self._since_detection < self.max_skipped_frames:
+            decision = (NONE, [], f"markers still ({speed:.1f} px/frame)")
+        else:
+            rois = self._regions_of_interest(tracks, image_shape)
+            decision = (ROI, rois, f"full detection over budget ({full_latency*1000:.1f} ms of {available*1000:.1f} ms), markers at {speed:.1f} px/frame")
+        self.decision = decision
+        self.decisions[decision[0]] += 1
+        self._since_full = 0 if decision[0] == FULL else self._since_full + 1
+        self._since_detection = 0 if decision[0] != NONE else self._since_detection + 1
+        return decision[0], decision[1]
+
+    def _regions_of_interest(self, tracks: List[Aruco], image_shape: Tuple[int, ...]) -> List[Tuple[int, int, int, int]]:
+        """ Returns the regions of interest around the tracked markers, expanded by the marker size margin and the frames since last detection at max speed. """
+        height, width = image_shape[:2]
+        speed = max((motion[1] for motion in self._motion.values()), default=0)
+        rois = []
+        for aruco in tracks:
+            x_coords = [corner[0] for corner in aruco.corners]
+            y_coords = [corner[1] for corner in aruco.corners]
+            size = max(max(x_coords)-min(x_coords), max(y_coords)-min(y_coords))
+            margin = size*ROI_MARGIN + speed*(self._since_detection+1)
+            rois.append((max(int(min(x_coords)-margin), 0), max(int(min(y_coords)-margin), 0), min(int(max(x_coords)+margin), width), min(int(max(y_coords)+margin), height)))
+        return rois
+
+    def update_motion(self, updates: List[Tuple[str, Aruco]]) -> None:
+        """ Updates the markers speed with the tracker updates of a detection frame. Params:
+            * updates: List of (uid, aruco) updated by the tracker
+        """
+        frames = max(self._motion_frames, 1)
+        self._motion_frames = 0
+        motion = {}
+        for uid, aruco in updates:
+            center = aruco.center()
+            if uid in self._motion:
+                motion[uid] = (center, dist(center, self._motion[uid][0])/frames)
+            else:
+                motion[uid] = (center, 0.0)
+        self._motion = motion
+
+    @staticmethod
+    def tracked_arucos(tracker: ArucoTracker) -> List[Aruco]:
+        """ Returns the last Aruco of each track, to reuse tracker poses in frames without detection. """
+        return [entry["aruco"] for entry in tracker.register().values() if entry["missing_frames"] == 0] if tracker else []
+
+    def report(self) -> Dict[str, Any]:
+        """ Returns the decisions count, the last decision and the stage latencies (ms). """
+        return {"frames": self.frames, "decisions": dict(self.decisions), "last_decision": self.decision[0], "reason": self.decision[2], "latency_ms": {stage: round(latency*1000, 2) for stage, latency in self.latencies.items() if latency is not None}}
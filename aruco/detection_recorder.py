@@ -0,0 +1,102 @@
+import struct
+import cv2
+import numpy as np
+from time import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+from aruco.aruco import Aruco
+
+# File header: magic, version, original frame width and height
+MAGIC = b"ARDL"
+VERSION = 2
+_HEADER = struct.Struct("<4sHII")
+# Frame record header: timestamp (s), frame number, number of markers, encoded frame size (bytes, 0 -> no frame) and, since version 2,
+# skipped flag (detection did not run on the frame)
+_FRAME = struct.Struct("<dIHIB")
+_FRAME_V1 = struct.Struct("<dIHI")
+# Marker record: dictionary, id, corners (x, y) * 4, rotation and translation vectors (NaN if the pose was not estimated)
+MARKER_DTYPE = np.dtype([("dictionary", "<i4"), ("id", "<i4"), ("corners", "<f4", (4, 2)), ("rotation", "<f4", 3), ("translation", "<f4", 3)])
+
+class DetectionRecorder():
+    """ Compact binary recorder of the detections of each frame (`ArucoDetection.detect` output), optionally with downsampled
+    JPEG frames. Markers are stored as fixed-size records of 64 bytes. Every frame is recorded, frames where detection was skipped
+    (tracker poses reused) with their flag, so a replay follows the live run. Constructor params:
+        * path: Output file path
+        * frame_size: Original frame size (width, height)
+        * frame_scale: Scale of the recorded frames (`None` -> frames are not recorded)
+        * jpeg_quality: JPEG quality of the recorded frames
+
+    Usable as a context manager. Recordings are read by `read_detections`.
+    """
+
+    def __init__(self, path: str, frame_size: Tuple[int, int], frame_scale: float = None, jpeg_quality: int = 80) -> None:
+        self.frame_scale = frame_scale
+        self.jpeg_quality = jpeg_quality
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, frame_size[0], frame_size[1]))
+
+    def __enter__(self) -> "DetectionRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def record(self, arucos: List[Aruco], timestamp: float = None, frame: np.ndarray = None, skipped: bool = False) -> None:
+        """ Records the detections of a frame. Params:
+            * arucos: Detected Arucos (of the detected regions only in region of interest detections)
+            * timestamp: Frame timestamp in seconds (actual time if not set)
+            * frame: Frame image, recorded downsampled if `frame_scale` is set
+            * skipped: Detection did not run on the frame (no Arucos are recorded)
+        """
+        if skipped:
+            arucos = []
+        markers = np.zeros(len(arucos), dtype=MARKER_DTYPE)
+        for i, aruco in enumerate(arucos):
+            markers[i] = (aruco.dictionary, aruco.id, np.reshape(aruco.corners, (4, 2)),
+                          aruco.rotation if aruco.rotation is not None else np.nan, aruco.translation if aruco.translation is not None else np.nan)
+        encoded = b""
+        if frame is not None and self.frame_scale:
+            small = cv2.resize(frame, (0, 0), fx=self.frame_scale, fy=self.frame_scale, interpolation=cv2.INTER_AREA)
+            encoded = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])[1].tobytes()
+        self._file.write(_FRAME.pack(time() if timestamp is None else timestamp, self.frames, len(markers), len(encoded), skipped))
+        self._file.write(markers.tobytes())
+        self._file.write(encoded)
+        self.frames += 1
+
+    def close(self) -> None:
+        """ Closes the recording file. """
+        if not self._file.closed:
+            self._file.close()
+
+def read_header(path: str) -> Dict[str, Any]:
+    """ Returns the header (version and original frame size) of a recording. """
+    with open(path, "rb") as recording:
+        magic, version, width, height = _HEADER.unpack(recording.read(_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a detection recording")
+    return {"version": version, "frame_size": (width, height)}
+
+def read_detections(path: str) -> Iterator[Dict[str, Any]]:
+    """ Reads a recording and yields each frame as a dict: timestamp, frame number, Arucos (`None` pose if it was not estimated),
+    skipped detection flag and frame image (upscaled to the original size, or `None` if frames were not recorded). """
+    header = read_header(path)
+    frame_size = header["frame_size"]
+    frame_struct = _FRAME if header["version"] >= 2 else _FRAME_V1
+    with open(path, "rb") as recording:
+        recording.seek(_HEADER.size)
+        while True:
+            record_header = recording.read(frame_struct.size)
+            if len(record_header) < frame_struct.size:
+                return
+            timestamp, frame_number, n_markers, frame_bytes, *skipped = frame_struct.unpack(record_header)
+            markers = np.frombuffer(recording.read(n_markers*MARKER_DTYPE.itemsize), dtype=MARKER_DTYPE)
+            arucos = []
+            for marker in markers:
+                posed = not np.isnan(marker["rotation"][0])
+                arucos.append(Aruco(np.float32(marker["corners"]), np.float64(marker["rotation"]) if posed else None, np.float64(marker["translation"]) if posed else None, int(marker["dictionary"]), int(marker["id"])))
+            frame = None
+            if frame_bytes:
+                frame = cv2.imdecode(np.frombuffer(recording.read(frame_bytes), dtype=np.uint8), cv2.IMREAD_COLOR)
+                frame = cv2.resize(frame, frame_size, interpolation=cv2.INTER_LINEAR)
+            yield {"timestamp": timestamp, "frame_number": frame_number, "arucos": arucos, "skipped": bool(skipped and skipped[0]), "frame": frame}
@@ -0,0 +1,96 @@
+import json
+import numpy as np
+from typing import Dict, List, Set
+
+from aruco.aruco import Aruco
+from aruco.aruco_detector import ArucoDetection, DICTIONARIES
+
+# Number of markers of each variant of the predefined dictionary families (4x4, 5x5, 6x6 and 7x7): _50, _100, _250 and _1000
+FAMILY_SIZES = (50, 100, 250, 1000)
+# Predefined dictionaries grouped in families (cv2.aruco.DICT_4X4_50 ... cv2.aruco.DICT_7X7_1000)
+FAMILY_DICTIONARIES = 16
+
+DEFAULT_SWEEP_INTERVAL = 30
+
+class DictionaryScheduler():
+    """ Aruco dictionaries scheduler driven by the OBJ map catalog. Only the dictionaries with markers in the catalog are detected,
+    using the smallest variant (`_50`, `_100`, `_250`) of their family that covers the used ids, and a full sweep of all the
+    `DICTIONARIES` looks for unknown markers every `sweep_interval` frames. Constructor params:
+        * obj_map_path: Path to the JSON OBJ map (dictionary -> id -> OBJ)
+        * sweep_interval: Frames between full sweeps (0 -> no sweeps)
+    """
+
+    def __init__(self, obj_map_path: str, sweep_interval: int = DEFAULT_SWEEP_INTERVAL) -> None:
+        # Catalog of used markers (dictionary -> ids)
+        self.catalog = self._read_catalog(obj_map_path)
+        # Active dictionaries (detection dictionary -> catalog dictionary)
+        self.active = {self._smallest_variant(dictionary, ids): dictionary for dictionary, ids in self.catalog.items()}
+        # Full sweep dictionaries: all predefined families plus active dictionaries outside them
+        self.sweep = set(DICTIONARIES) | set(dictionary for dictionary in self.active if self._family(dictionary) not in [self._family(d) for d in DICTIONARIES])
+        # Frames between full sweeps
+        self.sweep_interval = sweep_interval
+        # Unknown markers found by sweeps ((dictionary, id) -> frame)
+        self.unknown = {}
+        # Frame count
+        self._frame = 0
+
+    @staticmethod
+    def _read_catalog(obj_map_path: str) -> Dict[int, Set[int]]:
+        """ Returns the dictionaries and ids with an entry in the JSON OBJ map at indicated path. """
+        with open(obj_map_path) as obj_map_file:
+            obj_map = json.load(obj_map_file)
+        return {int(dictionary): set(int(id) for id in ids) for dictionary, ids in obj_map.items()}
+
+    @staticmethod
+    def _family(dictionary: int) -> int:
+        """ Returns the family of a predefined dictionary (marker bits). Dictionaries outside the families are their own family. """
+        return dictionary//len(FAMILY_SIZES) if dictionary < FAMILY_DICTIONARIES else dictionary
+
+    @staticmethod
+    def _smallest_variant(dictionary: int, ids: Set[int]) -> int:
+        """ Returns the smallest variant of the dictionary family that covers the ids (the markers of a variant are the first ones of the bigger variants). """
+        if dictionary >= FAMILY_DICTIONARIES or not ids:
+            return dictionary
+        family_start = dictionary - dictionary%len(FAMILY_SIZES)
+        for variant, size in enumerate(FAMILY_SIZES):
+            if max(ids) < size or family_start + variant == dictionary:
+                return family_start + variant
+        return dictionary
+
+    def _label(self, dictionary: int, id: int) -> int:
+        """ Returns the catalog dictionary of a marker detected with the given dictionary, or `None` if the marker is not in the catalog. """
+        for catalog_dictionary, ids in self.catalog.items():
+            if id in ids and self._family(catalog_dictionary) == self._family(dictionary):
+                return catalog_dictionary
+        return None
+
+    def dictionaries(self) -> List[int]:
+        """ Returns the dictionaries to detect in the next frame. """
+        return list(self.sweep) if self._is_sweep() else list(self.active)
+
+    def _is_sweep(self) -> bool:
+        """ Returns `True` if the next frame is a full sweep. """
+        return bool(self.sweep_interval) and self._frame % self.sweep_interval == 0
+
+    def detect(self, image: np.ndarray, **kwargs) -> List[Aruco]:
+        """ Performs an Aruco detection (`ArucoDetection.detect`) with the scheduled dictionaries. Params:
+            * image: Input image
+            * kwargs: `ArucoDetection.detect` params (ex. `marker_length`, `optimized`)
+
+            Returns the catalog markers found, labeled with their catalog dictionary.
+        """
+        dictionaries = self.dictionaries()
+        sweep = self._is_sweep()
+        self._frame += 1
+        arucos = []
+        for aruco in ArucoDetection.detect(image, dictionaries=dictionaries, **kwargs):
+            dictionary = self._label(aruco.dictionary, aruco.id)
+            if dictionary is not None:
+                aruco.dictionary = dictionary
+                arucos.append(aruco)
+            elif sweep:
+                # Marker not in catalog found by a full sweep
+                if (aruco.dictionary, aruco.id) not in self.unknown:
+                    print(f"[Dictionary Scheduler]: Unknown marker found (dictionary {aruco.dictionary}, id {aruco.id})")
+                self.unknown[(aruco.dictionary, aruco.id)] = self._frame
+        return arucos
@@ -0,0 +1,82 @@
+import numpy as np
+from collections import deque
+from typing import List
+
+from aruco.aruco import Aruco
+from augmentation.aruco_tracker import ArucoTracker
+
+# Minimum marker side (pixels at detection scale) for a reliable detection
+MIN_MARKER_PX = 24
+# Detection scale limits
+MIN_SCALE = 0.2
+MAX_SCALE = 1.0
+# Number of recent frames whose marker sizes are taken into account
+SIZE_HISTORY = 10
+# Frames between full resolution probes looking for new small markers (0 -> no probes)
+PROBE_INTERVAL = 15
+# Weight of the last measurement in the latency moving average
+LATENCY_SMOOTHING = 0.3
+
+class ResolutionController():
+    """ Adaptive detection resolution controller. Chooses the detection scale of each frame from the recent markers pixel sizes
+    (shrinks while the smallest marker is still detectable) and from the measured detection latency (the scale that holds the target
+    latency, assuming latency grows with the number of pixels). Goes back to full resolution when tracks are lost. Constructor params:
+        * target_latency_ms: Target detection latency in milliseconds
+        * min_marker_px: Minimum marker side in pixels, at detection scale, for a reliable detection
+        * min_scale: Minimum detection scale
+        * probe_interval: Frames between full resolution probes (0 -> no probes)
+    """
+
+    def __init__(self, target_latency_ms: float, min_marker_px: float = MIN_MARKER_PX, min_scale: float = MIN_SCALE, probe_interval: int = PROBE_INTERVAL) -> None:
+        # Target latency (seconds)
+        self.target_latency = target_latency_ms/1000
+        # Scale limits
+        self.min_marker_px = min_marker_px
+        self.min_scale = min_scale
+        # Full resolution probes
+        self.probe_interval = probe_interval
+        # Smallest marker size (full resolution pixels) of recent frames
+        self._sizes = deque(maxlen=SIZE_HISTORY)
+        # Detection latency per full frame pixel fraction (seconds at scale 1)
+        self._full_latency = None
+        # Tracks lost in last frame
+        self._lost = True
+        # Actual scale and frame count
+        self._scale = MAX_SCALE
+        self._frame = 0
+
+    def scale(self) -> float:
+        """ Returns the detection scale for the next frame. """
+        self._frame += 1
+        if self._lost or not self._sizes or (self.probe_interval and self._frame % self.probe_interval == 0):
+            # Full resolution (tracks lost, no markers or probe frame)
+            scale = MAX_SCALE
+        else:
+            # Smallest recent marker still detectable
+            scale = self.min_marker_px/min(self._sizes)
+        if self._full_latency:
+            # Scale that holds the target latency (latency ~ scale^2)
+            scale = min(scale, (self.target_latency/self._full_latency)**0.5)
+        self._scale = min(max(scale, self.min_scale), MAX_SCALE)
+        return self._scale
+
+    @staticmethod
+    def marker_size(aruco: Aruco) -> float:
+        """ Returns the side of the Aruco in pixels (largest x or y extent between consecutive corners). """
+        corners = np.asarray(aruco.corners)
+        return float(np.abs(corners - np.roll(corners, 1, axis=0)).max())
+
+    def update(self, latency: float, arucos: List[Aruco], tracker: ArucoTracker = None) -> None:
+        """ Updates the controller with the last detection. Params:
+            * latency: Detection latency in seconds
+            * arucos: Detected Arucos
+            * tracker: Aruco tracker. Tracks lost when fewer markers than registered tracks were detected
+        """
+        # Latency at full resolution
+        full_latency = latency/self._scale**2
+        self._full_latency = full_latency if self._full_latency is None else self._full_latency + LATENCY_SMOOTHING*(full_latency - self._full_latency)
+        # Smallest marker size
+        if arucos:
+            self._sizes.append(min(self.marker_size(aruco) for aruco in arucos))
+        # Lost tracks
+        self._lost = not arucos or (tracker is not None and len(arucos) < len(tracker.register()))
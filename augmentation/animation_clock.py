@@ -0,0 +1,78 @@
+from time import monotonic
+from typing import Callable
+
+# Animation playback modes
+LOOP = "loop"
+ONCE = "once"
+PING_PONG = "pingpong"
+MODES = (LOOP, ONCE, PING_PONG)
+
+DEFAULT_FPS = 30
+
+class AnimationClock():
+    """ Wall-clock animation scheduler. The OBJ frame index is derived from the elapsed time, so the animation speed does not
+    depend on the render frame rate. Constructor params:
+        * fps: Animation frames per second
+        * mode: Playback mode, `loop` (restarts at the end), `once` (stops at the last frame) or `pingpong` (plays forwards and backwards)
+        * paused: Creates the clock paused (ex. when animations are frozen)
+        * time_source: Function returning the current time in seconds (`time.monotonic` by default)
+    """
+
+    def __init__(self, fps: float = DEFAULT_FPS, mode: str = LOOP, paused: bool = False, time_source: Callable[[], float] = monotonic) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Animation mode must be one of {MODES}")
+        # Animation frames per second
+        self.fps = fps
+        # Playback mode
+        self.mode = mode
+        # Time function
+        self._time_source = time_source
+        # Time when the clock was (re)started
+        self._start = self._time_source()
+        # Time when the clock was paused (None if running)
+        self._paused_at = self._start if paused else None
+
+    @property
+    def paused(self) -> bool:
+        """ True if the clock is paused. """
+        return self._paused_at is not None
+
+    def elapsed(self) -> float:
+        """ Returns the animation time in seconds (paused intervals excluded). """
+        now = self._paused_at if self._paused_at is not None else self._time_source()
+        return now - self._start
+
+    def restart(self) -> None:
+        """ Restarts the animation from the first frame, keeping the paused state. """
+        self._start = self._time_source()
+        if self._paused_at is not None:
+            self._paused_at = self._start
+
+    def pause(self) -> None:
+        """ Stops the animation time. """
+        if self._paused_at is None:
+            self._paused_at = self._time_source()
+
+    def resume(self) -> None:
+        """ Resumes the animation time from where it was paused. """
+        if self._paused_at is not None:
+            # Paused interval is not counted
+            self._start += self._time_source() - self._paused_at
+            self._paused_at = None
+
+    def frame(self, n_frames: int) -> int:
+        """ Returns the frame index of an animation with `n_frames` frames at the current time. """
+        if n_frames <= 1:
+            return 0
+        # Frames played since the start
+        played = int(self.elapsed()*self.fps)
+        if self.mode == ONCE:
+            # Stops at last frame
+            return min(played, n_frames-1)
+        elif self.mode == PING_PONG:
+            # Forward and backwards: 0, 1, ..., n-1, n-2, ..., 1
+            period = 2*(n_frames-1)
+            step = played % period
+            return step if step < n_frames else period - step
+        # Loop
+        return played % n_frames
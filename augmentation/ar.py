@@ -1,14 +1,16 @@
-# v0 - calculates the homography from scratch at each step
+# v1 - marker poses are refined by the ArucoTracker from the previous extrinsics of each track
 import cv2
 import numpy as np
 import augmentation.aruco_module as aruco
 from augmentation.obj import OBJ 
 from aruco.aruco import Aruco
+from aruco.aruco_detector import MATRIX_COEFFICIENTS
 from math import dist, sqrt
 
 from typing import Tuple, List
 
 DEFAULT_COLOR = (158, 5, 81)
+FOCAL_LENGTH = MATRIX_COEFFICIENTS[0][0]
 
 def augment_aruco(image: np.array, aruco: Aruco, obj: OBJ, scale: int = 1) -> np.array:
 	""" Projects an Augmented Reality OBJ on the Aruco surface in the image. Args:
@@ -19,6 +21,26 @@ def augment_aruco(image: np.array, aruco: Aruco, obj: OBJ, scale: int = 1) -> np
 
 		Returns the image with augmented 3D model.
 	"""
+	# Projects all the obj faces
+	faces_points, faces_offsets, faces_depths, faces_colors = project_faces(aruco, obj, scale)
+	# Draws obj faces from furthest to nearest
+	return draw_faces(image, faces_points, faces_offsets, faces_depths, faces_colors)
+
+def project_faces(aruco: Aruco, obj: OBJ, scale: int = 1, focal_length: float = FOCAL_LENGTH, camera_matrix: np.ndarray = None, distortion_coefficients: np.ndarray = None, marker_length: float = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+	""" Projects all the faces of an OBJ on the Aruco surface at once. Args:
+		* `aruco`: Intance of detected ArUco (Aruco Class)
+		* `obj`: Intance of 3D OBJ model to augment.
+		* `scale`: Resize factor (1 by default to adjust aruco bounds)
+		* `focal_length`: Camera focal length in pixels, used to convert model depths into camera depths
+		* `camera_matrix`: Camera matrix. If set with `marker_length`, the model is projected in perspective with the real camera intrinsics
+		* `distortion_coefficients`: Distortion coefficients of the perspective projection
+		* `marker_length`: Length of physical Aruco marker in meters (one model unit)
+
+		Returns the projected (x,y) pixel points of all faces corners as a (corners, 2) int32 array, the faces offsets
+		(corners of face i are `points[offsets[i]:offsets[i+1]]`), the camera depth of each face and the color of each face.
+	"""
+	if camera_matrix is not None and marker_length is not None:
+		return _project_faces_perspective(aruco, obj, scale, camera_matrix, distortion_coefficients, marker_length)
 	aruco_center = aruco.center()
 	aruco_center.append(0) # Adds z
 	extrinsic_matrix = np.identity(3) # Camera effects already taken into account in aruco rotation estimation
@@ -26,46 +48,53 @@ def augment_aruco(image: np.array, aruco: Aruco, obj: OBJ, scale: int = 1) -> np
 	intrinsic_matrix = compose_intrisic_matrix(aruco.rotation,aruco_center)
 	# Calculates the projection matrix
 	projection_matrix = compose_projection_matrix(extrinsic_matrix,intrinsic_matrix)
-	faces_points = []
-	faces_colors = []
-	autoscale_factor = calculate_autoscale_factor(aruco.corners)
-	# Checks if obj has image or mtl texture
-	mtl = hasattr(obj,'materials')
-	for face in obj.faces:
-		points = np.array(face['points'], dtype=float)
-		# Resizing
-		points = resize_object(points,scale*autoscale_factor)
-		# Projection
-		points = np.array([project_3d_point(point,projection_matrix) for point in points])
-		# Appends projected face points
-		faces_points.append(points)
-		try:
-			if mtl:
-				# Gets the material color (diffuse color) #TODO: Explore new ways to get a more aprox color
-				color = obj.materials[face['material']]['diffuse_color']
-			else:
-				vertices_colors = face['colors']
-				# Gets the average value of each BRG
-				average_blue = sum([vertices_colors[i][0] for i in range(0,len(face["colors"]))])/len(face["colors"])
-				average_green = sum([vertices_colors[i][1] for i in range(0,len(face["colors"]))])/len(face["colors"])
-				average_red = sum([vertices_colors[i][2] for i in range(0,len(face["colors"]))])/len(face["colors"])
-				# Face color as the sum of each average BRG coord
-				color = [int(average_blue), int(average_green), int(average_red)]
-		except KeyError:
-			color = DEFAULT_COLOR # Face color not defined
-		faces_colors.append(color)
-	# Orders obj faces from nearest to furthest
-	reference_point = project_3d_point([0,0,0],projection_matrix)[0]
-	reference_point = [0,0,0]
-	# reference_point = [aruco_center[0],aruco_center[1],1000]
-	faces_points, faces_colors = order_faces(reference_point,faces_points,faces_colors)
-	faces_points = _remove_z_coords(faces_points)
-	# Draws obj faces
-	[cv2.fillConvexPoly(image, np.int32(face_points), faces_colors[i]) for i,face_points in enumerate(faces_points)]
-	# for i,face_points in enumerate(faces_points):
-	# 	cv2.fillConvexPoly(image, np.int32(face_points), faces_colors[i])
-	# 	cv2.imshow("camera",image)
-	# 	cv2.waitKey(1000)
+	# Resizing of all faces points
+	points = resize_object(obj.face_points,scale*calculate_autoscale_factor(aruco.corners))
+	# Projection of all faces points (x,y,z) -> (x,y,z,1)
+	projected_points = np.dot(points,projection_matrix[:,0:3].T) + projection_matrix[:,3]
+	offsets = obj.face_offsets
+	if len(offsets) < 2:
+		# OBJ without faces
+		return np.zeros((0,2),dtype=np.int32), offsets, np.zeros(0), np.zeros((0,3),dtype=int)
+	# Face depth as the z coordinate of its centroid (in pixels)
+	depths = np.add.reduceat(projected_points[:,2],offsets[:-1])/np.diff(offsets)
+	# Camera depth: aruco distance plus face depth converted from pixels to distance units at the aruco distance
+	depths = aruco.translation[2]*(1 + depths/focal_length)
+	return np.int32(projected_points[:,0:2]), offsets, depths, obj.face_colors(DEFAULT_COLOR)
+
+def _project_faces_perspective(aruco: Aruco, obj: OBJ, scale: int, camera_matrix: np.ndarray, distortion_coefficients: np.ndarray, marker_length: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+	""" Projects all the faces of an OBJ placed on the Aruco pose with the camera intrinsics (see `project_faces`). Face depths are camera z coordinates. """
+	offsets = obj.face_offsets
+	if len(offsets) < 2:
+		# OBJ without faces
+		return np.zeros((0,2),dtype=np.int32), offsets, np.zeros(0), np.zeros((0,3),dtype=int)
+	rotation = np.float64(aruco.rotation).reshape(3,1)
+	translation = np.float64(aruco.translation).reshape(3,1)
+	# Model points in marker coordinates (one model unit = marker length)
+	points = resize_object(np.float64(obj.face_points),scale*marker_length)
+	projected_points, _ = cv2.projectPoints(points,rotation,translation,camera_matrix,distortion_coefficients if distortion_coefficients is not None else np.zeros((1,5)))
+	# Face depth as the camera z coordinate of its centroid
+	camera_z = np.dot(points,cv2.Rodrigues(rotation)[0][2]) + translation[2]
+	depths = np.add.reduceat(camera_z,offsets[:-1])/np.diff(offsets)
+	return np.int32(projected_points.reshape(-1,2)), offsets, depths, obj.face_colors(DEFAULT_COLOR)
+
+def draw_faces(image: np.array, faces_points: np.ndarray, faces_offsets: np.ndarray, faces_depths: np.ndarray, faces_colors: np.ndarray) -> np.array:
+	""" Draws a list of projected faces on the image from furthest to nearest (painter's algorithm). Args:
+		* `image`: Input image to augment 
+		* `faces_points`: (x,y) pixel points of all faces corners
+		* `faces_offsets`: Corners of face i are `faces_points[faces_offsets[i]:faces_offsets[i+1]]`
+		* `faces_depths`: Camera depth of each face
+		* `faces_colors`: BGR color of each face
+
+		Returns the image with the drawn faces.
+	"""
+	# Single depth sort of the whole draw list (furthest first)
+	order = np.argsort(-np.asarray(faces_depths),kind="stable").tolist()
+	bounds = np.asarray(faces_offsets).tolist()
+	colors = np.asarray(faces_colors).tolist()
+	# Faces are filled one by one: multi-polygon fills (cv2.fillPoly) use even-odd filling, so overlapping faces would leave holes
+	for i in order:
+		cv2.fillConvexPoly(image, faces_points[bounds[i]:bounds[i+1]], colors[i])
 	return image
 
 def project_3d_point(point: List[Tuple[int, int, int]], projection_matrix: List[Tuple[int, int, int]]) -> List[Tuple[int, int]]:
@@ -1,5 +1,10 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
+import cv2
+import numpy as np
 from aruco.aruco import Aruco
+from aruco.aruco_detector import MATRIX_COEFFICIENTS
+from instrumentation import latency
+from time import perf_counter
 
 from math import dist
 
@@ -7,15 +12,30 @@ class ArucoTracker():
     """ ArUco Tracker class. Constructor params:
         * max_frames_missing: Max number of consecutive frames that an Aruco can be missing before being deleted from register. (default: `3`)
         * max_distance: Max aruco distance to be detected as the same, in consecutive frames
+        * marker_length: Length of physical Aruco marker in meters. If set, the tracker estimates the pose of the Arucos (detected with
+        `estimate_pose=False`): iterative PnP refinement from the last pose of the track, full solve for new tracks or large jumps.
+        * matrix_coefficients: Matrix of Camera coefficients
+        * distortion_coefficients: Distorsion coefficients array
+        * max_jump: Max displacement (pixels) of the Aruco center to refine the pose of the track instead of solving it from scratch
     """
 
-    def __init__(self, max_frames_missing: int = 5, max_distance: int = 5000) -> None:
+    def __init__(self, max_frames_missing: int = 5, max_distance: int = 5000, marker_length: float = None, matrix_coefficients: List[Tuple[float, float, float]] = MATRIX_COEFFICIENTS, distortion_coefficients: Tuple[float, float, float, float, float] = np.zeros((1, 5)), max_jump: float = 50) -> None:
         # Aruco register
         self._register = {}
         # Max consecutive frames missing
         self.MAX_FRAMES_MISSING = max_frames_missing
         # Max aruco distance to be detected as the same, in consecutive frames
         self.MAX_DISTANCE = max_distance
+        # Pose estimation (optional)
+        self.marker_length = marker_length
+        self.matrix_coefficients = np.float64(matrix_coefficients)
+        self.distortion_coefficients = np.float64(distortion_coefficients)
+        self.MAX_JUMP = max_jump
+        # Marker corners in marker coordinates (same order as detected corners)
+        if marker_length is not None:
+            self._marker_points = np.float64([[-marker_length/2, marker_length/2, 0], [marker_length/2, marker_length/2, 0], [marker_length/2, -marker_length/2, 0], [-marker_length/2, -marker_length/2, 0]])
+        # Number of refined and fully solved poses
+        self.pose_stats = {"refined": 0, "solved": 0}
 
     def register(self) -> Dict:
         """ Returns the actual Aruco register. """
@@ -53,10 +73,36 @@ class ArucoTracker():
             nonce = 0
         return f"dict{aruco.dictionary}id{aruco.id}#{nonce}" 
 
+    def _estimate_pose(self, aruco: Aruco, previous: Aruco = None) -> None:
+        """ Sets the rotation and translation vectors of the Aruco. Params:
+            * aruco: Aruco to estimate
+            * previous: Last Aruco of the track. Its pose is used as extrinsic guess of an iterative refinement, unless the center jumped more than `max_jump`
+        """
+        if self.marker_length is None:
+            return
+        with latency.span("pose"):
+            self._solve_pose(aruco, previous)
+
+    def _solve_pose(self, aruco: Aruco, previous: Aruco = None) -> None:
+        """ Solves the pose of the Aruco (see `_estimate_pose`). """
+        corners = np.float64(aruco.corners).reshape(4, 1, 2)
+        if previous is not None and previous.rotation is not None and dist(aruco.center(), previous.center()) <= self.MAX_JUMP:
+            # Iterative refinement from the last pose of the track
+            rotation, translation = np.float64(previous.rotation).reshape(3, 1), np.float64(previous.translation).reshape(3, 1)
+            found, rotation, translation = cv2.solvePnP(self._marker_points, corners, self.matrix_coefficients, self.distortion_coefficients, rotation, translation, useExtrinsicGuess=True, flags=cv2.SOLVEPNP_ITERATIVE)
+            self.pose_stats["refined"] += 1
+        else:
+            # Full solve (new track or large jump)
+            found, rotation, translation = cv2.solvePnP(self._marker_points, corners, self.matrix_coefficients, self.distortion_coefficients, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            self.pose_stats["solved"] += 1
+        aruco.rotation = rotation.reshape(3)
+        aruco.translation = translation.reshape(3)
+
     def update(self, arucos: List[Aruco]) -> Dict[str, Any]:
         """ Updates the Tracker register with input list of Arucos. Params:
             * arucos: Array of Arucos. \n
             Returns the updated register entries."""
+        start = perf_counter()
         updates = []
         # CASE A: No Aruco was recieved
         if not len(arucos):
@@ -73,6 +119,8 @@ class ArucoTracker():
             if not len(self._register):
                 # Registra los nuevos objetos detectados en este frame
                 for aruco in arucos:
+                    # Full pose solve
+                    self._estimate_pose(aruco)
                     # Creates a new uid for Aruco
                     uid = self._generate_new_uid(aruco)
                     # Registers the auco
@@ -102,6 +150,8 @@ class ArucoTracker():
                     aruco = arucos[int(distance[1].split("->")[0])] # aruco 
                     uid = distance[1].split("->")[1] # uid of registered aruco
                     if aruco in pending_arucos and uid not in updated_uids and distance[0] <= self.MAX_DISTANCE: 
+                        # Pose refined from the last pose of the track
+                        self._estimate_pose(aruco, self._register[uid]["aruco"])
                         # Updates register
                         self._register[uid]["aruco"] = aruco
                         self._register[uid]["missing_frames"] = 0 # Reset count
@@ -111,6 +161,7 @@ class ArucoTracker():
                         updates.append((uid, aruco))
                 # The arucos that have not been yet updated are registered as new ones
                 for aruco in pending_arucos:
+                    self._estimate_pose(aruco) # Full pose solve
                     uid = self._generate_new_uid(aruco) # Creates a new uid for Aruco
                     # Registers the auco
                     self._register[uid] = {"missing_frames": 0, "aruco": aruco}
@@ -124,4 +175,5 @@ class ArucoTracker():
                         if self._register[uid]["missing_frames"] > self.MAX_FRAMES_MISSING:
                             self.delete(uid)
         # Returns the updated register
+        latency.recorder.record("track", perf_counter() - start)
         return updates
\ No newline at end of file
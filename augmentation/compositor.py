@@ -0,0 +1,73 @@
+import numpy as np
+from typing import List, Tuple
+
+from aruco.aruco import Aruco
+import augmentation.ar as ar
+from augmentation.obj import OBJ
+
+class SceneCompositor():
+    """ Scene-wide draw list. Gathers the projected faces of the OBJs of all visible Arucos into a single array-backed list,
+    sorts it once by camera depth and draws it, so overlapping models of neighbouring markers are drawn in the right order.
+    Constructor params:
+        * focal_length: Camera focal length in pixels, used to compare faces depths between markers
+        * camera_matrix: Camera matrix. If set with `marker_length`, models are projected in perspective with the real camera intrinsics
+        * distortion_coefficients: Distortion coefficients of the perspective projection
+        * marker_length: Length of physical Aruco marker in meters
+    """
+
+    def __init__(self, focal_length: float = ar.FOCAL_LENGTH, camera_matrix: np.ndarray = None, distortion_coefficients: np.ndarray = None, marker_length: float = None) -> None:
+        # Camera focal length (pixels)
+        self.focal_length = focal_length
+        # Camera intrinsics of the perspective projection (optional)
+        self.camera_matrix = camera_matrix
+        self.distortion_coefficients = distortion_coefficients
+        self.marker_length = marker_length
+        # Draw list
+        self.clear()
+
+    def __len__(self) -> int:
+        """ Number of faces in the draw list. """
+        return self._n_faces
+
+    def clear(self) -> None:
+        """ Empties the draw list. """
+        self._points: List[np.ndarray] = []
+        self._offsets: List[np.ndarray] = []
+        self._depths: List[np.ndarray] = []
+        self._colors: List[np.ndarray] = []
+        # Total number of corners and faces in the list
+        self._n_corners = 0
+        self._n_faces = 0
+
+    def project(self, aruco: Aruco, obj: OBJ, scale: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """ Projects an OBJ on the Aruco surface with the compositor camera (see `ar.project_faces`). """
+        return ar.project_faces(aruco, obj, scale, self.focal_length, self.camera_matrix, self.distortion_coefficients, self.marker_length)
+
+    def add(self, aruco: Aruco, obj: OBJ, scale: int = 1) -> None:
+        """ Projects an OBJ on the Aruco surface and adds its faces to the draw list. Args:
+            * `aruco`: Intance of detected ArUco (Aruco Class)
+            * `obj`: Intance of 3D OBJ model to augment.
+            * `scale`: Resize factor (1 by default to adjust aruco bounds)
+        """
+        points, offsets, depths, colors = self.project(aruco, obj, scale)
+        if not len(depths):
+            return
+        self._points.append(points)
+        # Face starts shifted to the position of the model in the list
+        self._offsets.append(offsets[:-1] + self._n_corners)
+        self._depths.append(depths)
+        self._colors.append(colors)
+        self._n_corners += len(points)
+        self._n_faces += len(depths)
+
+    def draw(self, image: np.ndarray) -> np.ndarray:
+        """ Draws all the faces in the list from furthest to nearest and empties the list. Args:
+            * `image`: Input image to augment
+
+            Returns the image with the augmented 3D models.
+        """
+        if self._n_faces:
+            offsets = np.concatenate(self._offsets + [[self._n_corners]])
+            ar.draw_faces(image, np.concatenate(self._points), offsets, np.concatenate(self._depths), np.concatenate(self._colors))
+        self.clear()
+        return image
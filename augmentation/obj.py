@@ -1,221 +1,347 @@
 import cv2
-from typing import Tuple, Dict
-from math import dist, floor
+import copy
+import os
+import re
+import numpy as np
+from typing import Tuple, Dict, List, Any
+from math import floor
 
-class OBJ(): 
+# OBJ records values (the text is prefixed with a new line so every record starts with "\n" + keyword)
+_VERTEX_RECORDS = re.compile(r"\nv[ \t]+([^\n]*)")
+_TEXTURE_RECORDS = re.compile(r"\nvt[ \t]+([^\n]*)")
+_NORMAL_RECORDS = re.compile(r"\nvn[ \t]+([^\n]*)")
+_FACE_RECORDS = re.compile(r"\nf[ \t]+([^\n]*)")
+# Material groups -> re.split returns [faces, name, faces, name, faces...]
+_USEMTL_RECORDS = re.compile(r"\nusemtl[ \t]+(\S*)[^\n]*")
+# Material library statement
+_MTLLIB_RECORD = re.compile(r"\nmtllib[ \t]+([^\n]*?)[ \t]*(?=\n|$)")
+# Record starts, only needed to resolve negative (relative) indices
+_RECORD_STARTS = {"v": re.compile(r"\nv[ \t]"), "vt": re.compile(r"\nvt[ \t]"), "vn": re.compile(r"\nvn[ \t]")}
+_FACE_STARTS = re.compile(r"\nf[ \t]")
+
+class OBJ():
     """ OBJ (.obj) class. Constructor params:
         * obj_path: Absolute path to .obj file
         * texture_path: Path of texture image (ex. mtl, png, jpg)
         * normalise: Obtain normalised OBJ (recommended)
         * normalised_axis: Axis to perform object normalization
+
+        The file is parsed in bulk: each record type (`v`, `vt`, `vn`, `f`) is tokenized as a single block into NumPy arrays.
+        Faces are stored as flat corner index arrays plus offsets (n-gons supported), `faces` is built from them on first access.
     """
-    
+
     def __init__(self, obj_path: str, texture_path: str = None, normalise: bool = True, normalised_axis: str = "XY"):
-        #  Inialization of arrays
-        self._vertices = []
-        self._texture_coordinates = []
-        self._vertices_normals = []
-        self.faces = []
+        # Reads the whole OBJ file at once
+        with open(obj_path, "r") as obj_file:
+            text = "\n" + obj_file.read()
         # OBJ texture
         if texture_path is not None:
             if ".mtl" in texture_path:
                 # Reads MTL file
-                self.materials = self.read_MTL(self,texture_path)
+                self.materials = self.read_MTL(texture_path)
             else:
                 # Reads texture img from path (JPG,PNG...)
                 self.texture = cv2.imread(texture_path)
         else:
+            # Material library declared in the OBJ (`mtllib`), otherwise a .mtl file with the same name as the .obj
+            mtllib = _MTLLIB_RECORD.search(text)
+            mtl_path = os.path.join(os.path.dirname(obj_path), mtllib.group(1)) if mtllib else obj_path.replace(".obj",".mtl")
             try:
-                # Tries to find a .mtl file with the same name as the .obj
-                mtl_path = obj_path.replace(".obj",".mtl")
                 self.materials = self.read_MTL(mtl_path)
             except FileNotFoundError:
                 # No texture
                 pass
-        # Reads OBJ file
-        for line in open(obj_path, "r"):
-            line = line.replace("\n","")
-            # List of geometric vertices
-            if line.startswith("v "):
-                # `v` means that line defines an object's geometic vertices, with (x, y, z), optional w coordinate is omitted
-                self._vertices.append([float(i) for i in line.split()[1:4]])
-            # List of texture coordinates
-            elif line.startswith("vt "):
-                # `vt` stands for texture coordinates, in (u, [v, w]) coordinates, with values between 0 and 1. v, w is omitted
-                self._texture_coordinates.append([float(i) for i in line.split()[1:3]])
-            # List of vertex normals
-            elif line.startswith("vn "):
-                # `vn` stands for vertex normal vectors, in (x,y,z) coordinates
-                self._vertices_normals.append([float(i) for i in line.split()[1:3]])
-            # Polygonal face element
-            elif line.startswith("f "):
-                # `f` Faces are defined using lists of vertex, texture and normal indices in the format vertex_index/texture_index/normal_index for which each
-                #  index starts at 1 and increases corresponding to the order in which the referenced element was defined. Polygons such as quadrilaterals can be 
-                # defined by using more than three indices.
-                vertex_points = []
-                vertex_colors = []
-                vertex_normals = [] 
-                for i in line.split()[1:]:
-                    # Iterates for each index within a line f v1/vt1/vn1 ->(1) v2/vt2/vn2 ->(2)  v3/vt3/vn3 ->(3)
-                    elements = i.split('/') # Elements of the index
-                    vertex_points.append(self._get_vertex_point(int(elements[0]))) # Adds the first element (vertex point)
-                    try:
-                        # Checks if texture is defined
-                        if len(elements) > 1 and elements[1]:
-                            # The second element of index is not ""
-                            vertex_colors.append(self._get_vertex_color(int(elements[1]))) # Adds the second element (texture coordinate)
-                    except AttributeError:
-                        pass
-                    if len(elements) > 2:
-                        vertex_normals.append(self._get_vertex_normals(int(elements[2]))) # Adds the third element (normal vector)
-                # Every face has at least 3 pts
-                face = {'points': vertex_points}
-                if vertex_colors:
-                    face['colors'] = vertex_colors
-                if vertex_normals:
-                    face['normals'] = vertex_normals
-                if hasattr(self,"materials"):
-                    # If OBJ is MTL textured then assigns the material name to the face
-                    face["material"] = material_name
-                # Adds obj face 
-                self.faces.append(face)
-            # Material
-            elif line.startswith("usemtl "):
-                try:
-                    # Gets material name
-                    material_name = line.split(" ")[1]
-                except AttributeError:
-                    # OBj file has no MTL -> Obviates line
-                    pass
-                except KeyError:
-                    # Material name not defined in .mtl read -> Obviates line
-                    pass
+        # `v` geometric vertices (x, y, z), optional w coordinate is omitted
+        self._vertices = self._parse_records(_VERTEX_RECORDS.findall(text), 3)
+        # `vt` texture coordinates (u, v), with values between 0 and 1. w is omitted
+        self._texture_coordinates = self._parse_records(_TEXTURE_RECORDS.findall(text), 2)
+        # `vn` vertex normal vectors (x, y, z)
+        self._vertices_normals = self._parse_records(_NORMAL_RECORDS.findall(text), 3)
+        # `f` faces, grouped by the `usemtl` statement that precedes them
+        self._parse_faces(text)
+        # Faces (list of dicts), face points and face colors are built lazily from the arrays
+        self._faces = None
+        self._face_points = None
+        self._face_colors = None
+        # Levels of detail (fraction of faces -> OBJ)
+        self._lods = {}
         # Object normalization
         if normalise:
             self.normalise(normalised_axis)
 
-    def read_MTL(self, mtl_path: str) -> Dict[str, Tuple[int,int,int]]:
+    @staticmethod
+    def _parse_records(records: List[str], width: int) -> np.ndarray:
+        """ Converts a block of records values of the same type into a (n, width) float array. Params:
+            * records: Values of each record (keyword excluded), ex. `0.1 0.2 0.3`
+            * width: Number of values kept per record. Missing values are filled with 0.
+        """
+        if not records:
+            return np.zeros((0, width))
+        n = len(records)
+        # Number of values per record taken from the first one
+        length = len(records[0].split())
+        # Single conversion for the whole block
+        values = np.fromstring(" ".join(records), sep=" ")
+        if length >= width and values.size == n*length:
+            return values.reshape(n, length)[:,:width]
+        # Records of different lengths -> one record at a time
+        values = np.zeros((n, width))
+        for i, record in enumerate(records):
+            record_values = record.split()[:width]
+            values[i,:len(record_values)] = [float(value) for value in record_values]
+        return values
+
+    def _parse_faces(self, text: str) -> None:
+        """ Parses all the `f` records of OBJ text into flat corner index arrays. Params:
+            * text: OBJ file content
+
+            Sets `_face_offsets` (corners of face i are `offsets[i]:offsets[i+1]`), the 0-based `_face_vertex_indices`,
+            `_face_texture_indices` and `_face_normal_indices` (-1 if not defined) and the `_face_materials` name of each face.
+        """
+        # Splits the text by `usemtl` statements: [faces, name, faces, name, faces...]
+        groups = _USEMTL_RECORDS.split(text)
+        names = [None] + groups[1::2]
+        records = []
+        counts = []
+        for name, group in zip(names, groups[0::2]):
+            group_records = _FACE_RECORDS.findall(group)
+            records.extend(group_records)
+            counts.append(len(group_records))
+        # Material name of each face
+        self._face_materials = np.repeat(np.array(names, dtype=object), counts)
+        if not records:
+            self._face_offsets = np.zeros(1, dtype=np.int64)
+            self._face_vertex_indices = self._face_texture_indices = self._face_normal_indices = np.zeros(0, dtype=np.int64)
+            return
+        # Number of corners of each face (n-gons allowed)
+        arities = np.fromiter(map(len, map(str.split, records)), dtype=np.int64, count=len(records))
+        self._face_offsets = np.concatenate(([0], np.cumsum(arities)))
+        # Corners as v, v/vt, v//vn or v/vt/vn -> (corners, 3) indices, 0 stands for not defined
+        indices = self._parse_corners(records, int(self._face_offsets[-1]))
+        # Faces referencing elements with negative indices (relative to the current end of each list)
+        relative = indices < 0
+        if relative.any():
+            # Number of records of each type defined before each face
+            face_starts = np.array([match.start() for match in _FACE_STARTS.finditer(text)])
+            for column, keyword in enumerate(("v", "vt", "vn")):
+                if relative[:,column].any():
+                    record_starts = np.array([match.start() for match in _RECORD_STARTS[keyword].finditer(text)])
+                    defined = np.repeat(np.searchsorted(record_starts, face_starts), arities)
+                    indices[:,column] = np.where(relative[:,column], defined + indices[:,column] + 1, indices[:,column])
+        # 1-based -> 0-based (not defined -> -1)
+        indices -= 1
+        self._face_vertex_indices = indices[:,0]
+        self._face_texture_indices = indices[:,1]
+        self._face_normal_indices = indices[:,2]
+
+    @staticmethod
+    def _parse_corners(records: List[str], n_corners: int) -> np.ndarray:
+        """ Parses the corners of face records (`v`, `v/vt`, `v//vn` or `v/vt/vn`) into a (corners, 3) int array. Params:
+            * records: Values of each face record (keyword excluded), ex. `1/1/1 2/2/2 3/3/3`
+            * n_corners: Total number of corners
+
+            Missing elements are set to 0.
+        """
+        # Missing texture index (`v//vn`) -> 0
+        block = " ".join(records).replace("//","/0/")
+        # Corner format taken from the first corner
+        elements = block.split(None, 1)[0].count("/") + 1
+        indices = np.zeros((n_corners, 3), dtype=np.int64)
+        if elements <= 3 and block.count("/") == n_corners*(elements-1):
+            # Same format in all the corners -> one conversion for the whole block
+            values = np.fromstring(block.replace("/"," "), dtype=np.int64, sep=" ")
+            if values.size == n_corners*elements:
+                indices[:,:elements] = values.reshape(n_corners, elements)
+                return indices
+        # Mixed corner formats -> one corner at a time
+        for i, corner in enumerate(block.split()):
+            corner_elements = corner.split("/")[:3]
+            indices[i,:len(corner_elements)] = [int(element) if element else 0 for element in corner_elements]
+        return indices
+
+    @staticmethod
+    def read_MTL(mtl_path: str) -> Dict[str, Dict[str, Any]]:
         """
             Reads the MTL (.mtl) file at indicated path and returns the materials defined in it. Params:
-            * mtl_path: Absolute path to .obj file
+            * mtl_path: Absolute path to .mtl file
 
             TODO: Explore potencial use of more mtl options
         """
         # Materials dictionary
         materials = {}
-        for line in open(mtl_path, "r"):
-            line = line.replace("\n","")
+        material = None
+        with open(mtl_path, "r") as mtl_file:
+            records = mtl_file.read().split("\n")
+        for record in records:
+            values = record.split()
+            if len(values) < 2:
+                continue
+            keyword = values[0]
             # New material
-            if line.startswith("newmtl "):
-                material_name = line.split(" ")[1]
-                # Includes the new material
-                materials[material_name] = {}
-            # Ambient color
-            elif line.startswith("Ka "):
-                # Gets color values 
-                ambient_color = line.split(" ")[1:]
-                # Convertion from str to int and denormalization of RGB values
-                ambient_color = [floor(255*float(value)) for value in ambient_color]
-                # RGB to BRG
-                ambient_color.reverse()
-                # Includes the ambient color 
-                materials[material_name]["ambient_color"] = ambient_color
-            # Diffuse color
-            elif line.startswith("Kd "):
-                # Gets color values 
-                diffuse_color = line.split(" ")[1:]
-                # Convertion from str to int and denormalization of RGB values
-                diffuse_color = [floor(255*float(value)) for value in diffuse_color]
-                # RGB to BRG
-                diffuse_color.reverse()
-                # Includes the diffuse color 
-                materials[material_name]["diffuse_color"] = diffuse_color
-            # Specular color
-            elif line.startswith("Ks "):
-                # Gets color values 
-                specular_color = line.split(" ")[1:]
-                # Convertion from str to int and denormalization of RGB values
-                specular_color = [float(value) for value in specular_color]
-                # RGB to BRG
-                specular_color.reverse()
-                # Includes the specular color 
-                materials[material_name]["specular_color"] = specular_color
-            # Optical density color
-            elif line.startswith("Ni "):
-                # Gets optical density value
-                optical_intensity = float(line.split(" ")[1])
-                # Includes the optical intensity 
-                materials[material_name]["optical_intensity"] = optical_intensity
-            # Opacity (Transparency)
-            elif line.startswith("d "):
-                # Gets the opacity (transparency) value (1 -> fully opaque)
-                transparency = float(line.split(" ")[1])
-                # Includes the optical intensity 
-                materials[material_name]["transparency"] = 1 - transparency
-            # Transparency
-            elif line.startswith("Tr "):
-                # Gets the transparency value (1 -> fully transparent)
-                transparency = float(line.split(" ")[1])
-                # Includes the optical intensity 
-                materials[material_name]["transparency"] = transparency
+            if keyword == "newmtl":
+                material = materials[values[1]] = {}
+            elif material is None:
+                # Statement outside a material -> Obviates line
+                continue
+            # Ambient and diffuse colors: convertion from str to int, denormalization of RGB values and RGB to BGR
+            elif keyword == "Ka":
+                material["ambient_color"] = [floor(255*float(value)) for value in values[1:]][::-1]
+            elif keyword == "Kd":
+                material["diffuse_color"] = [floor(255*float(value)) for value in values[1:]][::-1]
+            # Specular color (RGB to BGR)
+            elif keyword == "Ks":
+                material["specular_color"] = [float(value) for value in values[1:]][::-1]
+            # Optical density
+            elif keyword == "Ni":
+                material["optical_intensity"] = float(values[1])
+            # Opacity (1 -> fully opaque)
+            elif keyword == "d":
+                material["transparency"] = 1 - float(values[1])
+            # Transparency (1 -> fully transparent)
+            elif keyword == "Tr":
+                material["transparency"] = float(values[1])
         return materials
 
-    def _get_vertex_point(self, vertex_index: int) -> Tuple[int, int, int]:
-        """ 
-            Returns the (x,y,z) coordinates of that vertex. Params:
-            * vertex_index: Integer index that indicates where in the vertex points array are the coordinates.
-        """ 
-        return self._vertices[vertex_index-1]
-
-    def _get_vertex_color(self, texture_coordinates_index: int) -> Tuple[int, int, int]:
-        """ 
-            Returns the color values in BGR format of pixel located at the texture coordinates. Params:
-            * texture_coordinates_index: Integer index that indicates where in the texture coordinates array are the relative texture coordinates.
+    @property
+    def faces(self) -> List[Dict[str, Any]]:
+        """ OBJ faces as a list of dicts with the `points` of each face, and `colors`, `normals` and `material` when defined. """
+        if self._faces is None:
+            self._faces = self._build_faces()
+        return self._faces
+
+    @property
+    def face_offsets(self) -> np.ndarray:
+        """ Corners of face i are `face_points[face_offsets[i]:face_offsets[i+1]]`. """
+        return self._face_offsets
+
+    @property
+    def face_points(self) -> np.ndarray:
+        """ (x,y,z) coordinates of the corners of all faces as a single (corners, 3) array. """
+        if self._face_points is None:
+            self._face_points = self._vertices[self._face_vertex_indices]
+        return self._face_points
+
+    def face_colors(self, default_color: Tuple[int, int, int]) -> np.ndarray:
+        """ Returns the BGR color of each face as a (faces, 3) array. Params:
+            * default_color: Color of faces without material or texture color
+
+            MTL textured faces take the diffuse color of their material, image textured faces the average color of their corners.
+        """
+        if self._face_colors is None:
+            n_faces = len(self._face_offsets)-1
+            colors = np.tile(np.array(default_color, dtype=int), (n_faces, 1))
+            if hasattr(self,"materials"):
+                # Diffuse color of each material (TODO: Explore new ways to get a more aprox color)
+                for name in set(self._face_materials.tolist()):
+                    if name in self.materials and "diffuse_color" in self.materials[name]:
+                        colors[self._face_materials == name] = self.materials[name]["diffuse_color"]
+            elif getattr(self, "texture", None) is not None and len(self._texture_coordinates) and n_faces:
+                # Average color of the textured corners of each face
+                textured = self._face_texture_indices >= 0
+                corners_colors = self._get_vertices_colors(self._face_texture_indices)*textured[:,None]
+                counts = np.add.reduceat(textured, self._face_offsets[:-1])
+                sums = np.add.reduceat(corners_colors, self._face_offsets[:-1])
+                colors[counts > 0] = (sums[counts > 0]/counts[counts > 0,None]).astype(int)
+            self._face_colors = colors
+        return self._face_colors
+
+    def face_areas(self) -> np.ndarray:
+        """ Returns the area of each face (model units). """
+        offsets = self._face_offsets
+        if len(offsets) < 2:
+            return np.zeros(0)
+        points = self.face_points
+        arities = np.diff(offsets)
+        # First corner of the face of each corner and next corner of the same face (last corner -> first one)
+        firsts = np.repeat(offsets[:-1], arities)
+        nexts = np.arange(len(points)) + 1
+        nexts[offsets[1:]-1] = offsets[:-1]
+        # Polygon area as the sum of the triangle fan from the first corner
+        crosses = np.cross(points - points[firsts], points[nexts] - points[firsts])
+        return np.linalg.norm(np.add.reduceat(crosses, offsets[:-1]), axis=1)/2
+
+    def lod(self, fraction: float) -> "OBJ":
+        """ Returns a lower level of detail of the OBJ that keeps the largest faces. Params:
+            * fraction: Fraction of faces kept (0-1)
+        """
+        fraction = round(min(max(fraction, 0), 1), 3)
+        if fraction == 1:
+            return self
+        if fraction not in self._lods:
+            n_faces = len(self._face_offsets)-1
+            # Largest faces, in their original order
+            kept = np.sort(np.argsort(-self.face_areas(), kind="stable")[:max(1, int(n_faces*fraction))])
+            arities = np.diff(self._face_offsets)
+            corners = np.repeat(np.isin(np.arange(n_faces), kept), arities)
+            lod = copy.copy(self)
+            lod._face_offsets = np.concatenate(([0], np.cumsum(arities[kept])))
+            lod._face_vertex_indices = self._face_vertex_indices[corners]
+            lod._face_texture_indices = self._face_texture_indices[corners]
+            lod._face_normal_indices = self._face_normal_indices[corners]
+            lod._face_materials = self._face_materials[kept]
+            lod._faces = lod._face_points = lod._face_colors = None
+            lod._lods = {}
+            self._lods[fraction] = lod
+        return self._lods[fraction]
+
+    def _build_faces(self) -> List[Dict[str, Any]]:
+        """ Builds the faces list from the parsed corner arrays. """
+        starts = self._face_offsets[:-1]
+        # Corners slices of each face
+        slices = [slice(start, end) for start, end in zip(starts.tolist(), self._face_offsets[1:].tolist())]
+        points = self._vertices[self._face_vertex_indices]
+        faces = [{'points': points[corners]} for corners in slices]
+        # Vertex colors from texture and vertex normals (only corners with texture coordinate or normal index)
+        attributes = []
+        if getattr(self, "texture", None) is not None and len(self._texture_coordinates):
+            attributes.append(('colors', self._face_texture_indices, self._get_vertices_colors(self._face_texture_indices)))
+        if len(self._vertices_normals):
+            attributes.append(('normals', self._face_normal_indices, self._vertices_normals[self._face_normal_indices]))
+        for key, indices, values in attributes:
+            defined = indices >= 0
+            # Number of corners of each face with the attribute defined
+            counts = np.add.reduceat(defined, starts) if len(starts) else np.zeros(0, dtype=int)
+            for face, corners, count in zip(faces, slices, counts.tolist()):
+                if count == corners.stop - corners.start:
+                    face[key] = values[corners]
+                elif count:
+                    face[key] = values[corners][defined[corners]]
+        if hasattr(self,"materials"):
+            # If OBJ is MTL textured then assigns the material name to each face
+            for face, material_name in zip(faces, self._face_materials):
+                face["material"] = material_name
+        return faces
+
+    def _get_vertices_colors(self, texture_coordinates_indices: np.ndarray) -> np.ndarray:
+        """
+            Returns the color values in BGR format of pixels located at the texture coordinates. Params:
+            * texture_coordinates_indices: Array of indices of the relative texture coordinates.
         """
         # Relative texture coordinates
-        u, v = self._texture_coordinates[texture_coordinates_index-1]
+        u, v = self._texture_coordinates[texture_coordinates_indices].T
         h, w, _ = self.texture.shape
-        # Absolute coordinates of pixel
-        x, y = [round(h*(1-v)),round(w*u)]
-        # Texture coordinate checking
-        if x < 0:
-            x = 0
-        elif x >= w:
-            x = w-1
-        if y < 0:
-            y = 0
-        elif y >= h:
-            y = h-1
-        return [int(self.texture[x][y][i]) for i in range(0,3)]
-            
-    def _get_vertex_normals(self, vertex_normal_index: int) -> Tuple[int, int, int]:
-        """ 
-            Returns the (u,v,w) normal vectors of that vertex. Params:
-            * vertex_normal_index: Integer index that indicates where in the vertex normals array are the coordinates.
-        """
-        return self._vertices_normals[vertex_normal_index-1]
-
-    def _furthest_point(self, normalised_axis):
-        """ Finds furthest point from object center. """
-        max_distance = 0
-        for face in self.faces:
-            points = face['points']
-            for point in points:
-                if normalised_axis == "XY":
-                    distance = dist(point[0:2],[0,0])
-                elif normalised_axis == "XYZ":
-                    distance = dist(point[0:3],[0,0,0])
-                if distance > max_distance:
-                    max_distance = distance
-        return max_distance
-
-    def normalise(self, normalised_axis) -> None:
+        # Absolute coordinates of pixels, limited to texture bounds
+        rows = np.clip(np.round(h*(1-v)), 0, h-1).astype(np.int64)
+        cols = np.clip(np.round(w*u), 0, w-1).astype(np.int64)
+        return self.texture[rows, cols].astype(int)
+
+    def _furthest_point(self, normalised_axis: str) -> float:
+        """ Finds furthest point (used by faces) from object center. """
+        points = self._vertices[self._face_vertex_indices]
+        if not len(points):
+            return 0
+        if normalised_axis == "XY":
+            return float(np.hypot(points[:,0], points[:,1]).max())
+        elif normalised_axis == "XYZ":
+            return float(np.linalg.norm(points[:,0:3], axis=1).max())
+        return 0
+
+    def normalise(self, normalised_axis: str) -> None:
         """ Adjusts object's scale to fit in one-unit-side cube. """
         norm = self._furthest_point(normalised_axis)
-        for i, face in enumerate(self.faces):
-            points = face['points']
-            norm_points = []
-            for point in points:
-                norm_point = [coord/norm for coord in point]
-                norm_points.append(norm_point)
-            self.faces[i]['points'] = norm_points
\ No newline at end of file
+        if norm:
+            self._vertices = self._vertices/norm
+            # Faces must be built again from the normalised vertices
+            self._faces = None
+            self._face_points = None
+            self._lods = {}
@@ -0,0 +1,180 @@
+import cv2
+import numpy as np
+from time import perf_counter
+from typing import Dict, List, Tuple, Any
+
+from aruco.aruco import Aruco
+import augmentation.ar as ar
+from augmentation.obj import OBJ
+from augmentation.compositor import SceneCompositor
+from instrumentation import latency
+
+# Render levels (from best to worst)
+FULL = "full"
+LOD = "lod"
+SPRITE = "sprite"
+SKIPPED = "skipped"
+
+# Fractions of faces of the lower levels of detail (tried in order)
+LOD_FRACTIONS = (0.5, 0.2)
+# Priority multiplier of markers that were not rendered in the previous frame
+NEW_MARKER_BOOST = 4
+# Initial estimation of the render time (projection + drawing) of one face, in seconds
+INITIAL_FACE_COST = 2e-6
+# Weight of the last measurement in the face cost moving average
+COST_SMOOTHING = 0.2
+# Number of frames after which a cached sprite is captured again
+SPRITE_MAX_AGE = 30
+
+class RenderBudget():
+    """ Per-frame render time budget. Markers are rendered by priority (bigger projected size and newly appeared markers first)
+    and, once the estimated render time exceeds the budget, the rest are degraded to a lower level of detail, a cached sprite
+    of a previous full render, or skipped. Constructor params:
+        * budget_ms: Render time budget per frame in milliseconds
+        * lod_fractions: Fractions of faces of the lower levels of detail, tried in order
+        * sprites: Captures and uses cached sprites of the markers
+
+    The `stats` of the last frame report the level each marker was rendered at.
+    """
+
+    def __init__(self, budget_ms: float, lod_fractions: Tuple[float, ...] = LOD_FRACTIONS, sprites: bool = True) -> None:
+        # Budget (seconds)
+        self.budget = budget_ms/1000
+        # Lower levels of detail
+        self.lod_fractions = lod_fractions
+        # Sprites usage
+        self.sprites = sprites
+        # Estimated render time per face (seconds)
+        self.face_cost = INITIAL_FACE_COST
+        self._measured = False
+        # Cached sprites (uid -> sprite)
+        self._sprites = {}
+        # Frame count
+        self._frame = 0
+        # Stats of last frame
+        self.stats = {}
+
+    @staticmethod
+    def priority(aruco: Aruco, new: bool = False) -> float:
+        """ Returns the render priority of an Aruco. Bigger markers on screen go first (the projected size already decreases with the
+        distance), newly appeared ones are boosted. Params:
+            * aruco: Intance of detected ArUco (Aruco Class)
+            * new: The Aruco was not rendered in the previous frame
+        """
+        # Projected size (pixels)
+        size = ar.calculate_autoscale_factor(aruco.corners)
+        return size*(NEW_MARKER_BOOST if new else 1)
+
+    def render(self, image: np.ndarray, entries: List[Tuple[str, Aruco, OBJ, bool]], compositor: SceneCompositor) -> Dict[str, Any]:
+        """ Renders the entries on the image within the budget. Params:
+            * image: Input image to augment
+            * entries: List of (uid, aruco, obj, new) to render
+            * compositor: Scene draw list used for full and lower detail renders
+
+            Returns the frame stats.
+        """
+        start = perf_counter()
+        self._frame += 1
+        levels = {FULL: [], LOD: [], SPRITE: [], SKIPPED: []}
+        lod_fractions = {}
+        # Estimated draw time of the faces already in the draw list, and measured time of their projection
+        planned = 0
+        projection_time = 0
+        # Markers rendered at full detail and sprites to paste
+        full = []
+        sprites = []
+        for uid, aruco, obj, new in sorted(entries, key=lambda entry: self.priority(entry[1], entry[3]), reverse=True):
+            remaining = self.budget - (perf_counter() - start) - planned
+            # Full detail, then lower levels of detail
+            for fraction in (1,) + tuple(self.lod_fractions):
+                level_obj = obj.lod(fraction)
+                cost = (len(level_obj.face_offsets)-1)*self.face_cost
+                if cost <= remaining:
+                    projection_time += self._add(compositor, uid, aruco, obj, level_obj, fraction, levels, full, lod_fractions)
+                    planned += cost
+                    break
+            else:
+                if not levels[FULL] and not levels[LOD]:
+                    # The first marker is always rendered, at least at the lowest level of detail
+                    projection_time += self._add(compositor, uid, aruco, obj, level_obj, fraction, levels, full, lod_fractions)
+                    planned += cost
+                elif uid in self._sprites:
+                    # Cached sprite
+                    sprites.append((self._sprites[uid], aruco))
+                    levels[SPRITE].append(uid)
+                else:
+                    levels[SKIPPED].append(uid)
+        # Sprites are pasted under the 3D models
+        for sprite, aruco in sprites:
+            self._paste_sprite(image, sprite, aruco)
+        # Draws the scene and updates the face cost estimation
+        faces = len(compositor)
+        draw_start = perf_counter()
+        with latency.span("compose"):
+            compositor.draw(image)
+        draw_time = perf_counter() - draw_start
+        if faces:
+            # Projection and drawing time of the faces only (level of detail builds and sprites are not per-face costs)
+            # First measurement replaces the initial estimation
+            smoothing = COST_SMOOTHING if self._measured else 1
+            self.face_cost += smoothing*((projection_time + draw_time)/faces - self.face_cost)
+            self._measured = True
+        # Captures the missing or old sprites while there is time left
+        if self.sprites:
+            uids = set(uid for uid, _, _, _ in entries)
+            self._sprites = {uid: sprite for uid, sprite in self._sprites.items() if uid in uids}
+            for uid, aruco, obj in full:
+                if perf_counter() - start >= self.budget:
+                    break
+                if uid not in self._sprites or self._frame - self._sprites[uid]["frame"] > SPRITE_MAX_AGE:
+                    sprite = self._capture_sprite(image, aruco, obj, compositor)
+                    if sprite is not None:
+                        self._sprites[uid] = sprite
+        # Frame stats
+        self.stats = {"frame": self._frame, "budget_ms": self.budget*1000, "elapsed_ms": (perf_counter() - start)*1000, "faces": faces, "face_cost_us": self.face_cost*1e6, **levels, "lod_fractions": lod_fractions}
+        return self.stats
+
+    @staticmethod
+    def _add(compositor: SceneCompositor, uid: str, aruco: Aruco, obj: OBJ, level_obj: OBJ, fraction: float, levels: Dict[str, List[str]], full: List[Tuple[str, Aruco, OBJ]], lod_fractions: Dict[str, float]) -> float:
+        """ Adds the OBJ at a level of detail to the draw list and records the render level of the marker. Returns the projection time (s). """
+        add_start = perf_counter()
+        with latency.span(f"render/{uid}"):
+            compositor.add(aruco,level_obj)
+        if fraction == 1:
+            levels[FULL].append(uid)
+            full.append((uid, aruco, obj))
+        else:
+            levels[LOD].append(uid)
+            lod_fractions[uid] = fraction
+        return perf_counter() - add_start
+
+    def _capture_sprite(self, image: np.ndarray, aruco: Aruco, obj: OBJ, compositor: SceneCompositor) -> Dict[str, Any]:
+        """ Renders the OBJ alone in a canvas (projected with the compositor camera) and returns it as a sprite relative to the Aruco center and size. """
+        points, offsets, depths, colors = compositor.project(aruco, obj)
+        if not len(depths):
+            return None
+        x0, y0 = points.min(axis=0)
+        x1, y1 = points.max(axis=0) + 1
+        # Sprites bigger than the image are not cached
+        if (x1-x0)*(y1-y0) > image.shape[0]*image.shape[1]:
+            return None
+        canvas = np.zeros((y1-y0, x1-x0, 3), dtype=np.uint8)
+        ar.draw_faces(canvas, points - np.int32([x0, y0]), offsets, depths, colors)
+        center = aruco.center()
+        return {"image": canvas, "mask": canvas.any(axis=2).astype(np.uint8), "offset": (x0-center[0], y0-center[1]), "size": ar.calculate_autoscale_factor(aruco.corners), "frame": self._frame}
+
+    @staticmethod
+    def _paste_sprite(image: np.ndarray, sprite: Dict[str, Any], aruco: Aruco) -> None:
+        """ Pastes a cached sprite on the image, scaled and moved to the actual Aruco size and center. """
+        scale = ar.calculate_autoscale_factor(aruco.corners)/sprite["size"]
+        patch = cv2.resize(sprite["image"], (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        mask = cv2.resize(sprite["mask"], (patch.shape[1], patch.shape[0]), interpolation=cv2.INTER_NEAREST)
+        center = aruco.center()
+        x0 = int(round(center[0] + sprite["offset"][0]*scale))
+        y0 = int(round(center[1] + sprite["offset"][1]*scale))
+        # Visible part of the sprite
+        ix0, iy0 = max(x0, 0), max(y0, 0)
+        ix1, iy1 = min(x0 + patch.shape[1], image.shape[1]), min(y0 + patch.shape[0], image.shape[0])
+        if ix1 <= ix0 or iy1 <= iy0:
+            return
+        np.copyto(image[iy0:iy1, ix0:ix1], patch[iy0-y0:iy1-y0, ix0-x0:ix1-x0], where=mask[iy0-y0:iy1-y0, ix0-x0:ix1-x0, None].astype(bool))
@@ -1,21 +1,39 @@
 import json
 import os
 import pathlib
-from typing import Dict, List, Any, Tuple
+from typing import Callable, Dict, List, Any, Tuple
+from time import monotonic
 import glob
+import numpy as np
 
 from aruco.aruco import Aruco
 import augmentation.ar as ar
 from augmentation.obj import OBJ
+from augmentation.animation_clock import AnimationClock, DEFAULT_FPS, LOOP
+from augmentation.compositor import SceneCompositor
+from camera.calibration import Calibration
+from augmentation.render_budget import RenderBudget
+from instrumentation import latency
 
 from augmentation.aruco_tracker import ArucoTracker
 
 DEFAULT_OBJ = OBJ(os.path.join(str(pathlib.Path(__file__).parent.resolve()),"models","default.obj"),os.path.join(str(pathlib.Path(__file__).parent.resolve()),"models","default.png")) # TODO: Change default OBJ
 
 class Renderer(): 
-    """ OBJ Render Controller. """
+    """ OBJ Render Controller. Constructor params:
+        * obj_map_path: Path to the JSON OBJ map. Each entry may set its animation `fps` and playback `mode` (`loop`, `once` or `pingpong`)
+        * preload: Loads all the OBJs of the map at start
+        * tracker: Uses an ArucoTracker to keep Aruco UIDs between frames
+        * fps: Default animation frames per second
+        * mode: Default animation playback mode
+        * budget_ms: Render time budget per frame in milliseconds. If `None` all markers are rendered at full detail
+        * marker_length: Length of physical Aruco marker in meters. If set, the tracker estimates the Aruco poses (detections with `estimate_pose=False`),
+        also without tracker. Required to render detections without pose
+        * calibration: Camera intrinsics (`Calibration`). If set with `marker_length`, the poses and the projection use the real camera matrix
+        * time_source: Time source of the animation clocks (seconds). Video time for offline renders
+    """
 
-    def __init__(self, obj_map_path: str, preload: bool = True, tracker: bool = True) -> None:
+    def __init__(self, obj_map_path: str, preload: bool = True, tracker: bool = True, fps: float = DEFAULT_FPS, mode: str = LOOP, budget_ms: float = None, marker_length: float = None, calibration: Calibration = None, time_source: Callable[[], float] = monotonic) -> None:
         # Gets OBJ map
         self._obj_map = self._read_obj_map(obj_map_path)
         # Preloading of all objs (optional)
@@ -24,10 +42,22 @@ class Renderer():
             self._preload_OBJs()
         # Creates aruco register
         self.register = {}
-        # Aruco tracker
-        self.tracker = ArucoTracker() if tracker else None
+        # Aruco tracker (without tracker, it only solves the poses of the detections without pose)
+        aruco_tracker = ArucoTracker(marker_length=marker_length, matrix_coefficients=calibration.camera_matrix, distortion_coefficients=calibration.distortion_coefficients) if calibration else ArucoTracker(marker_length=marker_length)
+        self.tracker = aruco_tracker if tracker else None
+        self._pose_solver = aruco_tracker if not tracker and marker_length is not None else None
         # Frozen flag -> if True all animations are frozen
         self.frozen = False
+        # Default animation clock settings
+        self.fps = fps
+        self.mode = mode
+        self.time_source = time_source
+        # Scene-wide draw list
+        self.compositor = SceneCompositor(calibration.focal_length, calibration.camera_matrix, calibration.distortion_coefficients, marker_length) if calibration else SceneCompositor()
+        # Render time budget (optional)
+        self.budget = RenderBudget(budget_ms) if budget_ms else None
+        # UIDs rendered in the last frame
+        self._rendered_uids = set()
 
     def load_OBJ(self, model: str, animation: str = "default", texture: str = None) -> None:
         """ Loads a OBJ in Renderer. Args:
@@ -38,13 +68,13 @@ class Renderer():
         # Gets animation and texture paths
         animation_path = os.path.join(str(pathlib.Path(__file__).parent.resolve()),"models",model,animation)
         texture_path = os.path.join(animation_path,texture) if texture is not None else None
-        # For each .obj file in parent folder
-        for frame, obj_path in enumerate(glob.glob(os.path.join(animation_path,"*.obj"))):
+        # For each .obj file in parent folder (frames in file name order)
+        for frame, obj_path in enumerate(sorted(glob.glob(os.path.join(animation_path,"*.obj")))):
             # Checks if OBJ is already registered
             if model in self.objs:
                 if animation in self.objs[model]:
                     if texture in self.objs[model][animation]:
-                        if len(self.objs[model][animation][texture]) < frame:
+                        if len(self.objs[model][animation][texture]) <= frame:
                             # Adds the new frame to the textured animation of model
                             self.objs[model][animation][texture].append(OBJ(obj_path,texture_path))
                     else:
@@ -96,8 +126,18 @@ class Renderer():
         """
         if uid in self.register:
             self.register[uid]["animation"] = animation
-            # Resets frame count
-            self.register[uid]["frame"] = 0
+            # Restarts the animation clock
+            self.register[uid]["clock"].restart()
+
+    def _create_clock(self, uid: str) -> AnimationClock:
+        """ Creates the animation clock of Aruco with given UID, using the `fps` and `mode` of its OBJ map entry if defined. Params:
+            * uid: unique ID of aruco. Format: 'dict{dictionary}id{Aruco id}#{nonce}' 
+        """
+        # Gets aruco info from uid
+        dictionary = uid.split("id")[0].replace("dict","")
+        id = uid.split("id")[1].split("#")[0]
+        entry = self._obj_map.get(dictionary, {}).get(id, {})
+        return AnimationClock(entry.get("fps", self.fps), entry.get("mode", self.mode), paused=self.frozen, time_source=self.time_source)
 
     def get_aruco_OBJ(self, uid: str) -> OBJ:
         """ Returns the corresponding OBJ of Aruco with input UID. Params:
@@ -108,29 +148,22 @@ class Renderer():
         id = uid.split("id")[1].split("#")[0]
         # Gets current animation
         animation = self.get_aruco_active_animation(uid)
-        # Gets obj frame 
-        try:
-            # Object frame number
-            frame = self.register[uid]["frame"]
-        except KeyError:
-            # UID not registered
-            frame = 0
         # OBJ
         try:
             # Model
             model = self._obj_map[dictionary][id]["model"]
             # Gets the texture
             texture = self._obj_map[dictionary][id]["texture"] if "texture" in self._obj_map[dictionary][id] else None
-            # Gets the corresponding OBJ
+            # Gets the animation frames
             try:
-                obj = self.objs[model][animation][texture][frame]
+                frames = self.objs[model][animation][texture]
             except KeyError:
                 # OBJ not previously loaded -> Loads the OBJ
                 self.load_OBJ(model,animation,texture)
-                obj = self.objs[model][animation][texture][frame]
-            if not self.frozen:
-                # Updates frame count
-                self.register[uid]["frame"] = frame + 1 if frame < len(self.objs[model][animation][texture])-1 else 0
+                frames = self.objs[model][animation][texture]
+            # Frame given by the elapsed time of the animation clock
+            frame = self.register[uid]["clock"].frame(len(frames)) if uid in self.register else 0
+            obj = frames[frame]
         except KeyError:
             # OBJ model not found -> Using default OBJ
             obj = DEFAULT_OBJ
@@ -145,24 +178,70 @@ class Renderer():
             # Gets the tracked updates
             updates = self.tracker.update(arucos)
         else:
-            # No tracker
+            # No tracker: poses of the detections without pose are solved from the corners
+            for aruco in arucos:
+                if aruco.rotation is None:
+                    if self._pose_solver is None:
+                        raise ValueError("Arucos detected without pose (estimate_pose=False) require the Renderer marker_length")
+                    self._pose_solver._estimate_pose(aruco)
             updates = [(f"dict{aruco.dictionary}id{aruco.id}#0", aruco) for aruco in arucos]
         # Updates the renderer register
         for (uid, aruco) in updates:
             if uid not in self.register:
-                self.register[uid] = {"animation": "default", "frame": 0}
+                self.register_uid(uid)
         return updates
 
-    def render(self, image: Any, arucos: List[Aruco]) -> None:
-        """  TODO: Explanation. """
+    def register_uid(self, uid: str) -> None:
+        """ Adds an Aruco UID to the renderer register, with the default animation and a new clock started now. Params:
+            * uid: unique ID of aruco. Format: 'dict{dictionary}id{Aruco id}#{nonce}' 
+        """
+        self.register[uid] = {"animation": "default", "clock": self._create_clock(uid)}
+
+    def render(self, image: Any, arucos: List[Aruco]) -> List[Tuple[str,Aruco]]:
+        """ Updates the register with the input Arucos and augments the image with the OBJ of each one. The faces of all the OBJs
+        are drawn together, from furthest to nearest to the camera. Returns updated register entries (list). """
         # Updates register
         updates = self.update_register(arucos)
-        for (uid, aruco) in updates:
-            # Gets corresponding OBJ
-            obj = self.get_aruco_OBJ(uid)
+        return self.render_updates(image, updates)
+
+    def render_updates(self, image: Any, updates: List[Tuple[str,Aruco]]) -> List[Tuple[str,Aruco]]:
+        """ Augments the image with the OBJ of each registered (uid, aruco) entry, without updating the register. Returns the entries. """
+        if self.budget:
+            # Markers rendered by priority within the render time budget (markers not rendered in last frame are new)
+            entries = [(uid, aruco, self.get_aruco_OBJ(uid), uid not in self._rendered_uids) for (uid, aruco) in updates]
+            self.budget.render(image, entries, self.compositor)
+        else:
+            for (uid, aruco) in updates:
+                with latency.span(f"render/{uid}"):
+                    # Gets corresponding OBJ
+                    obj = self.get_aruco_OBJ(uid)
+                    # Adds the OBJ faces to the scene draw list
+                    self.compositor.add(aruco,obj)
             # OBJ augmentation
-            ar.augment_aruco(image,aruco,obj)
+            with latency.span("compose"):
+                self.compositor.draw(image)
+        self._rendered_uids = set(uid for (uid, _) in updates)
+        return updates
+
+    def set_calibration(self, calibration: Calibration) -> None:
+        """ Sets the camera intrinsics of the poses and the projection (ex. once the actual frame size is known). Params:
+            * calibration: Camera intrinsics (`Calibration`) at the rendered frame size
+        """
+        for tracker in (self.tracker, self._pose_solver):
+            if tracker is not None:
+                tracker.matrix_coefficients = np.float64(calibration.camera_matrix)
+                tracker.distortion_coefficients = np.float64(calibration.distortion_coefficients)
+        self.compositor.focal_length = calibration.focal_length
+        self.compositor.camera_matrix = calibration.camera_matrix
+        self.compositor.distortion_coefficients = calibration.distortion_coefficients
+
+    def render_stats(self) -> Dict[str, Any]:
+        """ Returns the stats of the last rendered frame (render level of each marker) when a render time budget is set. """
+        return self.budget.stats if self.budget else {}
 
     def freeze(self) -> None:
         """ Freezes or Unfreezes current animations. """
-        self.frozen = not self.frozen
\ No newline at end of file
+        self.frozen = not self.frozen
+        # Pauses or resumes all animation clocks
+        for entry in self.register.values():
+            entry["clock"].pause() if self.frozen else entry["clock"].resume()
\ No newline at end of file
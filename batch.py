@@ -0,0 +1,165 @@
+""" Offline batch processing of recorded videos. The video is split in chunks of frames: Aruco detection and pose estimation run on
+the chunks in a process pool, tracking runs sequentially over the merged detections, and rendering fans back out to the pool. The
+augmented frames are written in order to an output video (or to a directory of numbered images, written by the workers).
+Animations follow the video time, so chunked renders match a sequential run.
+
+    python batch.py session.mp4 augmented.mp4 --obj-map augmentation/objs.json --workers 8
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+from typing import Any, Dict, List, Tuple
+
+import cv2
+
+from aruco.aruco import Aruco
+from aruco.aruco_detector import ArucoDetection
+from aruco.dictionary_scheduler import DictionaryScheduler
+from augmentation.aruco_tracker import ArucoTracker
+from camera.calibration import Calibration
+from configuration.configuration import Configuration
+
+MARKER_LENGTH = 0.06
+# Frames per detection and render task
+CHUNK_FRAMES = 64
+# Render tasks in flight per worker (bounds the memory of finished frames waiting to be written)
+TASKS_PER_WORKER = 2
+
+# Worker process state (set by the pool initializers)
+_worker = {}
+
+def _read_chunk(video_path: str, start: int, end: int) -> Any:
+    """ Yields the (index, frame) of the video frames in [start, end). """
+    video_capture = cv2.VideoCapture(video_path)
+    video_capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for index in range(start, end):
+        retval, frame = video_capture.read()
+        if not retval:
+            break
+        yield index, frame
+    video_capture.release()
+
+def _init_detection(settings: Dict[str, Any]) -> None:
+    """ Detection worker initializer. OpenCV threads are disabled: parallelism comes from the processes. """
+    cv2.setNumThreads(1)
+    _worker.update(settings)
+
+def _detect_chunk(chunk: Tuple[int, int]) -> List[Tuple[int, List[Aruco]]]:
+    """ Detects the Arucos (with their poses) of each frame of the chunk. """
+    calibration = _worker["calibration"]
+    detections = []
+    for index, frame in _read_chunk(_worker["video"], *chunk):
+        arucos = ArucoDetection.detect(frame, dictionaries=_worker["dictionaries"], marker_length=_worker["marker_length"], matrix_coefficients=calibration.camera_matrix, distortion_coefficients=calibration.distortion_coefficients)
+        detections.append((index, arucos))
+    return detections
+
+def _init_render(settings: Dict[str, Any]) -> None:
+    """ Render worker initializer: creates the worker renderer, whose animation clocks follow the video time. """
+    cv2.setNumThreads(1)
+    _worker.update(settings)
+    # The renderer loads its default OBJ on import
+    from augmentation.renderer import Renderer
+    _worker["time"] = 0.0
+    _worker["renderer"] = Renderer(settings["obj_map"], preload=False, tracker=False, marker_length=settings["marker_length"], calibration=settings["calibration"], time_source=lambda: _worker["time"])
+
+def _render_chunk(task: Tuple[Tuple[int, int], Dict[int, List[Tuple[str, Aruco]]], Dict[str, float]]) -> List[Any]:
+    """ Renders the tracked updates of each frame of the chunk. Returns the frames, or their paths if the output is a directory. """
+    chunk, updates, first_seen = task
+    renderer = _worker["renderer"]
+    frames = []
+    for index, frame in _read_chunk(_worker["video"], *chunk):
+        frame_updates = updates.get(index, [])
+        for uid, _ in frame_updates:
+            if uid not in renderer.register:
+                # Animation clock started when the track first appeared in the video
+                _worker["time"] = first_seen[uid]
+                renderer.register_uid(uid)
+        _worker["time"] = index/_worker["fps"]
+        renderer.render_updates(frame, frame_updates)
+        if _worker["output_dir"]:
+            path = os.path.join(_worker["output_dir"], f"{index:06d}.jpg")
+            cv2.imwrite(path, frame)
+            frames.append(path)
+        else:
+            frames.append(frame)
+    return frames
+
+def track(detections: Dict[int, List[Aruco]], fps: float) -> Tuple[Dict[int, List[Tuple[str, Aruco]]], Dict[str, float]]:
+    """ Runs the tracker sequentially over the detections of all frames. Returns the tracked updates of each frame and the video
+    time each UID first appeared. """
+    tracker = ArucoTracker()
+    updates, first_seen = {}, {}
+    for index in sorted(detections):
+        updates[index] = tracker.update(detections[index])
+        for uid, _ in updates[index]:
+            first_seen.setdefault(uid, index/fps)
+    return updates, first_seen
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline batch processing of recorded videos")
+    parser.add_argument("video", help="Input video")
+    parser.add_argument("output", help="Output video, or directory of numbered frames")
+    parser.add_argument("--obj-map", required=True, help="JSON OBJ map")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--chunk", type=int, default=CHUNK_FRAMES, help="Frames per task")
+    parser.add_argument("--marker-length", type=float, default=MARKER_LENGTH, help="Marker length (m)")
+    parser.add_argument("--codec", default="mp4v", help="FourCC of the output video")
+    args = parser.parse_args(argv)
+
+    video_capture = cv2.VideoCapture(args.video)
+    if not video_capture.isOpened():
+        raise SystemExit(f"[Batch]: Could not open {args.video}")
+    fps = video_capture.get(cv2.CAP_PROP_FPS) or 30
+    n_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    width, height = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)), int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    video_capture.release()
+    chunks = [(start, min(start + args.chunk, n_frames)) for start in range(0, n_frames, args.chunk)]
+    calibration = Calibration.load(Configuration.get_config_param("Camera","model"), width, height)
+    settings = {"video": args.video, "fps": fps, "marker_length": args.marker_length, "calibration": calibration, "obj_map": args.obj_map,
+                "dictionaries": DictionaryScheduler(args.obj_map).dictionaries(), "output_dir": None if os.path.splitext(args.output)[1] else args.output}
+    start = time()
+
+    # Detection and pose estimation of the chunks in parallel
+    detections = {}
+    with ProcessPoolExecutor(args.workers, initializer=_init_detection, initargs=(settings,)) as pool:
+        for chunk_detections in pool.map(_detect_chunk, chunks):
+            detections.update(chunk_detections)
+    detection_time = time()
+    print(f"[Batch]: Detection of {len(detections)} frames in {detection_time-start:.1f} s")
+
+    # Sequential tracking over the merged detections
+    updates, first_seen = track(detections, fps)
+    tracking_time = time()
+    print(f"[Batch]: Tracking in {tracking_time-detection_time:.1f} s")
+
+    # Parallel rendering, written in order
+    if settings["output_dir"]:
+        os.makedirs(settings["output_dir"], exist_ok=True)
+        writer = None
+    else:
+        writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*args.codec), fps, (width, height))
+    tasks = [(chunk, {index: updates[index] for index in range(*chunk) if index in updates}, first_seen) for chunk in chunks]
+    written = 0
+    with ProcessPoolExecutor(args.workers, initializer=_init_render, initargs=(settings,)) as pool:
+        pending = []
+        for task in tasks:
+            pending.append(pool.submit(_render_chunk, task))
+            # Bounded number of tasks in flight, consumed in order
+            while len(pending) >= args.workers*TASKS_PER_WORKER:
+                written += _write(writer, pending.pop(0).result())
+        while pending:
+            written += _write(writer, pending.pop(0).result())
+    if writer is not None:
+        writer.release()
+    print(f"[Batch]: Rendering of {written} frames in {time()-tracking_time:.1f} s ({written/(time()-start):.1f} fps overall)")
+
+def _write(writer: Any, frames: List[Any]) -> int:
+    """ Writes the rendered frames of a chunk to the output video (frames already written by the workers for directory outputs). """
+    if writer is not None:
+        for frame in frames:
+            writer.write(frame)
+    return len(frames)
+
+if __name__ == "__main__":
+    main()
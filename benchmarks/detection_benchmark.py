@@ -0,0 +1,126 @@
+""" Aruco detection benchmark on synthetic scenes with known ground truth. Sweeps frame resolution, number of markers, marker size
+and dictionary set, runs `ArucoDetection.detect` in its different modes and reports frames per second, p50/p99 latency, recall and
+pose error as JSON. Scenes are generated from a fixed seed, so results of different commits are comparable.
+
+    python -m benchmarks.detection_benchmark --frames 20 --output detection.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+from time import perf_counter
+from math import dist
+from typing import Dict, List, Any
+
+import cv2
+import numpy as np
+
+from aruco.aruco import Aruco
+from aruco.aruco_detector import ArucoDetection
+from benchmarks.synthetic_scene import SyntheticScene, MARKER_LENGTH, dictionary_id
+
+# Detection modes (name -> `ArucoDetection.detect` params)
+MODES = {
+    "default": {},
+    "optimized": {"optimized": True},
+    "scale_0.5": {"scale": 0.5},
+    "tiled": {"tiled": True},
+}
+
+DEFAULT_RESOLUTIONS = ["1280x720", "1920x1080"]
+DEFAULT_MARKERS = [1, 8]
+DEFAULT_SIZES = [40, 120]
+DEFAULT_DICTIONARIES = ["4x4_50", "4x4_50,6x6_250"]
+
+def environment() -> Dict[str, Any]:
+    """ Returns the commit and library versions of the run. """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "opencv": cv2.__version__, "numpy": np.__version__, "machine": platform.machine()}
+
+def percentile(values: List[float], q: float) -> float:
+    """ Returns the q percentile of the values, or `None` if there are no values. """
+    return float(np.percentile(values, q)) if values else None
+
+def rotation_error(rotation: np.ndarray, expected: np.ndarray) -> float:
+    """ Returns the angle (degrees) between two rotation vectors. """
+    relative = cv2.Rodrigues(np.float64(rotation).reshape(3, 1))[0].T @ cv2.Rodrigues(np.float64(expected).reshape(3, 1))[0]
+    return float(np.degrees(np.arccos(np.clip((np.trace(relative) - 1)/2, -1, 1))))
+
+def match(arucos: List[Aruco], ground_truth: List[Dict[str, Any]], marker_size: float) -> List[Any]:
+    """ Returns the (aruco, ground truth) matches: same dictionary and id, centers closer than half the marker size. """
+    matches = []
+    pending = list(arucos)
+    for expected in ground_truth:
+        center = expected["corners"].mean(axis=0)
+        for aruco in pending:
+            if aruco.dictionary == expected["dictionary"] and aruco.id == expected["id"] and dist(np.mean(aruco.corners, axis=0), center) < marker_size/2:
+                matches.append((aruco, expected))
+                pending.remove(aruco)
+                break
+    return matches
+
+def run_case(resolution: str, n_markers: int, marker_size: int, dictionaries: str, modes: List[str], frames: int, seed: int) -> List[Dict[str, Any]]:
+    """ Benchmarks each detection mode on the same synthetic frames of one case. """
+    width, height = (int(value) for value in resolution.split("x"))
+    dictionary_ids = [dictionary_id(name) for name in dictionaries.split(",")]
+    scene = SyntheticScene((width, height), n_markers, marker_size, dictionary_ids, seed=seed)
+    # Frames are generated before timing
+    scenes = [scene.generate() for _ in range(frames)]
+    results = []
+    for mode in modes:
+        latencies, expected, found, detections = [], 0, 0, 0
+        translation_errors, rotation_errors = [], []
+        for frame, ground_truth in scenes:
+            start = perf_counter()
+            arucos = ArucoDetection.detect(frame, dictionaries=dictionary_ids, marker_length=MARKER_LENGTH, matrix_coefficients=scene.camera_matrix, **MODES[mode])
+            latencies.append(perf_counter() - start)
+            matches = match(arucos, ground_truth, marker_size)
+            expected += len(ground_truth)
+            found += len(matches)
+            detections += len(arucos)
+            for aruco, truth in matches:
+                translation_errors.append(float(np.linalg.norm(np.float64(aruco.translation) - truth["translation"])))
+                rotation_errors.append(rotation_error(aruco.rotation, truth["rotation"]))
+        results.append({
+            "resolution": resolution, "markers": n_markers, "marker_size": marker_size, "dictionaries": dictionaries, "mode": mode, "frames": frames,
+            "fps": len(latencies)/sum(latencies),
+            "latency_p50_ms": percentile(latencies, 50)*1000,
+            "latency_p99_ms": percentile(latencies, 99)*1000,
+            "recall": found/expected if expected else None,
+            "false_positives": detections - found,
+            "translation_error_p50_mm": percentile(translation_errors, 50)*1000 if translation_errors else None,
+            "rotation_error_p50_deg": percentile(rotation_errors, 50),
+        })
+    return results
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Aruco detection benchmark on synthetic scenes")
+    parser.add_argument("--resolutions", nargs="+", default=DEFAULT_RESOLUTIONS, help="Frame resolutions (<width>x<height>)")
+    parser.add_argument("--markers", nargs="+", type=int, default=DEFAULT_MARKERS, help="Number of markers per frame")
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Marker sides in pixels")
+    parser.add_argument("--dictionaries", nargs="+", default=DEFAULT_DICTIONARIES, help="Dictionary sets (comma separated, ex. 4x4_50,6x6_250)")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES), help="Detection modes")
+    parser.add_argument("--frames", type=int, default=20, help="Frames per case")
+    parser.add_argument("--seed", type=int, default=0, help="Scenes random seed")
+    parser.add_argument("--output", help="JSON output path (stdout if not set)")
+    args = parser.parse_args(argv)
+    results = []
+    for resolution, n_markers, marker_size, dictionaries in itertools.product(args.resolutions, args.markers, args.sizes, args.dictionaries):
+        for result in run_case(resolution, n_markers, marker_size, dictionaries, args.modes, args.frames, args.seed):
+            results.append(result)
+            print(f"[Detection Benchmark]: {resolution} {n_markers} markers {marker_size}px {dictionaries} {result['mode']}: {result['fps']:.1f} fps, recall {result['recall']:.2f}", file=sys.stderr)
+    report = {"benchmark": "detection", "environment": environment(), "seed": args.seed, "results": results}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+""" Render micro-benchmark of the augmentation path. Builds procedural meshes of controlled face counts (plus the OBJs bundled in
+`augmentation/models`), and times OBJ loading, face projection (orthographic and calibrated perspective), depth sort (vectorized and
+the legacy `order_faces`) and rasterization separately, and `Renderer.render` end to end (tracker and compositor), across marker counts
+and random marker poses. Results can be saved as a baseline, and later runs compared against it: stages slower than the baseline by more
+than the threshold are flagged as regressions (exit code 1).
+
+    python -m benchmarks.render_benchmark --save-baseline render_baseline.json
+    python -m benchmarks.render_benchmark --baseline render_baseline.json --threshold 0.15
+"""
+import argparse
+import glob
+import json
+import os
+import pathlib
+import sys
+import tempfile
+from time import perf_counter
+from typing import Dict, List, Tuple, Any
+
+import cv2
+import numpy as np
+
+from aruco.aruco import Aruco
+import augmentation.ar as ar
+from augmentation.obj import OBJ
+from augmentation.renderer import Renderer
+from benchmarks.synthetic_scene import SyntheticScene, MARKER_LENGTH
+from camera.calibration import Calibration
+from benchmarks.detection_benchmark import environment
+
+MODELS_PATH = os.path.join(str(pathlib.Path(__file__).parent.parent.resolve()),"augmentation","models")
+
+DEFAULT_FACES = [1000, 10000, 100000]
+DEFAULT_MARKERS = [1, 4, 16]
+RESOLUTION = (1920, 1080)
+# Marker side in pixels of the benchmark poses
+MARKER_SIZE = 160
+# Relative slowdown flagged as a regression
+DEFAULT_THRESHOLD = 0.15
+# Minimum absolute slowdown (ms) flagged as a regression (timer noise of sub-millisecond stages)
+MIN_DELTA_MS = 0.5
+
+def write_procedural_mesh(path: str, n_faces: int) -> None:
+    """ Writes an OBJ of a UV sphere of (about) `n_faces` quads, with a color per face material band. """
+    rings = max(int(np.sqrt(n_faces/2)), 2)
+    segments = max(n_faces//rings, 3)
+    theta = np.linspace(0, np.pi, rings + 1)
+    phi = np.linspace(0, 2*np.pi, segments, endpoint=False)
+    vertices = np.stack([np.outer(np.sin(theta), np.cos(phi)), np.outer(np.sin(theta), np.sin(phi)), np.outer(np.cos(theta), np.ones(segments))], axis=-1).reshape(-1, 3)
+    ring, segment = np.meshgrid(np.arange(rings), np.arange(segments), indexing="ij")
+    first = ring*segments + segment + 1
+    following = ring*segments + (segment + 1) % segments + 1
+    faces = np.stack([first, following, following + segments, first + segments], axis=-1).reshape(-1, 4)
+    with open(path.replace(".obj", ".mtl"), "w") as mtl_file:
+        for band in range(4):
+            mtl_file.write(f"newmtl band{band}\nKd {0.2*band+0.2} 0.4 {0.8-0.2*band}\n")
+    with open(path, "w") as obj_file:
+        obj_file.write("".join(f"v {x:.6f} {y:.6f} {z:.6f}\n" for x, y, z in vertices))
+        for band, band_faces in enumerate(np.array_split(faces, 4)):
+            obj_file.write(f"usemtl band{band}\n")
+            obj_file.write("".join(f"f {a} {b} {c} {d}\n" for a, b, c, d in band_faces))
+
+def poses(n_markers: int, seed: int) -> List[Aruco]:
+    """ Returns `n_markers` Arucos with random poses (ground truth of a synthetic scene). """
+    scene = SyntheticScene(RESOLUTION, n_markers, MARKER_SIZE, [cv2.aruco.DICT_4X4_50], noise=0, blur=0, seed=seed)
+    _, ground_truth = scene.generate()
+    return [Aruco(truth["corners"], truth["rotation"], truth["translation"], truth["dictionary"], truth["id"]) for truth in ground_truth]
+
+def timed(function, repeats: int) -> Tuple[float, Any]:
+    """ Returns the median time (seconds) of `repeats` calls of the function and its last result. """
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        result = function()
+        times.append(perf_counter() - start)
+    return float(np.median(times)), result
+
+def create_renderer(name: str, obj: OBJ, arucos: List[Aruco], calibration: Calibration, map_dir: str) -> Renderer:
+    """ Returns a renderer (with tracker and calibrated projection) that renders the OBJ on every marker of the Arucos. """
+    obj_map = {}
+    for aruco in arucos:
+        obj_map.setdefault(str(aruco.dictionary), {})[str(aruco.id)] = {"model": name}
+    obj_map_path = os.path.join(map_dir, "objs.json")
+    with open(obj_map_path, "w") as obj_map_file:
+        json.dump(obj_map, obj_map_file)
+    renderer = Renderer(obj_map_path, preload=False, marker_length=MARKER_LENGTH, calibration=calibration)
+    # Single frame default animation without texture
+    renderer.objs[name] = {"default": {None: [obj]}}
+    return renderer
+
+def legacy_faces(obj: OBJ) -> List[np.ndarray]:
+    """ Returns the faces of the OBJ in the `order_faces` layout: a (corners, 1, 3) array of points per face. """
+    offsets = obj.face_offsets
+    points = obj.face_points.reshape(-1, 1, 3)
+    return [points[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+def run_model(name: str, path: str, markers: List[int], repeats: int, seed: int) -> List[Dict[str, Any]]:
+    """ Times the render stages of one model for each marker count. """
+    load_time, obj = timed(lambda: OBJ(path), max(repeats//5, 1))
+    n_faces = len(obj.face_offsets) - 1
+    calibration = Calibration(SyntheticScene(RESOLUTION, 1, MARKER_SIZE, [cv2.aruco.DICT_4X4_50]).camera_matrix, np.zeros((1, 5)), RESOLUTION)
+    # Legacy per-face sort of the model faces (python loop, independent of the marker count)
+    faces, faces_colors = legacy_faces(obj), list(obj.face_colors((0, 0, 0)))
+    order_time, _ = timed(lambda: ar.order_faces((0, 0, -10), faces, faces_colors), max(repeats//5, 1))
+    results = []
+    for n_markers in markers:
+        arucos = poses(n_markers, seed)
+        image = np.zeros((RESOLUTION[1], RESOLUTION[0], 3), dtype=np.uint8)
+        # Projection of the model on every marker: orthographic (autoscaled to the corners) and perspective (calibrated pose)
+        projection_time, projected = timed(lambda: [ar.project_faces(aruco, obj) for aruco in arucos], repeats)
+        perspective_time, _ = timed(lambda: [ar.project_faces(aruco, obj, camera_matrix=calibration.camera_matrix, distortion_coefficients=calibration.distortion_coefficients, marker_length=MARKER_LENGTH) for aruco in arucos], repeats)
+        # Scene draw list of all markers (face starts shifted to the position of each model in the list)
+        starts = np.cumsum([0] + [len(points) for points, _, _, _ in projected])
+        points = np.concatenate([points for points, _, _, _ in projected])
+        offsets = np.concatenate([offsets[:-1] + start for (_, offsets, _, _), start in zip(projected, starts)] + [[starts[-1]]])
+        depths = np.concatenate([depths for _, _, depths, _ in projected])
+        colors = np.concatenate([colors for _, _, _, colors in projected])
+        # Depth sort alone, then sort and rasterization (draw)
+        sort_time, _ = timed(lambda: np.argsort(-depths, kind="stable"), repeats)
+        draw_time, _ = timed(lambda: ar.draw_faces(image, points, offsets, depths, colors), repeats)
+        # Renderer end to end: tracker poses, scene compositor projection, sort and rasterization
+        with tempfile.TemporaryDirectory() as map_dir:
+            renderer = create_renderer(name, obj, arucos, calibration, map_dir)
+            renderer_time, _ = timed(lambda: renderer.render(image, arucos), repeats)
+        results.append({
+            "model": name, "faces": n_faces, "markers": n_markers,
+            "load_ms": load_time*1000,
+            "projection_ms": projection_time*1000,
+            "perspective_ms": perspective_time*1000,
+            "sort_ms": sort_time*1000,
+            "order_faces_ms": order_time*1000,
+            "raster_ms": max(draw_time - sort_time, 0)*1000,
+            "total_ms": (projection_time + draw_time)*1000,
+            "renderer_ms": renderer_time*1000,
+        })
+    return results
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """ Returns the stages of the results slower than the baseline by more than the threshold (and at least `MIN_DELTA_MS`). """
+    baseline_results = {(result["model"], result["markers"]): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        reference = baseline_results.get((result["model"], result["markers"]))
+        if reference is None:
+            continue
+        for stage in ("load_ms", "projection_ms", "perspective_ms", "sort_ms", "order_faces_ms", "raster_ms", "total_ms", "renderer_ms"):
+            if reference.get(stage, 0) > 0 and result[stage] - reference[stage] > max(threshold*reference[stage], MIN_DELTA_MS):
+                regressions.append({"model": result["model"], "markers": result["markers"], "stage": stage, "baseline": reference[stage], "actual": result[stage], "slowdown": result[stage]/reference[stage] - 1})
+    return regressions
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Render micro-benchmark of the augmentation path")
+    parser.add_argument("--faces", nargs="+", type=int, default=DEFAULT_FACES, help="Face counts of the procedural meshes")
+    parser.add_argument("--markers", nargs="+", type=int, default=DEFAULT_MARKERS, help="Number of markers")
+    parser.add_argument("--no-models", action="store_true", help="Skips the OBJs bundled in augmentation/models")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed repetitions of each stage (median)")
+    parser.add_argument("--seed", type=int, default=0, help="Poses random seed")
+    parser.add_argument("--output", help="JSON output path (stdout if not set)")
+    parser.add_argument("--save-baseline", help="Saves the results as baseline at this path")
+    parser.add_argument("--baseline", help="Baseline to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Relative slowdown flagged as a regression")
+    args = parser.parse_args(argv)
+    models = []
+    with tempfile.TemporaryDirectory() as mesh_dir:
+        for n_faces in args.faces:
+            path = os.path.join(mesh_dir, f"sphere_{n_faces}.obj")
+            write_procedural_mesh(path, n_faces)
+            models.append((f"sphere_{n_faces}", path))
+        if not args.no_models:
+            models += [(os.path.relpath(path, MODELS_PATH), path) for path in sorted(glob.glob(os.path.join(MODELS_PATH, "**", "*.obj"), recursive=True))]
+        results = []
+        for name, path in models:
+            for result in run_model(name, path, args.markers, args.repeats, args.seed):
+                results.append(result)
+                print(f"[Render Benchmark]: {name} ({result['faces']} faces) x{result['markers']}: load {result['load_ms']:.1f} ms, projection {result['projection_ms']:.2f} ms (perspective {result['perspective_ms']:.2f} ms), sort {result['sort_ms']:.2f} ms (order_faces {result['order_faces_ms']:.1f} ms), raster {result['raster_ms']:.2f} ms, renderer {result['renderer_ms']:.2f} ms", file=sys.stderr)
+    report = {"benchmark": "render", "environment": environment(), "seed": args.seed, "repeats": args.repeats, "results": results}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        report["regressions"] = regressions
+        for regression in regressions:
+            print(f"[Render Benchmark]: REGRESSION {regression['model']} x{regression['markers']} {regression['stage']}: {regression['baseline']:.2f} -> {regression['actual']:.2f} ({regression['slowdown']:+.0%})", file=sys.stderr)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=4)
+    elif not args.save_baseline:
+        print(json.dumps(report, indent=4))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
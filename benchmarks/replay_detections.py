@@ -0,0 +1,92 @@
+""" Replay driver of detection recordings (`aruco.detection_recorder`). Feeds the recorded detections into `ArucoTracker` and, if an
+OBJ map is given, `Renderer` (on the recorded frames or a blank canvas), at the original pace or as fast as possible, and reports
+the tracker and render latencies as JSON. Tracker and render performance can be measured without a camera.
+
+    python -m benchmarks.replay_detections session.ardl --obj-map augmentation/objs.json --output replay.json
+"""
+import argparse
+import json
+from time import perf_counter, sleep
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+from aruco.detection_governor import DetectionGovernor
+from aruco.detection_recorder import read_detections, read_header
+from augmentation.aruco_tracker import ArucoTracker
+from benchmarks.detection_benchmark import environment, percentile
+
+def replay(path: str, tracker: ArucoTracker = None, renderer: Any = None, realtime: bool = False, show: bool = False) -> Dict[str, Any]:
+    """ Replays a recording into the tracker (or the renderer, that owns its tracker). Params:
+        * path: Recording path
+        * tracker: Aruco tracker (ignored if a renderer is given)
+        * renderer: `Renderer` of the recorded markers
+        * realtime: Keeps the recorded pace between frames
+        * show: Displays the rendered frames
+
+        Returns the tracker and render latencies stats.
+    """
+    frame_size = read_header(path)["frame_size"]
+    tracker_latencies, render_latencies = [], []
+    frames, markers = 0, 0
+    start, first_timestamp = perf_counter(), None
+    for record in read_detections(path):
+        if realtime:
+            # Waits until the frame is due at the recorded pace
+            if first_timestamp is None:
+                first_timestamp = record["timestamp"]
+            delay = record["timestamp"] - first_timestamp - (perf_counter() - start)
+            if delay > 0:
+                sleep(delay)
+        arucos = record["arucos"]
+        if record["skipped"]:
+            # Detection skipped in the live run: the tracker poses were reused
+            arucos = DetectionGovernor.tracked_arucos(renderer.tracker if renderer is not None else tracker)
+        frames += 1
+        markers += len(arucos)
+        if renderer is not None:
+            image = record["frame"] if record["frame"] is not None else np.zeros((frame_size[1], frame_size[0], 3), dtype=np.uint8)
+            render_start = perf_counter()
+            renderer.render(image, arucos)
+            render_latencies.append(perf_counter() - render_start)
+            if show:
+                cv2.imshow("replay", image)
+                cv2.waitKey(1)
+        elif tracker is not None:
+            tracker_start = perf_counter()
+            tracker.update(arucos)
+            tracker_latencies.append(perf_counter() - tracker_start)
+    elapsed = perf_counter() - start
+    stats = {"frames": frames, "markers": markers, "elapsed_s": elapsed, "fps": frames/elapsed if elapsed else None}
+    for name, latencies in (("tracker", tracker_latencies), ("render", render_latencies)):
+        if latencies:
+            stats[name] = {"p50_ms": percentile(latencies, 50)*1000, "p99_ms": percentile(latencies, 99)*1000, "mean_ms": float(np.mean(latencies))*1000}
+    return stats
+
+def main(argv: List[str] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Replay of detection recordings into the tracker and renderer")
+    parser.add_argument("recording", help="Detection recording path")
+    parser.add_argument("--obj-map", help="JSON OBJ map. If set, the detections are rendered")
+    parser.add_argument("--marker-length", type=float, help="Marker length (m). If set, the tracker estimates the poses")
+    parser.add_argument("--realtime", action="store_true", help="Keeps the recorded pace")
+    parser.add_argument("--show", action="store_true", help="Displays the rendered frames")
+    parser.add_argument("--output", help="JSON output path (stdout if not set)")
+    args = parser.parse_args(argv)
+    renderer = None
+    if args.obj_map:
+        # The renderer loads its default OBJ on import
+        from augmentation.renderer import Renderer
+        renderer = Renderer(args.obj_map, preload=True, marker_length=args.marker_length)
+    tracker = ArucoTracker(marker_length=args.marker_length)
+    stats = replay(args.recording, tracker, renderer, args.realtime, args.show)
+    report = {"benchmark": "replay", "environment": environment(), "recording": args.recording, **stats}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+    return report
+
+if __name__ == "__main__":
+    main()
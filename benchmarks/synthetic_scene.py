@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple, Any
+
+from aruco.aruco_detector import MATRIX_COEFFICIENTS
+
+# Calibration resolution of the default camera matrix
+CALIBRATION_RESOLUTION = (1920, 1080)
+# Physical marker length (meters) of the generated markers
+MARKER_LENGTH = 0.06
+# Marker image resolution and white quiet zone around it (fraction of marker side)
+MARKER_PX = 200
+QUIET_ZONE = 0.25
+# Max tilt of the generated markers (degrees)
+MAX_TILT = 40
+
+def dictionary_id(name: str) -> int:
+    """ Returns the OpenCV predefined dictionary of a name such as `4x4_50` or `DICT_4X4_50`. """
+    name = name.upper()
+    return getattr(cv2.aruco, name if name.startswith("DICT_") else f"DICT_{name}")
+
+def scaled_camera_matrix(width: int, height: int, camera_matrix: np.ndarray = MATRIX_COEFFICIENTS) -> np.ndarray:
+    """ Returns the camera matrix scaled from the calibration resolution to the given one. """
+    camera_matrix = np.float64(camera_matrix).copy()
+    camera_matrix[0] *= width/CALIBRATION_RESOLUTION[0]
+    camera_matrix[1] *= height/CALIBRATION_RESOLUTION[1]
+    return camera_matrix
+
+class SyntheticScene():
+    """ Synthetic ArUco scenes generator with known ground truth poses. Each marker (`cv2.aruco.drawMarker` with a white quiet zone)
+    gets a random pose, its corners are projected with the camera matrix and the marker is perspective warped into the frame.
+    Sensor noise and blur are added to the whole frame. Constructor params:
+        * resolution: Frame resolution (width, height)
+        * n_markers: Number of markers per frame
+        * marker_size: Approximate side of the markers in pixels
+        * dictionaries: Dictionaries of the markers (chosen at random for each marker)
+        * noise: Gaussian noise standard deviation (gray levels)
+        * blur: Gaussian blur kernel size (0 -> no blur)
+        * seed: Random seed. Same parameters and seed generate the same frames
+    """
+
+    def __init__(self, resolution: Tuple[int, int], n_markers: int, marker_size: int, dictionaries: List[int], noise: float = 4.0, blur: int = 3, seed: int = 0) -> None:
+        self.resolution = resolution
+        self.n_markers = n_markers
+        self.marker_size = marker_size
+        self.dictionaries = dictionaries
+        self.noise = noise
+        self.blur = blur
+        self.camera_matrix = scaled_camera_matrix(*resolution)
+        self._rng = np.random.default_rng(seed)
+        # Marker images cache ((dictionary, id) -> image)
+        self._markers = {}
+
+    def _marker_image(self, dictionary: int, id: int) -> np.ndarray:
+        """ Returns the marker image with its white quiet zone. """
+        if (dictionary, id) not in self._markers:
+            marker = cv2.aruco.drawMarker(cv2.aruco.Dictionary_get(dictionary), id, MARKER_PX)
+            border = int(MARKER_PX*QUIET_ZONE)
+            self._markers[(dictionary, id)] = cv2.copyMakeBorder(marker, border, border, border, border, cv2.BORDER_CONSTANT, value=255)
+        return self._markers[(dictionary, id)]
+
+    def _random_pose(self, center: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns a random pose (rvec, tvec) of a marker whose center projects on the given pixel, at the distance of the marker size. """
+        focal_length = self.camera_matrix[0][0]
+        depth = focal_length*MARKER_LENGTH/self.marker_size
+        translation = depth*np.linalg.solve(self.camera_matrix, [center[0], center[1], 1])
+        # Marker facing the camera (rotated 180 degrees around x) with a random tilt and in-plane rotation
+        tilt = np.radians(self._rng.uniform(-MAX_TILT, MAX_TILT, 2))
+        spin = self._rng.uniform(-np.pi, np.pi)
+        rotation_matrix = cv2.Rodrigues(np.float64([np.pi + tilt[0], 0, 0]))[0] @ cv2.Rodrigues(np.float64([0, tilt[1], 0]))[0] @ cv2.Rodrigues(np.float64([0, 0, spin]))[0]
+        return cv2.Rodrigues(rotation_matrix)[0].ravel(), translation
+
+    def generate(self) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """ Returns a new BGR frame and its ground truth markers (dictionary, id, corners, rotation, translation). """
+        width, height = self.resolution
+        frame = np.full((height, width), 128, dtype=np.uint8)
+        ground_truth = []
+        # Markers centers on a jittered grid, so markers do not overlap
+        columns = int(np.ceil(np.sqrt(self.n_markers*width/height)))
+        rows = int(np.ceil(self.n_markers/columns))
+        cells = self._rng.permutation(rows*columns)[:self.n_markers]
+        half = MARKER_LENGTH/2
+        object_points = np.float64([[-half, half, 0], [half, half, 0], [half, -half, 0], [-half, -half, 0]])
+        for cell in cells:
+            cell_width, cell_height = width/columns, height/rows
+            jitter = self._rng.uniform(-0.15, 0.15, 2)
+            center = ((cell % columns + 0.5 + jitter[0])*cell_width, (cell//columns + 0.5 + jitter[1])*cell_height)
+            dictionary = int(self._rng.choice(self.dictionaries))
+            id = int(self._rng.integers(0, cv2.aruco.Dictionary_get(dictionary).bytesList.shape[0]))
+            rotation, translation = self._random_pose(center)
+            corners = cv2.projectPoints(object_points, rotation, translation, self.camera_matrix, None)[0].reshape(4, 2)
+            # Warps the marker (quiet zone included) on its projected corners
+            marker = self._marker_image(dictionary, id)
+            border = int(MARKER_PX*QUIET_ZONE)
+            source = np.float32([[border, border], [border+MARKER_PX, border], [border+MARKER_PX, border+MARKER_PX], [border, border+MARKER_PX]])
+            warp = cv2.getPerspectiveTransform(source, np.float32(corners))
+            warped = cv2.warpPerspective(marker, warp, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+            mask = cv2.warpPerspective(np.full(marker.shape, 255, dtype=np.uint8), warp, (width, height), flags=cv2.INTER_NEAREST)
+            np.copyto(frame, warped, where=mask > 0)
+            ground_truth.append({"dictionary": dictionary, "id": id, "corners": corners, "rotation": rotation, "translation": translation})
+        if self.blur:
+            frame = cv2.GaussianBlur(frame, (self.blur, self.blur), 0)
+        if self.noise:
+            frame = np.clip(frame + self._rng.normal(0, self.noise, frame.shape), 0, 255).astype(np.uint8)
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR), ground_truth
@@ -0,0 +1,120 @@
+import json
+import os
+import pathlib
+import cv2
+import numpy as np
+from typing import Dict, List, Tuple, Any
+
+# Intrinsics file (camera model -> resolution "<width>x<height>" -> camera matrix and distortion coefficients)
+CALIBRATION_PATH = os.path.join(str(pathlib.Path(__file__).parent.parent.resolve()),"configuration","calibration.json")
+# Entry used for camera models without calibration
+DEFAULT_MODEL = "default"
+
+# Undistortion modes: none, whole frame remap or detected corners only (by pose estimation and projection)
+UNDISTORT_NONE = "none"
+UNDISTORT_IMAGE = "image"
+UNDISTORT_CORNERS = "corners"
+UNDISTORT_MODES = (UNDISTORT_NONE, UNDISTORT_IMAGE, UNDISTORT_CORNERS)
+
+class CalibrationNotFoundError(Exception):
+    """ No calibration was found for the camera model. """
+
+class Calibration():
+    """ Camera intrinsics. Constructor params:
+        * camera_matrix: 3x3 camera matrix (fx, fy, cx, cy) in pixels
+        * distortion_coefficients: Distortion coefficients (k1, k2, p1, p2, k3)
+        * resolution: Image resolution (width, height) of the calibration
+
+    The undistortion remap tables are computed once per image size (`undistort_image`).
+    """
+
+    def __init__(self, camera_matrix: List[Tuple[float, float, float]], distortion_coefficients: Tuple[float, ...] = np.zeros((1, 5)), resolution: Tuple[int, int] = None) -> None:
+        self.camera_matrix = np.float64(camera_matrix).reshape(3, 3)
+        self.distortion_coefficients = np.float64(distortion_coefficients).reshape(1, -1)
+        self.resolution = tuple(resolution) if resolution else None
+        # Undistortion remap tables ((width, height) -> (map1, map2))
+        self._maps = {}
+
+    @property
+    def focal_length(self) -> float:
+        """ Horizontal focal length in pixels. """
+        return float(self.camera_matrix[0][0])
+
+    @property
+    def distorted(self) -> bool:
+        """ `True` if the distortion coefficients are not all zero. """
+        return bool(np.any(self.distortion_coefficients))
+
+    def scaled(self, width: int, height: int) -> "Calibration":
+        """ Returns the calibration scaled to another resolution of the same sensor (same aspect ratio). """
+        if not self.resolution or self.resolution == (width, height):
+            return Calibration(self.camera_matrix, self.distortion_coefficients, (width, height))
+        camera_matrix = self.camera_matrix.copy()
+        camera_matrix[0] *= width/self.resolution[0]
+        camera_matrix[1] *= height/self.resolution[1]
+        return Calibration(camera_matrix, self.distortion_coefficients, (width, height))
+
+    def undistorted(self) -> "Calibration":
+        """ Returns the calibration of the undistorted images (same camera matrix, no distortion). """
+        return Calibration(self.camera_matrix, np.zeros((1, 5)), self.resolution)
+
+    def undistort_image(self, image: np.ndarray) -> np.ndarray:
+        """ Undistorts the image with a single `cv2.remap`. The remap tables are computed on first use for each image size. """
+        if not self.distorted:
+            return image
+        size = (image.shape[1], image.shape[0])
+        if size not in self._maps:
+            calibration = self.scaled(*size)
+            self._maps[size] = cv2.initUndistortRectifyMap(calibration.camera_matrix, calibration.distortion_coefficients, None, calibration.camera_matrix, size, cv2.CV_16SC2)
+        map1, map2 = self._maps[size]
+        return cv2.remap(image, map1, map2, cv2.INTER_LINEAR)
+
+    def undistort_points(self, points: np.ndarray) -> np.ndarray:
+        """ Returns the undistorted pixel coordinates of (N, 2) image points. """
+        points = np.float64(points).reshape(-1, 1, 2)
+        if not self.distorted:
+            return points.reshape(-1, 2)
+        return cv2.undistortPoints(points, self.camera_matrix, self.distortion_coefficients, P=self.camera_matrix).reshape(-1, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """ Returns the calibration as a JSON serializable dict. """
+        return {"matrix": self.camera_matrix.tolist(), "distortion": self.distortion_coefficients.ravel().tolist()}
+
+    @staticmethod
+    def from_realsense(intrinsics: Any) -> "Calibration":
+        """ Returns the calibration from the factory intrinsics of a RealSense stream (`rs2.intrinsics`). """
+        camera_matrix = [[intrinsics.fx, 0, intrinsics.ppx], [0, intrinsics.fy, intrinsics.ppy], [0, 0, 1]]
+        return Calibration(camera_matrix, list(intrinsics.coeffs), (intrinsics.width, intrinsics.height))
+
+    @staticmethod
+    def _read_calibrations(calibration_path: str = CALIBRATION_PATH) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """ Returns all the calibrations of the file at indicated path. """
+        if not os.path.exists(calibration_path):
+            return {}
+        with open(calibration_path) as calibration_file:
+            return json.load(calibration_file)
+
+    @staticmethod
+    def load(model: str, width: int, height: int, calibration_path: str = CALIBRATION_PATH) -> "Calibration":
+        """ Returns the calibration of the camera model at indicated resolution. If the resolution was not calibrated, the closest
+        aspect ratio calibration of the model is scaled; models without calibration use the `DEFAULT_MODEL` entry. """
+        calibrations = Calibration._read_calibrations(calibration_path)
+        for name in (model, DEFAULT_MODEL):
+            resolutions = calibrations.get(name)
+            if not resolutions:
+                continue
+            key = f"{width}x{height}"
+            if key in resolutions:
+                return Calibration(resolutions[key]["matrix"], resolutions[key]["distortion"], (width, height))
+            # Closest aspect ratio, then closest width
+            closest = min(resolutions, key=lambda resolution: (abs(int(resolution.split("x")[0])/int(resolution.split("x")[1]) - width/height), abs(int(resolution.split("x")[0]) - width)))
+            calibration = Calibration(resolutions[closest]["matrix"], resolutions[closest]["distortion"], tuple(int(value) for value in closest.split("x")))
+            return calibration.scaled(width, height)
+        raise CalibrationNotFoundError(model)
+
+    def save(self, model: str, calibration_path: str = CALIBRATION_PATH) -> None:
+        """ Saves the calibration for the camera model at its resolution. """
+        calibrations = Calibration._read_calibrations(calibration_path)
+        calibrations.setdefault(model, {})[f"{self.resolution[0]}x{self.resolution[1]}"] = self.to_dict()
+        with open(calibration_path, "w") as calibration_file:
+            json.dump(calibrations, calibration_file, indent=4)
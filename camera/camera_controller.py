@@ -1,15 +1,24 @@
 from camera.camera_module import CameraModule
+from camera.calibration import Calibration
 from camera.default import DefaultCamera
 from camera.D435 import D435
 from camera.L515 import L515, L515NotFoundError
+from camera.playback import PlaybackCamera
+from camera.shared_frames import SharedFrame, SharedFramePool
 from configuration.configuration import Configuration
 import numpy
+from typing import Any, Dict, List, Tuple
+
+from aruco.aruco import Aruco
 
 class Camera:
-    """ Controller class for Board camera module. """
+    """ Controller class for Board camera module. Params:
+        * section: config.ini section of the camera (`[Camera]` by default, see `[General] cameras`)
+    """
 
-    def __init__(self) ->  None:
-        model_name = Configuration.get_config_param('Camera','model')
+    def __init__(self, section: str = 'Camera') ->  None:
+        self.section = section
+        model_name = Configuration.get_config_param(section,'model')
         # Creates an instance of the correspondent simulation module
         self._module = self._get_module(model_name)
 
@@ -19,15 +28,18 @@ class Camera:
         if model_name == 'IRSL515':
             try:
                 # Intel RS L515 camera module
-                return L515()
+                return L515(self.section)
             except L515NotFoundError:
-                return DefaultCamera()
+                return DefaultCamera(self.section)
         elif model_name == 'IRSD435':
             # Intel RS D435 camera module
-            return D435()
+            return D435(self.section)
+        elif model_name == 'PLAYBACK':
+            # Video file or image sequence playback module
+            return PlaybackCamera(self.section)
         else:
             # Default option 
-            return DefaultCamera()
+            return DefaultCamera(self.section)
         
     def __del__(self) -> None:
         """ Interrupts the video capture. """
@@ -37,6 +49,61 @@ class Camera:
         # Indicates the module to get an image
         return self._module.get_frame()
     
+    def get_frames(self) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """ Reads the lastest frame and returns it for display along with the frame for detection (gray or infrared stream of
+        RealSense modules, see `[Camera] detection_stream`). """
+        return self._module.get_frames()
+
+    def read_into(self, out: numpy.ndarray) -> bool:
+        """ Reads the lastest frame into the preallocated array. Returns `False` if there is no new frame. """
+        return self._module.read_into(out)
+
+    def capture(self, pool: SharedFramePool, timeout: float = 0) -> SharedFrame:
+        """ Reads the lastest frame into a free slot of the shared frame pool (waiting up to `timeout` seconds for a slot). Returns
+        the frame reference (held by the caller) with the capture info, or `None` if there is no new frame. """
+        frame, slot = pool.acquire(timeout)
+        if not self._module.read_into(slot):
+            pool.release(frame)
+            return None
+        frame.info = self._module.frame_info()
+        return frame
+
+    def finished(self) -> bool:
+        """ Returns `True` if the source has no more frames (playback without loop). """
+        return self._module.finished()
+
+    def map_detections(self, arucos: List[Aruco], marker_length: float) -> List[Aruco]:
+        """ Maps the Arucos detected in the detection frame to the display frame (infrared detection stream of RealSense modules). """
+        return self._module.map_detections(arucos, marker_length)
+
+    def detection_registered(self) -> bool:
+        """ Returns `True` if the pixels of the detection frame match the display frame (`False` for infrared detection streams). """
+        return self._module.detection_registered()
+
+    def frame_info(self) -> Dict[str, Any]:
+        """ Returns the capture info (frame number, hardware timestamp...) of the last frame. """
+        return self._module.frame_info()
+
+    def sensor_latency(self) -> float:
+        """ Returns the time (ms) since the sensor timestamp of the last frame, or `None` if not available. """
+        return self._module.sensor_latency()
+
+    def stats(self) -> Dict[str, int]:
+        """ Returns the capture counters (received, dropped frames...). """
+        return self._module.stats()
+
+    def calibration(self) -> Calibration:
+        """ Returns the camera intrinsics: factory intrinsics of the device when `[Camera] calibration` is `factory` and the device
+        provides them, otherwise the calibration of the camera model and resolution of the section (`configuration/calibration.json`). """
+        if Configuration.get_config_param(self.section,'calibration') == 'factory':
+            calibration = self._module.calibration()
+            if calibration is not None:
+                return calibration
+        model_name = Configuration.get_config_param(self.section,'model')
+        width = int(Configuration.get_config_param(self.section,'width'))
+        height = int(Configuration.get_config_param(self.section,'height'))
+        return Calibration.load(model_name, width, height)
+
     def show_image(self, disp_name: str, image: numpy.ndarray) -> None:
         """  Displays the indicated image. """
         # Indicates the module to show an image
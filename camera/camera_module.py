@@ -1,4 +1,8 @@
 from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+from aruco.aruco import Aruco
 
 class CameraModule(ABC):
     """ Abstract camera module class (superclass in Camera Module hierarchy). This class provides abstract method definitions 
@@ -9,9 +13,23 @@ class CameraModule(ABC):
         """ Gets and returns a frame from camera."""
         pass
 
+    def get_frames(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Gets a frame for display and a frame for detection from the same capture. By default both are the same frame. """
+        frame = self.get_frame()
+        return frame, frame
+
+    def read_into(self, out: np.ndarray) -> bool:
+        """ Reads the lastest frame into the preallocated array (ex. a `SharedFramePool` slot). Returns `False` if there is no frame.
+        By default the frame is copied; modules that can decode into a given buffer override it. """
+        frame = self.get_frame()
+        if frame is None:
+            return False
+        np.copyto(out, frame)
+        return True
+
     @abstractmethod
     def show_image(self) -> None:
-        """ Displays an image."""
+        """ Displays an image. The window is updated by the display events poll of the main loop (`CommandDispatcher.poll`)."""
         pass
 
     @abstractmethod
@@ -23,3 +41,32 @@ class CameraModule(ABC):
     def close_image(self) -> None:
         """ Closes the image window with the specified name. """
         pass
+
+    def calibration(self) -> Any:
+        """ Returns the factory intrinsics of the camera (`Calibration`), or `None` if the device does not provide them. """
+        return None
+
+    def map_detections(self, arucos: List[Aruco], marker_length: float) -> List[Aruco]:
+        """ Maps the Arucos detected in the detection frame to the display frame. By default both frames are the same image. """
+        return arucos
+
+    def detection_registered(self) -> bool:
+        """ Returns `True` if the pixels of the detection frame match the display frame (by default both frames are the same image).
+        Otherwise detections are mapped with `map_detections` and regions of interest of the display frame do not apply. """
+        return True
+
+    def frame_info(self) -> Dict[str, Any]:
+        """ Returns the capture info (frame number, hardware timestamp...) of the last frame, if the device provides it. """
+        return {}
+
+    def sensor_latency(self) -> float:
+        """ Returns the time (ms) since the sensor timestamp of the last frame, or `None` if the device does not provide host time timestamps. """
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """ Returns the capture counters (received, dropped frames...), if the device provides them. """
+        return {}
+
+    def finished(self) -> bool:
+        """ Returns `True` if the source has no more frames (recorded sources). """
+        return False
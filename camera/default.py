@@ -13,18 +13,18 @@ class VideoDeviceNotFoundError(Exception):
 class DefaultCamera(CameraModule):
     """ OpenCV2 default videocapture module class. Subclass of CameraModule. """
 
-    def __init__(self) -> None:
-        """ Camera initialization. Gets the video source and sets a video capture. """
+    def __init__(self, section: str = "Camera") -> None:
+        """ Camera initialization. Gets the video source of the config.ini section and sets a video capture. """
         super().__init__()
         # Sets the VideoCapture
         try: 
             # Video source setting
-            self._source = int(Configuration.get_config_param("Camera","source"))
+            self._source = int(Configuration.get_config_param(section,"source"))
             self._videoCapture = cv2.VideoCapture(self._source)
             # self._screen = screeninfo.get_monitors()[self._source]
             # Gets the camera resolution parameters
-            width_res = int(Configuration.get_config_param("Camera","width"))
-            height_res = int(Configuration.get_config_param("Camera","height"))
+            width_res = int(Configuration.get_config_param(section,"width"))
+            height_res = int(Configuration.get_config_param(section,"height"))
             # Sets the resolution of display
             self._videoCapture.set(cv2.CAP_PROP_FRAME_WIDTH,width_res)
             self._videoCapture.set(cv2.CAP_PROP_FRAME_HEIGHT,height_res)
@@ -50,13 +50,20 @@ class DefaultCamera(CameraModule):
         retval, frame = self._videoCapture.read()
         # Returns image
         return frame
+
+    def read_into(self, out: numpy.ndarray) -> bool:
+        """ Decodes the lastest frame directly into the preallocated array (same shape as the capture frames). """
+        retval, frame = self._videoCapture.read(out)
+        if retval and frame is not out:
+            # OpenCV reallocated the frame (array layout differs from the capture): copied, raises if the shape differs
+            numpy.copyto(out, frame)
+        return retval
     
     def show_image(self, disp_name: str, image: numpy.ndarray) -> None:
         """  Displays the image given using cv2 module. """
         # Display the resulting frame
         cv2.imshow(disp_name,image)
         # cv2.moveWindow(disp_name,int(self._screen.x/2)-1,int(self._screen.y/2)-1)
-        cv2.waitKey(1) # Waits 1ms
 
     def close_all_images(self) -> None:
         """ Closes all image show windows. """
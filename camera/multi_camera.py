@@ -0,0 +1,204 @@
+import multiprocessing
+import os
+from queue import Empty
+from time import perf_counter, sleep
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+from aruco.aruco import Aruco
+from aruco.dictionary_scheduler import DictionaryScheduler
+from camera.calibration import Calibration
+from camera.camera_controller import Camera
+from camera.realsense import INFRARED
+from camera.shared_frames import SharedFrame, SharedFramePool, SlotsExhaustedError
+from configuration.configuration import Configuration
+
+# Default frame slots per camera (frames captured and not yet displayed; further frames are dropped)
+DEFAULT_SLOTS = 4
+# Period (s) of the worker stats messages
+STATS_INTERVAL = 1.0
+# Time (s) waited for the camera workers to open their devices
+START_TIMEOUT = 30
+# Wait (s) of the camera workers when the camera has no new frame
+IDLE_WAIT = 0.002
+
+# Worker messages
+_CALIBRATION = "calibration"
+_FRAME = "frame"
+_STATS = "stats"
+_END = "end"
+
+def camera_sections() -> List[str]:
+    """ Returns the config.ini sections of the cameras (`[General] cameras`, comma separated; `[Camera]` if not set). """
+    cameras = Configuration.get_config_param("General","cameras")
+    return [section.strip() for section in cameras.split(",") if section.strip()] if cameras else ["Camera"]
+
+def parse_affinity(value: str) -> List[int]:
+    """ Returns the CPUs of an affinity setting (ex. `2,3` or `4-7`), or an empty list if not set. """
+    cpus = []
+    for part in (value or "").split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def set_affinity(cpus: List[int]) -> bool:
+    """ Pins the calling process to the CPUs (`os.sched_setaffinity`, or `psutil` where it is not available, ex. Windows). Returns
+    `True` if the affinity was set. """
+    if not cpus:
+        return False
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        return True
+    try:
+        import psutil
+    except ImportError:
+        print("[Camera Module]:  CPU affinity requires psutil on this platform.")
+        return False
+    psutil.Process().cpu_affinity(cpus)
+    return True
+
+def _camera_worker(section: str, pool: SharedFramePool, obj_map_path: str, sweep_interval: int, output: Any, stop: Any) -> None:
+    """ Capture worker process of a camera: captures the frames into the shared frame slots, detects the Arucos (poses are estimated
+    by the renderer trackers) and sends the frame references with the detections. Frames are dropped while all the slots are used. """
+    set_affinity(parse_affinity(Configuration.get_config_param(section,"affinity")))
+    camera = Camera(section)
+    output.put((_CALIBRATION, section, camera.calibration()))
+    scheduler = DictionaryScheduler(obj_map_path, sweep_interval=sweep_interval)
+    # Frame dropped while the slots are used (keeps live streams current)
+    scratch = np.empty(pool.shape, dtype=pool.dtype)
+    stats = {"captured": 0, "dropped": 0, "detect_ms": 0.0}
+    stats_time, stats_frames, detect_time = perf_counter(), 0, 0.0
+    while not stop.is_set():
+        try:
+            frame = camera.capture(pool)
+        except SlotsExhaustedError:
+            if camera.read_into(scratch):
+                stats["dropped"] += 1
+            else:
+                sleep(IDLE_WAIT)
+            continue
+        if frame is None:
+            if camera.finished():
+                break
+            # No new frame yet: waits briefly instead of polling again
+            sleep(IDLE_WAIT)
+            continue
+        detection_start = perf_counter()
+        arucos = scheduler.detect(pool.view(frame), estimate_pose=False)
+        detect_time += perf_counter() - detection_start
+        stats["captured"] += 1
+        stats_frames += 1
+        output.put((_FRAME, section, frame, arucos))
+        if perf_counter() - stats_time >= STATS_INTERVAL:
+            stats["capture_fps"] = stats_frames/(perf_counter() - stats_time)
+            stats["detect_ms"] = detect_time/stats_frames*1000
+            output.put((_STATS, section, dict(stats)))
+            stats_time, stats_frames, detect_time = perf_counter(), 0, 0.0
+    # Final counters
+    output.put((_STATS, section, dict(stats)))
+    output.put((_END, section, None))
+    pool.close()
+
+class MultiCamera():
+    """ Concurrent cameras, one per config.ini section. Each camera runs in its own worker process (pinned to the CPUs of its `affinity`
+    setting) with its own detector, and writes its frames into its own `SharedFramePool`; the frames reach the rendering process as
+    shared memory views with their detections. Constructor params:
+        * sections: Camera sections (see `camera_sections`). The `width` and `height` of each section must match its stream resolution.
+        Detection runs on the BGR frame of the shared slot: a `gray` `detection_stream` is converted from YUYV into the slot, and
+        `infrared` (not registered with the color frame) is not supported
+        * obj_map_path: Path to the JSON OBJ map (detected dictionaries)
+        * sweep_interval: Frames between full dictionary sweeps of the detectors
+
+    Call `start`, then `poll` the frames and `release` each one once displayed. `stats` reports the capture, detection and display
+    rates of each camera.
+    """
+
+    def __init__(self, sections: List[str], obj_map_path: str, sweep_interval: int = 30) -> None:
+        self.sections = sections
+        self.calibrations = {}
+        self._pools = {}
+        for section in sections:
+            if Configuration.get_config_param(section,"detection_stream") == INFRARED:
+                raise ValueError(f"[{section}] detection_stream = {INFRARED} is not supported with several cameras")
+            width, height = int(Configuration.get_config_param(section,"width")), int(Configuration.get_config_param(section,"height"))
+            slots = Configuration.get_config_param(section,"slots")
+            self._pools[section] = SharedFramePool((height, width, 3), slots=int(slots) if slots else DEFAULT_SLOTS)
+        self._output = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        self._workers = {section: multiprocessing.Process(target=_camera_worker, args=(section, self._pools[section], obj_map_path, sweep_interval, self._output, self._stop), daemon=True)
+                         for section in sections}
+        self._ended = set()
+        self._stats = {section: {} for section in sections}
+        self._displayed = {section: [0, perf_counter()] for section in sections}
+
+    def start(self) -> Dict[str, Calibration]:
+        """ Starts the camera workers and waits for their devices. Returns the calibration of each camera. """
+        for worker in self._workers.values():
+            worker.start()
+        while len(self.calibrations) + len(self._ended) < len(self.sections):
+            message = self._output.get(timeout=START_TIMEOUT)
+            kind, section = message[:2]
+            if kind == _CALIBRATION:
+                self.calibrations[section] = message[2]
+            elif kind == _END:
+                self._ended.add(section)
+            elif kind == _FRAME:
+                # Frames captured while the other cameras start are dropped
+                self._pools[section].release(message[2])
+        return self.calibrations
+
+    def poll(self, timeout: float = 0.1) -> Tuple[str, SharedFrame, np.ndarray, List[Aruco]]:
+        """ Returns the next captured frame of any camera: section, frame reference (held by the caller), frame view and detected
+        Arucos. Returns `None` if no frame arrived within `timeout` seconds. """
+        deadline = perf_counter() + timeout
+        while True:
+            try:
+                message = self._output.get(timeout=max(deadline - perf_counter(), 0))
+            except Empty:
+                return None
+            kind, section = message[:2]
+            if kind == _FRAME:
+                frame, arucos = message[2:]
+                return section, frame, self._pools[section].view(frame), arucos
+            if kind == _STATS:
+                self._stats[section].update(message[2])
+            elif kind == _END:
+                self._ended.add(section)
+
+    def release(self, section: str, frame: SharedFrame) -> None:
+        """ Releases a polled frame (its slot is recycled for the next captures) and counts it as displayed. """
+        self._pools[section].release(frame)
+        self._displayed[section][0] += 1
+
+    def finished(self) -> bool:
+        """ Returns `True` once all the cameras have ended (recorded sources). """
+        return len(self._ended) == len(self.sections)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """ Returns the capture rate, detection time, captured and dropped frames, and display rate (since the last call) of each camera. """
+        stats = {}
+        for section in self.sections:
+            displayed, since = self._displayed[section]
+            stats[section] = {**self._stats[section], "display_fps": displayed/(perf_counter() - since)}
+            self._displayed[section] = [0, perf_counter()]
+        return stats
+
+    def close(self) -> None:
+        """ Stops the camera workers and destroys the shared frame pools. """
+        self._stop.set()
+        # Workers only exit once their queued messages are consumed
+        deadline = perf_counter() + START_TIMEOUT/6
+        while not self.finished() and perf_counter() < deadline:
+            polled = self.poll()
+            if polled is not None:
+                self._pools[polled[0]].release(polled[1])
+        for worker in self._workers.values():
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        for pool in self._pools.values():
+            pool.unlink()
@@ -0,0 +1,199 @@
+from camera.camera_module import CameraModule
+from configuration.configuration import Configuration
+from typing import Any, Dict, Iterator
+from threading import Thread, Event
+from queue import Queue, Full
+from time import perf_counter, sleep
+import atexit
+import glob
+import os
+import cv2
+import numpy
+
+# Frame extensions of image sequences
+SEQUENCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+# Pacing modes: recorded frame rate (late frames are dropped, as a live camera) or as fast as possible
+REALTIME = "realtime"
+FAST = "fast"
+# Default frame rate of image sequences and videos without frame rate
+DEFAULT_FPS = 30
+# Default number of frames decoded ahead (0 -> all the frames are decoded once and kept in memory)
+DEFAULT_PREFETCH = 32
+
+class PlaybackSourceError(Exception):
+    """ The video file or image sequence could not be opened. """
+
+class PlaybackCamera(CameraModule):
+    """ Video file and image sequence playback module class. Subclass of CameraModule. Frames are decoded ahead by a decoder thread.
+    Configuration (`[Camera]` section, or the section given to the constructor):
+        * path: Video file or directory of frames (sorted by name)
+        * pacing: `realtime` (recorded frame rate, late frames are dropped) or `fast` (every frame, as fast as possible)
+        * loop: Restarts the playback at the end
+        * prefetch: Number of frames decoded ahead. If 0, all the frames are decoded once and kept in memory
+        * display: Shows the images. Set to `false` for headless runs
+    """
+
+    def __init__(self, section: str = "Camera") -> None:
+        """ Opens the source and starts the decoder thread. """
+        super().__init__()
+        self._path = Configuration.get_config_param(section,"path")
+        if not self._path or not os.path.exists(self._path):
+            raise PlaybackSourceError(self._path)
+        self._pacing = Configuration.get_config_param(section,"pacing") or REALTIME
+        self._loop = (Configuration.get_config_param(section,"loop") or "true").lower() == "true"
+        self._display = (Configuration.get_config_param(section,"display") or "true").lower() == "true"
+        prefetch = int(Configuration.get_config_param(section,"prefetch") or DEFAULT_PREFETCH)
+        # Image sequence or video file
+        self._sequence = sorted(path for path in glob.glob(os.path.join(self._path,"*")) if path.lower().endswith(SEQUENCE_EXTENSIONS)) if os.path.isdir(self._path) else None
+        self.fps = DEFAULT_FPS
+        if self._sequence is None:
+            video_capture = cv2.VideoCapture(self._path)
+            if not video_capture.isOpened():
+                raise PlaybackSourceError(self._path)
+            self.fps = video_capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+            video_capture.release()
+        elif not self._sequence:
+            raise PlaybackSourceError(self._path)
+        # Frames kept in memory (prefetch 0) or decoded ahead into a bounded queue
+        self._frames = list(self._decode()) if prefetch == 0 else None
+        self._queue = Queue(maxsize=max(prefetch, 1))
+        self._stop = Event()
+        self._decoder = None
+        if self._frames is None:
+            self._decoder = Thread(target=self._decode_loop, daemon=True)
+            self._decoder.start()
+            # The decoder must not be decoding while the interpreter shuts down
+            atexit.register(self.close)
+        # Playback state
+        self._index = -1
+        self._start = None
+        self._finished = False
+        self._frame_info = {}
+        self._stats = {"received": 0, "dropped": 0}
+        print(f"[Camera Module]:  Playing {self._path} at {self.fps} fps ({self._pacing}).")
+
+    def __del__(self) -> None:
+        """ Stops the decoder thread. """
+        self.close()
+
+    def close(self) -> None:
+        """ Stops the decoder thread and waits for it. """
+        self._stop.set()
+        if self._decoder is not None and self._decoder.is_alive():
+            self._decoder.join()
+
+    def _decode(self) -> Iterator[numpy.ndarray]:
+        """ Decodes all the frames of the source once. """
+        if self._sequence is not None:
+            for path in self._sequence:
+                frame = cv2.imread(path)
+                if frame is not None:
+                    yield frame
+        else:
+            video_capture = cv2.VideoCapture(self._path)
+            retval, frame = video_capture.read()
+            while retval:
+                yield frame
+                retval, frame = video_capture.read()
+            video_capture.release()
+
+    def _decode_loop(self) -> None:
+        """ Decoder thread: decodes the frames ahead into the queue (restarting at the end when looping). `None` marks the end, also
+        of sources without any readable frame. """
+        while not self._stop.is_set():
+            decoded = 0
+            for frame in self._decode():
+                if not self._put(frame):
+                    return
+                decoded += 1
+            if not self._loop or not decoded:
+                break
+        self._put(None)
+
+    def _put(self, frame: numpy.ndarray) -> bool:
+        """ Puts a frame in the queue, waiting while it is full. Returns `False` if the decoder was stopped. """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(frame, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _next_frame(self) -> numpy.ndarray:
+        """ Returns the next decoded frame, or `None` at the end of the source. Frames kept in memory are returned as is (see `get_frame`). """
+        self._index += 1
+        if self._frames is not None:
+            if self._index >= len(self._frames) and not self._loop:
+                return None
+            return self._frames[self._index % len(self._frames)] if self._frames else None
+        frame = self._queue.get()
+        if frame is None:
+            self._queue.put(None)
+        return frame
+
+    def get_frame(self) -> numpy.ndarray:
+        """ Returns the next frame of the playback, or `None` at the end of the source. With `realtime` pacing, waits until the frame
+        is due and drops the frames that are already late. The frame can be modified by the caller (frames kept in memory are copied). """
+        frame = self._play()
+        return frame.copy() if frame is not None and self._frames is not None else frame
+
+    def read_into(self, out: numpy.ndarray) -> bool:
+        """ Reads the next frame of the playback into the preallocated array. Returns `False` at the end of the source. """
+        frame = self._play()
+        if frame is None:
+            return False
+        numpy.copyto(out, frame)
+        return True
+
+    def _play(self) -> numpy.ndarray:
+        """ Returns the next frame of the playback (paced, see `get_frame`), without copying the frames kept in memory. """
+        if self._finished:
+            return None
+        if self._start is None:
+            self._start = perf_counter()
+        frame = self._next_frame()
+        if self._pacing == REALTIME and frame is not None:
+            due = int((perf_counter() - self._start)*self.fps)
+            # Drops late frames, as a live camera would
+            while self._index < due and frame is not None:
+                frame = self._next_frame()
+                self._stats["dropped"] += 1
+            # Waits until the frame is due
+            delay = self._start + self._index/self.fps - perf_counter()
+            if delay > 0:
+                sleep(delay)
+        if frame is None:
+            self._finished = True
+            return None
+        self._stats["received"] += 1
+        self._frame_info = {"frame_number": self._index, "timestamp": self._index/self.fps*1000}
+        return frame
+
+    def finished(self) -> bool:
+        """ Returns `True` once the source has ended (without looping). """
+        return self._finished
+
+    def frame_info(self) -> Dict[str, Any]:
+        """ Returns the frame number and the source timestamp (ms) of the last frame. """
+        return dict(self._frame_info)
+
+    def stats(self) -> Dict[str, int]:
+        """ Returns the played and dropped (late) frames counters. """
+        return dict(self._stats)
+
+    def show_image(self, disp_name: str, image: numpy.ndarray) -> None:
+        """  Displays the image given using cv2 module (unless `display` is disabled). """
+        if not self._display:
+            return
+        cv2.imshow(disp_name,image)
+
+    def close_all_images(self) -> None:
+        """ Closes all image show windows. """
+        if self._display:
+            cv2.destroyAllWindows()
+
+    def close_image(self, disp_name: str) -> None:
+        """ Closes the image window with the specified name. """
+        if self._display:
+            cv2.destroyWindow(disp_name)
@@ -0,0 +1,209 @@
+import pyrealsense2 as rs2
+from aruco.aruco import Aruco
+from camera.camera_module import CameraModule
+from camera.calibration import Calibration
+from configuration.configuration import Configuration
+from typing import Dict, List, Tuple, Any
+from time import time
+import numpy as np
+import cv2
+
+# Detection streams: color frame (detector converts it to gray), gray plane of a YUYV color stream or Y8 infrared stream
+COLOR = "color"
+GRAY = "gray"
+INFRARED = "infrared"
+DETECTION_STREAMS = (COLOR, GRAY, INFRARED)
+
+# Default number of framesets kept in the frame queue (older ones are dropped when full)
+QUEUE_CAPACITY = 2
+
+class RealSenseCamera(CameraModule):
+    """ IntelRealsense© camera module base class. Subclass of CameraModule. Streams color frames for display and, depending on
+    `[Camera] detection_stream`, a single channel frame for detection from the same frameset (shared timestamps):
+        * `color`: The detection frame is the BGR color frame
+        * `gray`: The color sensor streams YUYV and detection gets its luma plane, without any BGR to gray conversion
+        * `infrared`: A Y8 infrared stream (at the infrared resolution of the model) is opened alongside the color stream. The infrared
+        imager is not registered with the color sensor: `map_detections` maps the markers detected in the infrared image to the color
+        image, and regions of interest are not mapped back (see `detection_registered`)
+
+    Framesets are delivered to a `rs2.frame_queue` of `[Camera] queue_capacity` framesets and polled without blocking: `get_frames`
+    returns the newest frameset (older queued ones are dropped), or `None` frames when no new frameset arrived. The hardware timestamp and frame number of the last frameset are reported by
+    `frame_info`, and the received, dropped (frame number gaps) and empty polls counters by `stats`.
+
+    Constructor params:
+        * width: Color stream width
+        * height: Color stream height
+        * framerate: Streams frame rate
+        * section: config.ini section of the camera (`[Camera]` by default). Its `serial` selects the device when several are connected
+        * infrared_resolution: Infrared stream (width, height) of `infrared` detection (the color resolution if not set)
+    """
+
+    def __init__(self, width: int, height: int, framerate: int, section: str = "Camera", infrared_resolution: Tuple[int, int] = None) -> None:
+        """ Camera initial configuration and pipeline creation. Raises `RuntimeError` if no device was found. """
+        super().__init__()
+        # Video source setting
+        self._source = int(Configuration.get_config_param(section,"source"))
+        # Detection stream
+        self._detection_stream = Configuration.get_config_param(section,"detection_stream") or COLOR
+        # Frame queue (latest framesets) and frame counters
+        self._queue = rs2.frame_queue(int(Configuration.get_config_param(section,"queue_capacity") or QUEUE_CAPACITY), keep_frames=True)
+        self._frame_info = {}
+        self._stats = {"received": 0, "dropped": 0, "empty_polls": 0}
+        # Creates a interactive instance to communicate with the camera
+        self._pipeline = rs2.pipeline()
+        # Gets the default configuration for pipelines
+        self._config = rs2.config()
+        # Device of the camera section (first device found if not set)
+        serial = Configuration.get_config_param(section,"serial")
+        if serial:
+            self._config.enable_device(serial)
+        # Sets the stream type, camera resolution and format
+        if self._detection_stream == GRAY:
+            self._config.enable_stream(rs2.stream.color, width, height, rs2.format.yuyv, framerate)
+        else:
+            self._config.enable_stream(rs2.stream.color, width, height, rs2.format.bgr8, framerate)
+        if self._detection_stream == INFRARED:
+            infrared_width, infrared_height = infrared_resolution or (width, height)
+            self._config.enable_stream(rs2.stream.infrared, infrared_width, infrared_height, rs2.format.y8, framerate)
+        # Starts the pipeline streaming with the configuration added, delivering the framesets to the queue
+        profile = self._pipeline.start(self._config, self._queue)
+        # Hardware timestamps in host clock (global time) where supported
+        for sensor in profile.get_device().query_sensors():
+            if sensor.supports(rs2.option.global_time_enabled):
+                sensor.set_option(rs2.option.global_time_enabled, 1)
+        # Infrared to color mapping: intrinsics of both streams and extrinsics (rotation vector, translation) from infrared to color
+        if self._detection_stream == INFRARED:
+            infrared_profile = profile.get_stream(rs2.stream.infrared).as_video_stream_profile()
+            color_profile = profile.get_stream(rs2.stream.color).as_video_stream_profile()
+            self._infrared_calibration = Calibration.from_realsense(infrared_profile.get_intrinsics())
+            self._color_calibration = Calibration.from_realsense(color_profile.get_intrinsics())
+            extrinsics = infrared_profile.get_extrinsics_to(color_profile)
+            # Rotation matrix in column major order
+            self._extrinsics = (cv2.Rodrigues(np.float64(extrinsics.rotation).reshape(3, 3).T)[0], np.float64(extrinsics.translation))
+
+    def __del__(self) -> None:
+        """ Deletes the camera instance and stops the pipeline streaming."""
+        try:
+            # Stops the pipeline streaming
+            self._pipeline.stop()
+        except (RuntimeError, AttributeError):
+            pass
+
+    def _poll_frameset(self) -> rs2.composite_frame:
+        """ Returns the lastest frameset of the queue without blocking, or `None` if there is no new frameset. Older framesets left in
+        the queue are discarded (counted as dropped). Updates the frame info and counters. """
+        frame = self._queue.poll_for_frame()
+        if not frame:
+            self._stats["empty_polls"] += 1
+            return None
+        # The queue is FIFO: drains it up to the newest frameset
+        newer = self._queue.poll_for_frame()
+        while newer:
+            frame, newer = newer, self._queue.poll_for_frame()
+        frameset = frame.as_frameset()
+        frame_number = frameset.get_frame_number()
+        # Frames missing between consecutive framesets were dropped (queue overflow or transport)
+        if self._frame_info and frame_number > self._frame_info["frame_number"] + 1:
+            self._stats["dropped"] += frame_number - self._frame_info["frame_number"] - 1
+        self._stats["received"] += 1
+        self._frame_info = {"frame_number": frame_number, "timestamp": frameset.get_timestamp(), "domain": str(frameset.get_frame_timestamp_domain()).split(".")[-1], "arrival": time()*1000}
+        return frameset
+
+    def get_frames(self) -> Tuple[np.ndarray, np.ndarray]:
+        """ Polls the lastest frameset and returns the color frame (BGR) and the detection frame as Numpy arrays, or `None` frames if
+        there is no new frameset. The infrared detection frame is a zero-copy view of the frame data, the gray one is the luma plane
+        extracted from the YUYV data in a single pass. """
+        frameset = self._poll_frameset()
+        if frameset is None:
+            return None, None
+        color_frame = frameset.get_color_frame()
+        # Converts the color frame to a numpy array (no copy)
+        color = np.asanyarray(color_frame.get_data())
+        if self._detection_stream == GRAY:
+            # YUYV: luma of each pixel followed by an alternated chroma byte
+            yuyv = color.view(np.uint8).reshape(color_frame.get_height(), color_frame.get_width(), 2)
+            return cv2.cvtColor(yuyv, cv2.COLOR_YUV2BGR_YUYV), cv2.extractChannel(yuyv, 0)
+        if self._detection_stream == INFRARED:
+            return color, np.asanyarray(frameset.get_infrared_frame().get_data())
+        return color, color
+
+    def read_into(self, out: np.ndarray) -> bool:
+        """ Polls the lastest frameset and writes the BGR color frame into the preallocated array (YUYV frames are converted directly
+        into it). Returns `False` if there is no new frameset. """
+        frameset = self._poll_frameset()
+        if frameset is None:
+            return False
+        color_frame = frameset.get_color_frame()
+        color = np.asanyarray(color_frame.get_data())
+        if self._detection_stream == GRAY:
+            cv2.cvtColor(color.view(np.uint8).reshape(color_frame.get_height(), color_frame.get_width(), 2), cv2.COLOR_YUV2BGR_YUYV, dst=out)
+        else:
+            np.copyto(out, color)
+        return True
+
+    def map_detections(self, arucos: List[Aruco], marker_length: float) -> List[Aruco]:
+        """ Maps the Arucos detected in the infrared frame to the color frame: the marker pose is solved in the infrared camera, moved
+        to the color camera with the extrinsics and its corners projected with the color intrinsics. The mapped Arucos have no pose
+        (it is estimated again in the color frame). Other detection streams are the color frame itself. Params:
+            * arucos: Arucos detected in the detection frame
+            * marker_length: Length of physical Aruco marker in meters (depth of the markers)
+        """
+        if self._detection_stream != INFRARED:
+            return arucos
+        infrared, color = self._infrared_calibration, self._color_calibration
+        marker_points = np.float64([[-marker_length/2, marker_length/2, 0], [marker_length/2, marker_length/2, 0], [marker_length/2, -marker_length/2, 0], [-marker_length/2, -marker_length/2, 0]])
+        mapped = []
+        for aruco in arucos:
+            found, rotation, translation = cv2.solvePnP(marker_points, np.float64(aruco.corners).reshape(4, 1, 2), infrared.camera_matrix, infrared.distortion_coefficients, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+            if not found:
+                continue
+            # Marker corners in the infrared camera coordinates
+            points = marker_points @ cv2.Rodrigues(rotation)[0].T + translation.reshape(3)
+            corners = cv2.projectPoints(points, self._extrinsics[0], self._extrinsics[1], color.camera_matrix, color.distortion_coefficients)[0].reshape(4, 2)
+            mapped.append(Aruco(corners, None, None, aruco.dictionary, aruco.id))
+        return mapped
+
+    def detection_registered(self) -> bool:
+        """ Returns `False` for the infrared detection frame (not registered with the color frame without depth). """
+        return self._detection_stream != INFRARED
+
+    def frame_info(self) -> Dict[str, Any]:
+        """ Returns the frame number, hardware timestamp (ms), timestamp domain and host arrival time (ms) of the last frameset. """
+        return dict(self._frame_info)
+
+    def sensor_latency(self) -> float:
+        """ Returns the time (ms) since the sensor timestamp of the last frameset, or `None` if the timestamps are not in host time. """
+        if not self._frame_info or self._frame_info["domain"] not in ("global_time", "system_time"):
+            return None
+        return time()*1000 - self._frame_info["timestamp"]
+
+    def stats(self) -> Dict[str, int]:
+        """ Returns the received framesets, dropped frames and empty polls counters. """
+        return dict(self._stats)
+
+    def get_frame(self) -> np.ndarray:
+        """ Reads the lastest frame from the camera and returns it as a Numpy array. """
+        return self.get_frames()[0]
+
+    def calibration(self) -> Calibration:
+        """ Returns the factory intrinsics of the color stream (infrared detections are mapped to it, see `map_detections`). """
+        try:
+            profile = self._pipeline.get_active_profile().get_stream(rs2.stream.color).as_video_stream_profile()
+            return Calibration.from_realsense(profile.get_intrinsics())
+        except RuntimeError:
+            return None
+
+    def show_image(self, disp_name: str, image: np.ndarray) -> None:
+        """  Displays in a new window named as indicated the image given. """
+        # Shows the resulting frame
+        cv2.imshow(disp_name,image)
+
+    def close_all_images(self) -> None:
+        """ Closes all image show windows. """
+        # Closes all image windows
+        cv2.destroyAllWindows()
+
+    def close_image(self, disp_name: str) -> None:
+        """ Closes the image window with the specified name. """
+        # Closes all image windows
+        cv2.destroyWindow(disp_name)
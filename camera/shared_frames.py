@@ -0,0 +1,157 @@
+import multiprocessing
+from multiprocessing import shared_memory
+from time import perf_counter, sleep
+from typing import Any, Dict, Tuple
+import numpy as np
+
+# Default number of frame slots of a pool
+DEFAULT_SLOTS = 8
+# Polling period (s) while waiting for a free slot
+_WAIT_PERIOD = 0.0005
+
+class SlotsExhaustedError(Exception):
+    """ No free frame slot in the pool (all slots are referenced by consumers). """
+
+class StaleFrameError(Exception):
+    """ The frame slot was recycled: the shared frame reference is no longer valid. """
+
+class SharedFrame():
+    """ Reference to a frame held in a slot of a `SharedFramePool`. Small and picklable: it is the message sent through the queues
+    between processes instead of the frame. Attributes:
+        * slot: Slot index
+        * generation: Slot generation when the frame was written (checked against recycling)
+        * info: Capture info of the frame (frame number, timestamp...)
+    """
+
+    __slots__ = ("slot", "generation", "info")
+
+    def __init__(self, slot: int, generation: int, info: Dict[str, Any] = None) -> None:
+        self.slot = slot
+        self.generation = generation
+        self.info = info or {}
+
+    def __getstate__(self) -> Tuple[int, int, Dict[str, Any]]:
+        return self.slot, self.generation, self.info
+
+    def __setstate__(self, state: Tuple[int, int, Dict[str, Any]]) -> None:
+        self.slot, self.generation, self.info = state
+
+    def __repr__(self) -> str:
+        return f"SharedFrame(slot={self.slot}, generation={self.generation})"
+
+class SharedFramePool():
+    """ Pool of preallocated frame slots in a `multiprocessing.shared_memory` block, shared between the pipeline processes. A
+    producer acquires a free slot, writes the frame into it (ex. `Camera.read_into`) and sends the `SharedFrame` reference; consumers
+    get a Numpy view of the slot (no copy, no pickling of frames). Slots are reference counted: each holder releases its reference,
+    and the slot is recycled once no reference is left. Constructor params:
+        * shape: Frame shape (ex. `(1080, 1920, 3)`)
+        * dtype: Frame data type
+        * slots: Number of frame slots
+        * name: Shared memory block name (generated if not set)
+
+    The pool is passed to the worker processes as a `multiprocessing.Process` argument (it attaches to the same block and shares
+    the reference counts lock). The creator process must call `unlink` when the pipeline ends.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype: Any = np.uint8, slots: int = DEFAULT_SLOTS, name: str = None) -> None:
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slots = slots
+        self._lock = multiprocessing.Lock()
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=self._size())
+        self._owner = True
+        self._map()
+        self._counts[:] = 0
+        self._generations[:] = 0
+        # Next slot checked for acquisition (slots are recycled round-robin, so the latest frames stay readable)
+        self._cursor = 0
+
+    def _frame_bytes(self) -> int:
+        return int(np.prod(self.shape))*self.dtype.itemsize
+
+    def _size(self) -> int:
+        """ Block size: frame slots followed by the reference counts and the generations of the slots. """
+        return self.slots*self._frame_bytes() + self.slots*2*np.dtype(np.int64).itemsize
+
+    def _map(self) -> None:
+        """ Maps the frame slots, reference counts and generations arrays on the shared memory block. """
+        frames_bytes = self.slots*self._frame_bytes()
+        self._frames = np.ndarray((self.slots,) + self.shape, dtype=self.dtype, buffer=self._shm.buf)
+        self._counts = np.ndarray((self.slots,), dtype=np.int64, buffer=self._shm.buf, offset=frames_bytes)
+        self._generations = np.ndarray((self.slots,), dtype=np.int64, buffer=self._shm.buf, offset=frames_bytes + self.slots*np.dtype(np.int64).itemsize)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"shape": self.shape, "dtype": self.dtype, "slots": self.slots, "name": self._shm.name, "lock": self._lock}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        """ Attaches to the shared memory block of the pool in a worker process. """
+        self.shape, self.dtype, self.slots, self._lock = state["shape"], state["dtype"], state["slots"], state["lock"]
+        self._shm = shared_memory.SharedMemory(name=state["name"])
+        self._owner = False
+        self._map()
+        self._cursor = 0
+
+    @property
+    def name(self) -> str:
+        """ Shared memory block name. """
+        return self._shm.name
+
+    def acquire(self, timeout: float = 0) -> Tuple[SharedFrame, np.ndarray]:
+        """ Acquires a free slot (reference count 1) for writing a frame. Waits up to `timeout` seconds for a free slot. Returns the
+        `SharedFrame` reference and the writable view of the slot. Raises `SlotsExhaustedError` if no slot was released in time. """
+        deadline = perf_counter() + timeout
+        while True:
+            with self._lock:
+                for i in range(self.slots):
+                    slot = (self._cursor + i) % self.slots
+                    if self._counts[slot] == 0:
+                        self._counts[slot] = 1
+                        self._generations[slot] += 1
+                        self._cursor = (slot + 1) % self.slots
+                        return SharedFrame(slot, int(self._generations[slot])), self._frames[slot]
+            if perf_counter() >= deadline:
+                raise SlotsExhaustedError(f"{self.slots} slots in use")
+            sleep(_WAIT_PERIOD)
+
+    def retain(self, frame: SharedFrame) -> SharedFrame:
+        """ Adds a reference to the frame (ex. before sending it to another consumer). Returns the frame. """
+        with self._lock:
+            self._check(frame)
+            self._counts[frame.slot] += 1
+        return frame
+
+    def release(self, frame: SharedFrame) -> None:
+        """ Removes a reference to the frame. The slot is recycled when no reference is left. """
+        with self._lock:
+            self._check(frame)
+            self._counts[frame.slot] -= 1
+
+    def view(self, frame: SharedFrame) -> np.ndarray:
+        """ Returns the Numpy view of the frame slot (no copy). Valid while the caller holds a reference to the frame. """
+        if self._generations[frame.slot] != frame.generation:
+            raise StaleFrameError(repr(frame))
+        return self._frames[frame.slot]
+
+    def references(self, frame: SharedFrame) -> int:
+        """ Returns the number of references to the frame slot. """
+        return int(self._counts[frame.slot])
+
+    def in_use(self) -> int:
+        """ Returns the number of slots holding referenced frames. """
+        return int(np.count_nonzero(self._counts))
+
+    def _check(self, frame: SharedFrame) -> None:
+        """ Raises `StaleFrameError` if the slot of the frame was recycled or released. """
+        if self._generations[frame.slot] != frame.generation or self._counts[frame.slot] <= 0:
+            raise StaleFrameError(repr(frame))
+
+    def close(self) -> None:
+        """ Detaches the process from the shared memory block (views of the slots must not be used afterwards). """
+        self._frames = self._counts = self._generations = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """ Detaches and destroys the shared memory block (creator process, once all the workers are done). """
+        self.close()
+        if self._owner:
+            self._shm.unlink()
@@ -1,6 +1,7 @@
 from configparser import ConfigParser
 import pathlib
 import os
+from typing import Dict
 
 # Config.ini file
 _CONFIG_PATH = os.path.join(str(pathlib.Path(__file__).parent.resolve()),"config.ini")
@@ -49,4 +50,15 @@ class Configuration:
             else:
                 raise ParameterNotFoundError(section, param)
         except ParameterNotFoundError:
-            print(f"[Error] Parameter {param} could not be found in Section{section}!")
\ No newline at end of file
+            print(f"[Error] Parameter {param} could not be found in Section{section}!")
+
+    @staticmethod
+    def get_config_section(section: str) -> Dict[str, str]:
+        """ Gets all the parameters of the section at the configuration file path specified (empty if there is no such section) """
+        # Creates the configParser
+        cp = ConfigParser()
+        # Reads the configuration file
+        cp.read(_CONFIG_PATH)
+        if not cp.has_section(section):
+            return {}
+        return dict(cp[section])
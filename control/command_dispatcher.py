@@ -0,0 +1,123 @@
+import socket
+import socketserver
+from queue import Queue, Empty
+from threading import Thread
+from typing import Any, Callable, Dict, List, Tuple
+
+import cv2
+
+# Command socket host (local connections only)
+HOST = "127.0.0.1"
+# Max commands dispatched per poll (the rest wait for the next frame)
+MAX_COMMANDS_PER_POLL = 16
+
+class UnknownCommandError(Exception):
+    """ The command is not registered in the dispatcher. """
+
+class CommandDispatcher():
+    """ Display input and show control commands of the main loop. Commands are registered by name with their handler, and reach
+    the loop from two sources:
+        * Keys: `poll` waits once for the display events (`cv2.waitKey`, the only one per displayed frame) and dispatches the
+        command of the pressed key in the keymap
+        * Local socket: text lines `<command> [args...]` sent to `127.0.0.1:<port>` (ex. `echo freeze | nc 127.0.0.1 5005`). The
+        server thread only queues them: they run on the loop thread, in the next `poll`, so no locking is needed by the handlers
+
+    Constructor params:
+        * keymap: Key -> command line (ex. `{"l": "set_active_animation dict3id15#0 launch"}`), see `[Keymap]`
+        * port: Command socket port (`None` or 0 -> no socket)
+        * keys: Polls the display events and keys. Set to `False` for headless runs (no windows)
+    """
+
+    def __init__(self, keymap: Dict[str, str] = None, port: int = None, keys: bool = True) -> None:
+        self.keys = keys
+        self.keymap = {ord(key): self.parse(line) for key, line in (keymap or {}).items() if key and line}
+        self._handlers = {}
+        # Commands received by the socket, dispatched by the loop thread
+        self._pending = Queue()
+        self._server = None
+        if port:
+            self._server = _CommandServer((HOST, port), self)
+            Thread(target=self._server.serve_forever, daemon=True).start()
+            print(f"[Commands]: Listening on {HOST}:{self._server.server_address[1]}")
+
+    @staticmethod
+    def parse(line: str) -> Tuple[str, List[str]]:
+        """ Returns the name and arguments of a command line. """
+        parts = line.split()
+        return parts[0], parts[1:]
+
+    def register(self, name: str, handler: Callable[..., Any]) -> None:
+        """ Registers the handler of a command. The handler receives the command line arguments (strings). """
+        self._handlers[name] = handler
+
+    def commands(self) -> List[str]:
+        """ Returns the registered command names. """
+        return sorted(self._handlers)
+
+    def dispatch(self, name: str, args: List[str] = ()) -> Any:
+        """ Runs a command on the calling thread. Raises `UnknownCommandError` if it is not registered. """
+        if name not in self._handlers:
+            raise UnknownCommandError(name)
+        return self._handlers[name](*args)
+
+    def submit(self, line: str) -> None:
+        """ Queues a command line for the next `poll` (any thread). Raises `UnknownCommandError` if it is not registered. """
+        name, args = self.parse(line)
+        if name not in self._handlers:
+            raise UnknownCommandError(name)
+        self._pending.put((name, args))
+
+    def poll(self, delay: int = 1) -> int:
+        """ Processes the display events once (waiting `delay` ms), dispatches the command of the pressed key and the queued socket
+        commands. Returns the pressed key code (-1 if none). """
+        key = cv2.waitKey(delay) if self.keys else -1
+        if key != -1 and key & 0xFF in self.keymap:
+            self._run(*self.keymap[key & 0xFF])
+        for _ in range(MAX_COMMANDS_PER_POLL):
+            try:
+                name, args = self._pending.get_nowait()
+            except Empty:
+                break
+            self._run(name, args)
+        return key
+
+    def _run(self, name: str, args: List[str]) -> None:
+        """ Dispatches a command, reporting its errors without stopping the loop. """
+        print(f"[Commands]: {' '.join([name] + list(args))}")
+        try:
+            self.dispatch(name, args)
+        except (UnknownCommandError, TypeError, ValueError) as error:
+            print(f"[Commands]: {name} {' '.join(args)} failed ({type(error).__name__}: {error})")
+
+    def close(self) -> None:
+        """ Stops the command socket. """
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    """ Command socket connection: queues each received line and answers `ok` or `error <reason>`. """
+
+    def handle(self) -> None:
+        for raw_line in self.rfile:
+            line = raw_line.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                self.server.dispatcher.submit(line)
+                self.wfile.write(b"ok\n")
+            except UnknownCommandError as error:
+                self.wfile.write(f"error unknown command {error}\n".encode())
+            except socket.error:
+                return
+
+class _CommandServer(socketserver.ThreadingTCPServer):
+    """ Local command socket server of a dispatcher. """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], dispatcher: CommandDispatcher) -> None:
+        self.dispatcher = dispatcher
+        super().__init__(address, _CommandHandler)
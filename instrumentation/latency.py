@@ -0,0 +1,117 @@
+import csv
+import json
+import cv2
+import numpy as np
+from time import perf_counter, time
+from typing import Dict, List, Any
+
+# Number of latest samples kept per span (rolling window)
+WINDOW = 512
+# Max number of span names (new names beyond it are ignored)
+MAX_SPANS = 256
+# Reported percentiles
+PERCENTILES = (50, 95, 99)
+
+class _NoSpan():
+    """ Span of a disabled recorder: does nothing. """
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+_NO_SPAN = _NoSpan()
+
+class _Span():
+    """ Timed span: records its duration on exit. """
+
+    __slots__ = ("_recorder", "_name", "_start")
+
+    def __init__(self, recorder: "LatencyRecorder", name: str) -> None:
+        self._recorder = recorder
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._start = perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._recorder.record(self._name, perf_counter() - self._start)
+
+class LatencyRecorder():
+    """ Named latency spans with rolling histograms. Each span keeps its latest `window` samples in a ring buffer, and the
+    percentiles are only computed on export, so recording costs a clock read and an array store. Disabled recorders hand out a
+    shared no-op span. Constructor params:
+        * enabled: Records the spans
+        * window: Number of latest samples kept per span
+    """
+
+    def __init__(self, enabled: bool = False, window: int = WINDOW) -> None:
+        self.enabled = enabled
+        self.window = window
+        # Ring buffers (name -> [samples array, samples count])
+        self._samples = {}
+        self._last_export = time()
+
+    def span(self, name: str) -> Any:
+        """ Returns a context manager timing the enclosed code as the named span. """
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def record(self, name: str, latency: float) -> None:
+        """ Records a latency sample (seconds) of the named span. """
+        if not self.enabled:
+            return
+        entry = self._samples.get(name)
+        if entry is None:
+            if len(self._samples) >= MAX_SPANS:
+                return
+            entry = self._samples[name] = [np.zeros(self.window), 0]
+        entry[0][entry[1] % self.window] = latency
+        entry[1] += 1
+
+    def clear(self) -> None:
+        """ Removes all the samples. """
+        self._samples = {}
+
+    def histograms(self) -> Dict[str, Dict[str, float]]:
+        """ Returns the count, mean and percentiles (ms) of the rolling window of each span. """
+        histograms = {}
+        for name, (samples, count) in sorted(self._samples.items()):
+            window = samples[:min(count, self.window)]*1000
+            histograms[name] = {"count": count, "mean_ms": float(window.mean()), **{f"p{q}_ms": float(value) for q, value in zip(PERCENTILES, np.percentile(window, PERCENTILES))}}
+        return histograms
+
+    def export(self, path: str) -> None:
+        """ Writes the histograms to a JSON or CSV (by extension) file. """
+        histograms = self.histograms()
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as csv_file:
+                writer = csv.writer(csv_file)
+                writer.writerow(["span", "count", "mean_ms"] + [f"p{q}_ms" for q in PERCENTILES])
+                for name, histogram in histograms.items():
+                    writer.writerow([name, histogram["count"], histogram["mean_ms"]] + [histogram[f"p{q}_ms"] for q in PERCENTILES])
+        else:
+            with open(path, "w") as json_file:
+                json.dump({"time": time(), "spans": histograms}, json_file, indent=4)
+
+    def export_every(self, path: str, interval: float) -> bool:
+        """ Exports the histograms if `interval` seconds passed since the last export. Returns `True` if exported. """
+        if not self.enabled or not path or time() - self._last_export < interval:
+            return False
+        self._last_export = time()
+        self.export(path)
+        return True
+
+    def draw_hud(self, image: np.ndarray, names: List[str] = None, origin: tuple = (10, 80)) -> np.ndarray:
+        """ Draws the p50/p95/p99 of the spans (all, or the given names) on the image. """
+        for line, (name, histogram) in enumerate((name, histogram) for name, histogram in self.histograms().items() if names is None or name in names):
+            text = f"{name}: {histogram['p50_ms']:.1f} / {histogram['p95_ms']:.1f} / {histogram['p99_ms']:.1f} ms"
+            cv2.putText(image, text, (origin[0], origin[1] + 22*line), fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=0.6, color=(0,255,255), thickness=1, lineType=cv2.LINE_AA)
+        return image
+
+# Process-wide recorder used by the pipeline stages (disabled until enabled by the application)
+recorder = LatencyRecorder()
+
+def span(name: str) -> Any:
+    """ Returns a context manager timing the enclosed code as the named span of the process-wide recorder. """
+    return recorder.span(name)
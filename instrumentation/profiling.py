@@ -0,0 +1,97 @@
+import cProfile
+import os
+import pstats
+import signal
+import tracemalloc
+from time import strftime
+from typing import Callable, Dict, Any
+
+# Default number of profiled frames per capture
+DEFAULT_FRAMES = 300
+# Number of allocation sites reported by the memory snapshots comparison
+TOP_ALLOCATIONS = 25
+
+class FrameProfiler():
+    """ On-demand profiler of the main loop. A request (key, signal or `request`) captures a cProfile window over the next frames,
+    with tracemalloc snapshots at its start and end, writes the stats files and resumes. While no capture is requested, `frame`
+    only checks a flag. Constructor params:
+        * output_dir: Directory of the stats files
+        * frames: Number of profiled frames per capture
+        * watch: Sizes to report at start and end of each capture (name -> callable, ex. `lambda: len(renderer.objs)`)
+
+    Each capture writes `profile_<time>.prof` (cProfile stats, see `pstats`/`snakeviz`) and `profile_<time>.txt` (top functions,
+    watched sizes and the allocation sites that grew the most).
+    """
+
+    def __init__(self, output_dir: str = "profiles", frames: int = DEFAULT_FRAMES, watch: Dict[str, Callable[[], Any]] = None) -> None:
+        self.output_dir = output_dir
+        self.frames = frames
+        self.watch = watch or {}
+        # Capture requested, actual capture profiler and state
+        self._requested = False
+        self._profile = None
+        self._remaining = 0
+        self._snapshot = None
+        self._watched = {}
+
+    def request(self, frames: int = None) -> None:
+        """ Requests a capture of the next frames (ignored while a capture is running). """
+        if self._profile is None:
+            self.frames = frames or self.frames
+            self._requested = True
+
+    def install_signal(self, signum: int = None) -> bool:
+        """ Requests a capture when the process receives the signal (`SIGUSR1` by default, not available on Windows). Returns `True` if installed. """
+        signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            return False
+        signal.signal(signum, lambda received, frame: self.request())
+        return True
+
+    @property
+    def active(self) -> bool:
+        """ `True` while a capture is running. """
+        return self._profile is not None
+
+    def frame(self) -> None:
+        """ Marks a new frame of the loop: starts a requested capture, or counts the frames of the running one. """
+        if not self._requested and self._profile is None:
+            return
+        if self._profile is None:
+            self._start()
+        else:
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self._stop()
+
+    def _start(self) -> None:
+        """ Starts the capture: memory snapshot and profiler. """
+        self._requested = False
+        self._remaining = self.frames
+        self._watched = {name: size() for name, size in self.watch.items()}
+        tracemalloc.start()
+        self._snapshot = tracemalloc.take_snapshot()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        print(f"[Profiler]: Profiling next {self.frames} frames")
+
+    def _stop(self) -> None:
+        """ Stops the capture and writes the stats files. """
+        self._profile.disable()
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile_{strftime('%Y%m%d_%H%M%S')}")
+        self._profile.dump_stats(f"{path}.prof")
+        with open(f"{path}.txt", "w") as report_file:
+            report_file.write(f"Profiled frames: {self.frames}\n\nWatched sizes (start -> end):\n")
+            for name, size in self.watch.items():
+                report_file.write(f"    {name}: {self._watched.get(name)} -> {size()}\n")
+            report_file.write(f"\nTop {TOP_ALLOCATIONS} allocation growths:\n")
+            for stat in snapshot.compare_to(self._snapshot, "lineno")[:TOP_ALLOCATIONS]:
+                report_file.write(f"    {stat}\n")
+            report_file.write("\nTop functions (cumulative time):\n")
+            pstats.Stats(self._profile, stream=report_file).sort_stats("cumulative").print_stats(30)
+        self._profile = None
+        self._snapshot = None
+        print(f"[Profiler]: Stats written to {path}.prof and {path}.txt")
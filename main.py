@@ -1,17 +1,36 @@
-# from configuration.configuration import Configuration
+from configuration.configuration import Configuration
 from aruco.aruco_detector import ArucoDetection
+from aruco.dictionary_scheduler import DictionaryScheduler
+from aruco.resolution_controller import ResolutionController
+from aruco.detection_recorder import DetectionRecorder
+from aruco.detection_governor import DetectionGovernor, FULL, ROI, NONE, CAPTURE, DETECT_FULL, DETECT_ROI, RENDER, DISPLAY
 from camera.camera_controller import Camera
+from camera.calibration import Calibration, UNDISTORT_IMAGE
+from camera.multi_camera import MultiCamera, camera_sections
 from augmentation.renderer import Renderer
+from instrumentation import latency
+from instrumentation.profiling import FrameProfiler
+from control.command_dispatcher import CommandDispatcher
+from pipeline.frame_server import FrameServer
 
 from typing import Tuple, List
+import sys
 import numpy as np
 
-from time import time
+from time import time, sleep
 import cv2
 
 from augmentation.aruco_tracker import ArucoTracker 
 
 MOVING_AVERAGE = False
+MARKER_LENGTH = 0.06
+GOVERNOR_REPORT_FRAMES = 300
+# Period (s) of the cameras stats report (several cameras)
+CAMERAS_REPORT_INTERVAL = 10
+# Displayed image scale
+DISPLAY_SCALE = 3/4
+# Wait (s) of the main loop when the camera has no new frame
+IDLE_WAIT = 0.002
 
 def moving_average_rotation(latest_rotation: Tuple[int, int, int], rotations: List[Tuple[int, int, int]], length: int = 5) -> Tuple[Tuple[int, int, int], List[Tuple[int, int, int]]]:
     """ Performs the moving average of Aruco rotation. Args: 
@@ -31,54 +50,272 @@ def moving_average_rotation(latest_rotation: Tuple[int, int, int], rotations: Li
     avg_rz = sum([rotation[2] for rotation in rotations])/len(rotations) # Z rotation
     return np.array([avg_rx, avg_ry, avg_rz]), rotations
 
+def display_resize(image: np.ndarray, display_image: np.ndarray = None, scale: float = DISPLAY_SCALE) -> np.ndarray:
+    """ Resizes the image into the preallocated display buffer, allocated again only if the image size changes. Args:
+        * `image`: Rendered image
+        * `display_image`: Display buffer of the previous frame (`None` on the first frame)
+        * `scale`: Display scale
+        Returns the display buffer with the resized image
+    """
+    size = (int(image.shape[0]*scale), int(image.shape[1]*scale)) + image.shape[2:]
+    if display_image is None or display_image.shape != size or display_image.dtype != image.dtype:
+        display_image = np.empty(size, dtype=image.dtype)
+    return cv2.resize(image, (size[1], size[0]), dst=display_image)
+
+def scaled_calibration(calibration: Calibration, undistort: str, width: int, height: int) -> Calibration:
+    """ Returns the intrinsics of the frames at their actual size. Args:
+        * `calibration`: Camera calibration (at the calibrated resolution, that may differ from the stream resolution)
+        * `undistort`: Undistortion mode (`[Camera] undistort`). Undistorted frames have no distortion coefficients
+        * `width`, `height`: Frame size
+    """
+    frame_calibration = calibration.scaled(width,height)
+    return frame_calibration.undistorted() if undistort == UNDISTORT_IMAGE else frame_calibration
+
+def displayed(section: str) -> bool:
+    """ Returns `True` if the frames of the camera section are shown in a window (`display`, shown if not set). """
+    return Configuration.get_config_param(section,"display") != "false"
+
+def create_dispatcher(renderers: List[Renderer], profiler: FrameProfiler = None, keys: bool = None) -> CommandDispatcher:
+    """ Creates the show control commands dispatcher (`[Keymap]` keys and `[Controls]` socket) of the renderers. Args:
+        * `renderers`: Renderers controlled by the commands
+        * `profiler`: Frame profiler of the `profile` command (optional)
+        * `keys`: Polls the display keys (`[Camera] display` if not set)
+        Returns the dispatcher, polled once per displayed frame
+    """
+    port = Configuration.get_config_param("Controls","port")
+    dispatcher = CommandDispatcher(Configuration.get_config_section("Keymap"),int(port) if port else None,keys=displayed("Camera") if keys is None else keys)
+    dispatcher.register("set_active_animation",lambda uid, animation: [renderer.set_active_animation(uid,animation) for renderer in renderers])
+    dispatcher.register("freeze",lambda: [renderer.freeze() for renderer in renderers])
+    if profiler is not None:
+        dispatcher.register("profile",lambda frames=None: profiler.request(int(frames) if frames else None))
+    return dispatcher
+
+def create_frame_server() -> FrameServer:
+    """ Creates the streaming server of the displayed frames (`[Streaming]`), or returns `None` if it is disabled. """
+    if Configuration.get_config_param("Streaming","enabled") != "true":
+        return None
+    return FrameServer(int(Configuration.get_config_param("Streaming","port") or 0),int(Configuration.get_config_param("Streaming","raw_port") or 0),
+                       workers=int(Configuration.get_config_param("Streaming","workers")),quality=int(Configuration.get_config_param("Streaming","quality")))
+
+def run_cameras(sections: List[str], obj_map_path: str) -> None:
+    """ Main loop of several concurrent cameras (`[General] cameras`). Each camera captures and detects in its own worker process
+    (`MultiCamera`); the frames are rendered here by a renderer per camera, that share the loaded OBJs if `[General] renderers` is
+    `shared`, and displayed in a window per camera. Args:
+        * `sections`: Camera sections of config.ini
+        * `obj_map_path`: Path to the JSON OBJ map
+    """
+    cameras = MultiCamera(sections,obj_map_path,sweep_interval=int(Configuration.get_config_param("Detection","sweep_interval")))
+    # Intrinsics at the frame size of each camera (its shared frame slots size)
+    calibrations = {section: scaled_calibration(calibration,None,int(Configuration.get_config_param(section,"width")),int(Configuration.get_config_param(section,"height")))
+                    for section, calibration in cameras.start().items()}
+    print(f"[ARN-Ethwork]: Cameras ON {list(calibrations)}")
+
+    budget_ms = float(Configuration.get_config_param("Renderer","budget"))
+    renderers = {section: Renderer(obj_map_path,preload=False,budget_ms=budget_ms,marker_length=MARKER_LENGTH,calibration=calibration) for section, calibration in calibrations.items()}
+    if Configuration.get_config_param("General","renderers") == "shared":
+        # OBJs loaded once for all the cameras (each camera keeps its own tracker and register)
+        objs = next(iter(renderers.values())).objs
+        for renderer in renderers.values():
+            renderer.objs = objs
+    # Sections shown in a window (keys are polled if any window is shown)
+    windows = [section for section in sections if displayed(section)]
+    dispatcher = create_dispatcher(list(renderers.values()),keys=bool(windows))
+    # Stream of each camera (named as its section)
+    frame_server = create_frame_server()
+
+    # Display buffer of each camera
+    display_images = {}
+    report_time = time()
+    try:
+        while not cameras.finished():
+            polled = cameras.poll()
+            if polled is None:
+                continue
+            # Frame view of the camera shared frame slot
+            section, frame, image, arucos = polled
+            if arucos:
+                renderers[section].render(image,arucos)
+                calibration = calibrations[section]
+                ArucoDetection.draw_detected_markers(image, arucos, marker_length=MARKER_LENGTH, matrix_coefficients=calibration.camera_matrix, distortion_coefficients=calibration.distortion_coefficients, in_place=True)
+            display_images[section] = display_resize(image,display_images.get(section))
+            if section in windows:
+                cv2.imshow(section,display_images[section])
+            dispatcher.poll()
+            if frame_server is not None:
+                frame_server.publish(display_images[section],section)
+            cameras.release(section,frame)
+
+            if time()-report_time >= CAMERAS_REPORT_INTERVAL:
+                print(f"[ARN-Ethwork]: Cameras {cameras.stats()}")
+                report_time = time()
+    finally:
+        cameras.close()
+        dispatcher.close()
+        if frame_server is not None:
+            frame_server.close()
+        if windows:
+            cv2.destroyAllWindows()
+
 
 if __name__ == "__main__":
 
     obj_map_path = "C:\\Users\\egeah\\ArN-ethwork\\augmentation\\objs.json"
-    renderer = Renderer(obj_map_path,preload=False)
-    print("[ARN-Ethwork]: OBJs loaded")
+
+    # Several cameras: concurrent camera workers
+    sections = camera_sections()
+    if len(sections) > 1:
+        run_cameras(sections,obj_map_path)
+        sys.exit()
 
     camera = Camera()
     print("[ARN-Ethwork]: Camera ON")
 
+    # Camera intrinsics: frames are undistorted once with cached remap tables, or distortion is applied to corners by pose estimation and projection
+    calibration = camera.calibration()
+    # Detection frames not registered with the displayed frame (infrared stream): detections are mapped to it
+    detection_registered = camera.detection_registered()
+    # Intrinsics at the configured stream size, scaled again to the first frame size if it differs
+    undistort = Configuration.get_config_param("Camera","undistort")
+    frame_calibration = scaled_calibration(calibration,undistort,int(Configuration.get_config_param("Camera","width")),int(Configuration.get_config_param("Camera","height")))
+
+    budget_ms = float(Configuration.get_config_param("Renderer","budget"))
+    renderer = Renderer(obj_map_path,preload=False,budget_ms=budget_ms,marker_length=MARKER_LENGTH,calibration=frame_calibration)
+    print("[ARN-Ethwork]: OBJs loaded")
+
+    # Detected dictionaries derived from the OBJ map
+    scheduler = DictionaryScheduler(obj_map_path,sweep_interval=int(Configuration.get_config_param("Detection","sweep_interval")))
+
+    # Detection scale controller
+    resolution = ResolutionController(float(Configuration.get_config_param("Detection","target_latency")))
+
+    # Detection frame-skipping governor
+    governor = DetectionGovernor(float(Configuration.get_config_param("Detection","target_fps")))
+
+    # Latency spans of the pipeline stages, exported periodically and optionally drawn on screen
+    latency.recorder.enabled = Configuration.get_config_param("Instrumentation","enabled") == "true"
+    latency_export = Configuration.get_config_param("Instrumentation","export")
+    latency_interval = float(Configuration.get_config_param("Instrumentation","export_interval"))
+    latency_hud = Configuration.get_config_param("Instrumentation","hud") == "true"
+
+    # On-demand profiling ('p' key or SIGUSR1) of the next frames, watching the renderer caches growth
+    profiler = FrameProfiler(Configuration.get_config_param("Instrumentation","profile_dir"),int(Configuration.get_config_param("Instrumentation","profile_frames")),
+                             watch={"renderer.objs": lambda: len(renderer.objs), "renderer.register": lambda: len(renderer.register)})
+    profiler.install_signal()
+
+    # Show control commands (keys and local socket), dispatched once per displayed frame
+    dispatcher = create_dispatcher([renderer],profiler)
+
+    # Streaming of the displayed frames (MJPEG and raw frames, encoded off the loop)
+    frame_server = create_frame_server()
+
+    # Detections recorder (replayed by benchmarks.replay_detections), created with the size of the first recorded frame
+    recording = Configuration.get_config_param("Recorder","enabled") == "true"
+    recorder = None
+
     # rotations = {} # Initial rotations array
 
     tracker = ArucoTracker()
 
     resize_factor = 4
 
+    # Display buffer (reused while the frame size does not change)
+    display_image = None
+
     while True:
 
         frame_time = time()
 
-        image = camera.get_frame()
+        # Display frame and detection frame (gray/infrared stream, no BGR to gray conversion)
+        image, detection_image = camera.get_frames()
+        if image is None:
+            if camera.finished():
+                # End of recorded source
+                break
+            # No new frame yet: waits briefly instead of polling again
+            sleep(IDLE_WAIT)
+            continue
+        profiler.frame()
+        if undistort == UNDISTORT_IMAGE:
+            same_frame = detection_image is image
+            image = calibration.undistort_image(image)
+            # Frames not registered with the displayed frame (infrared) are kept raw, as `map_detections` expects
+            detection_image = image if same_frame else (calibration.undistort_image(detection_image) if detection_registered else detection_image)
+        governor.record(CAPTURE,time()-frame_time)
 
-        if image is not None: 
-            
-            # arucos = ArucoDetection.detect(image,marker_length=0.06)
-            arucos = ArucoDetection.detect(image,dictionaries=[3],marker_length=0.06,optimized=True)
+        if frame_calibration.resolution != (image.shape[1],image.shape[0]):
+            frame_calibration = scaled_calibration(calibration,undistort,image.shape[1],image.shape[0])
+            renderer.set_calibration(frame_calibration)
 
-            if arucos:
-                image = ArucoDetection.draw_detected_markers(image, arucos)
+        latency.recorder.record("capture",time()-frame_time)
+
+        # arucos = ArucoDetection.detect(image,marker_length=0.06)
+        detection_time = time()
+        mode, rois = governor.decide(renderer.tracker,image.shape)
+        if mode == ROI and not detection_registered:
+            # Regions of the displayed frame do not apply to the detection frame
+            mode = FULL
+        if mode == FULL:
+            arucos = scheduler.detect(detection_image,scale=resolution.scale(),estimate_pose=False)
+            resolution.update(time()-detection_time,arucos,renderer.tracker)
+            governor.record(DETECT_FULL,time()-detection_time)
+        elif mode == ROI:
+            arucos = scheduler.detect(detection_image,rois=rois,estimate_pose=False)
+            governor.record(DETECT_ROI,time()-detection_time)
+        else:
+            # Reuses tracker poses
+            arucos = governor.tracked_arucos(renderer.tracker)
+        if mode != NONE and not detection_registered:
+            arucos = camera.map_detections(arucos,MARKER_LENGTH)
+            if undistort == UNDISTORT_IMAGE:
+                for aruco in arucos:
+                    aruco.corners = calibration.scaled(image.shape[1],image.shape[0]).undistort_points(aruco.corners)
+
+        if recording:
+            # Detections (before rendering) and the downsampled frame of every frame. Mapped detections belong to the displayed frame
+            recorded_image = detection_image if detection_registered else image
+            if recorder is None:
+                frame_scale = float(Configuration.get_config_param("Recorder","frame_scale"))
+                recorder = DetectionRecorder(Configuration.get_config_param("Recorder","path"),(recorded_image.shape[1],recorded_image.shape[0]),frame_scale=frame_scale or None)
+            recorder.record(arucos,frame_time,recorded_image,skipped=mode == NONE)
+
+        if arucos:
+            # Poses are refined by the renderer tracker
+            render_time = time()
+            updates = renderer.render(image,arucos)
+            governor.record(RENDER,time()-render_time)
+            if mode != NONE:
+                governor.update_motion(updates)
 
-                renderer.render(image,arucos)
+            ArucoDetection.draw_detected_markers(image, arucos, marker_length=MARKER_LENGTH, matrix_coefficients=frame_calibration.camera_matrix, distortion_coefficients=frame_calibration.distortion_coefficients, in_place=True)
 
-                try:
-                    cv2.putText(image, f"Frame rate:{round(1/(time()-frame_time),0)}",(10,40),fontFace=cv2.FONT_HERSHEY_SIMPLEX,fontScale=1,color=(0,255,255),thickness=2,lineType=cv2.LINE_AA)
-                except ZeroDivisionError:
-                    pass
+            try:
+                cv2.putText(image, f"Frame rate:{round(1/(time()-frame_time),0)}",(10,40),fontFace=cv2.FONT_HERSHEY_SIMPLEX,fontScale=1,color=(0,255,255),thickness=2,lineType=cv2.LINE_AA)
+            except ZeroDivisionError:
+                pass
 
-                if cv2.waitKey(1) & 0xFF == ord('l'):
-                    renderer.set_active_animation("dict3id15#0","launch")
-                    print("Launching...")
+        if latency_hud:
+            latency.recorder.draw_hud(image)
 
-                elif cv2.waitKey(1) & 0xFF == ord('r'):
-                    renderer.set_active_animation("dict3id15#0","default")
-                    print("Default")
+        display_time = time()
+        with latency.span("display"):
+            display_image = display_resize(image,display_image)
+            camera.show_image("camera",display_image)
+            # Single display events poll of the frame
+            dispatcher.poll()
+        if frame_server is not None:
+            frame_server.publish(display_image)
+        governor.record(DISPLAY,time()-display_time)
+        latency.recorder.record("frame",time()-frame_time)
+        latency.recorder.export_every(latency_export,latency_interval)
+        # Sensor to display latency (hardware timestamps in host time)
+        sensor_latency = camera.sensor_latency()
 
-                elif cv2.waitKey(1) & 0xFF == ord('f'):
-                    print("Freeze")
-                    renderer.freeze()
+        if governor.frames % GOVERNOR_REPORT_FRAMES == 0:
+            print(f"[ARN-Ethwork]: Detection governor {governor.report()}")
+            print(f"[ARN-Ethwork]: Camera {camera.stats()}, sensor to display latency {sensor_latency} ms")
 
-            image = cv2.resize(image, (0, 0), fx=3/4, fy=3/4)
-            camera.show_image("camera",image)
\ No newline at end of file
+    dispatcher.close()
+    if frame_server is not None:
+        frame_server.close()
+    if recorder is not None:
+        recorder.close()
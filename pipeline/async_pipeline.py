@@ -0,0 +1,235 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from typing import Any, AsyncIterator, Dict, List, Tuple
+import numpy as np
+
+from aruco.aruco import Aruco
+from aruco.dictionary_scheduler import DictionaryScheduler
+from augmentation.aruco_tracker import ArucoTracker
+
+# Track events
+APPEAR = "appear"
+MOVE = "move"
+DISAPPEAR = "disappear"
+
+# Default queue length of each consumer (frames and rendered frames: latest ones; events: oldest are dropped when full)
+FRAME_QUEUE = 2
+EVENT_QUEUE = 256
+# Wait (s) of the capture stage when the camera has no new frame
+IDLE_WAIT = 0.002
+
+# Subscriptions
+_FRAMES = "frames"
+_EVENTS = "events"
+_RENDERED = "rendered"
+# End of stream marker
+_END = object()
+
+class TrackEvent():
+    """ Track event of the `ArucoTracker`: a track appeared, moved (detected again) or disappeared (missing longer than the tracker
+    `max_frames_missing`). Attributes:
+        * kind: `appear`, `move` or `disappear`
+        * uid: UID of the track (ex. `dict3id15#0`)
+        * aruco: Last Aruco of the track (with its pose if the tracker estimates them)
+        * frame_number: Number of the frame of the event
+        * timestamp: Capture time of the frame (s)
+    """
+
+    __slots__ = ("kind", "uid", "aruco", "frame_number", "timestamp")
+
+    def __init__(self, kind: str, uid: str, aruco: Aruco, frame_number: int, timestamp: float) -> None:
+        self.kind = kind
+        self.uid = uid
+        self.aruco = aruco
+        self.frame_number = frame_number
+        self.timestamp = timestamp
+
+    def __repr__(self) -> str:
+        return f"TrackEvent({self.kind}, {self.uid}, frame {self.frame_number})"
+
+class AsyncPipeline():
+    """ asyncio interface of the capture, detection and render pipeline. The blocking stages run on their own single thread executors
+    (the camera, the detector and the tracker/renderer are not thread safe), pipelined so that capture, detection and rendering
+    of consecutive frames overlap:
+        * capture -> detection: latest frame wins (frames captured while detection is busy are dropped, as a live camera)
+        * detection -> rendering: bounded queue (detection waits for rendering)
+
+    Consumers iterate `frames()`, `events()` and `rendered()` from any number of tasks. Each consumer has its own bounded queue:
+    a slow consumer loses its oldest items instead of stalling the pipeline. Constructor params:
+        * camera: Frame source with `get_frame()` (`Camera`, or any camera module) and optionally `finished()`
+        * obj_map_path: Path to the JSON OBJ map (detected dictionaries)
+        * renderer: `Renderer` of the rendered frames (its tracker produces the events). If `None`, only frames and events are produced
+        * tracker: Tracker of the events without renderer (a new `ArucoTracker` if not set)
+        * sweep_interval: Frames between full dictionary sweeps of the detector
+
+    Usable as an async context manager (`async with AsyncPipeline(...) as pipeline`).
+    """
+
+    def __init__(self, camera: Any, obj_map_path: str, renderer: Any = None, tracker: ArucoTracker = None, sweep_interval: int = 30) -> None:
+        self.camera = camera
+        self.renderer = renderer
+        self.tracker = renderer.tracker if renderer is not None else (tracker or ArucoTracker())
+        self.scheduler = DictionaryScheduler(obj_map_path, sweep_interval=sweep_interval)
+        # Stage executors
+        self._capture_executor = ThreadPoolExecutor(1, thread_name_prefix="capture")
+        self._detect_executor = ThreadPoolExecutor(1, thread_name_prefix="detect")
+        self._render_executor = ThreadPoolExecutor(1, thread_name_prefix="render")
+        self._subscribers = {_FRAMES: [], _EVENTS: [], _RENDERED: []}
+        self._tasks = []
+        self._ended = False
+        self.stats = {"captured": 0, "dropped": 0, "processed": 0, "dropped_items": 0}
+
+    async def __aenter__(self) -> "AsyncPipeline":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def start(self) -> None:
+        """ Starts the pipeline stages on the running event loop. """
+        captured, detected = asyncio.Queue(maxsize=1), asyncio.Queue(maxsize=1)
+        self._tasks = [asyncio.ensure_future(self._capture(captured)), asyncio.ensure_future(self._detect(captured, detected)), asyncio.ensure_future(self._render(detected))]
+
+    async def stop(self) -> None:
+        """ Stops the pipeline stages, ends the consumer iterators and shuts the executors down. """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._end()
+        loop = asyncio.get_event_loop()
+        for executor in (self._capture_executor, self._detect_executor, self._render_executor):
+            await loop.run_in_executor(None, executor.shutdown)
+
+    async def join(self) -> None:
+        """ Waits until the source ends (recorded sources). """
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def frames(self, maxsize: int = FRAME_QUEUE) -> AsyncIterator[Tuple[int, float, np.ndarray]]:
+        """ Async iterator of the captured frames: (frame number, timestamp, frame). Frames must not be modified by the consumers. """
+        return self._subscribe(_FRAMES, maxsize)
+
+    def events(self, maxsize: int = EVENT_QUEUE) -> AsyncIterator[TrackEvent]:
+        """ Async iterator of the track events (`TrackEvent`: appear, move, disappear). """
+        return self._subscribe(_EVENTS, maxsize)
+
+    def rendered(self, maxsize: int = FRAME_QUEUE) -> AsyncIterator[Tuple[int, float, np.ndarray, List[Tuple[str, Aruco]]]]:
+        """ Async iterator of the rendered frames: (frame number, timestamp, rendered image, rendered (uid, aruco) entries). """
+        return self._subscribe(_RENDERED, maxsize)
+
+    async def _subscribe(self, kind: str, maxsize: int) -> AsyncIterator[Any]:
+        """ Consumer iterator: yields the items of its own queue until the pipeline ends. """
+        if self._ended:
+            return
+        queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers[kind].append(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self._subscribers[kind].remove(queue)
+
+    def _publish(self, kind: str, item: Any) -> None:
+        """ Puts the item in the queue of each consumer, dropping the oldest item of full queues. """
+        for queue in self._subscribers[kind]:
+            if queue.full():
+                queue.get_nowait()
+                self.stats["dropped_items"] += 1
+            queue.put_nowait(item)
+
+    def _end(self) -> None:
+        """ Ends the consumer iterators. """
+        self._ended = True
+        for queues in self._subscribers.values():
+            for queue in queues:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(_END)
+
+    async def _capture(self, captured: asyncio.Queue) -> None:
+        """ Capture stage: reads the camera frames and hands the latest one to detection. """
+        loop = asyncio.get_event_loop()
+        frame_number = 0
+        try:
+            while True:
+                frame = await loop.run_in_executor(self._capture_executor, self.camera.get_frame)
+                if frame is None:
+                    if getattr(self.camera, "finished", lambda: False)():
+                        break
+                    await asyncio.sleep(IDLE_WAIT)
+                    continue
+                item = (frame_number, time(), frame)
+                frame_number += 1
+                self.stats["captured"] += 1
+                self._publish(_FRAMES, item)
+                if captured.full():
+                    # Latest frame wins
+                    captured.get_nowait()
+                    self.stats["dropped"] += 1
+                captured.put_nowait(item)
+        finally:
+            if captured.full():
+                captured.get_nowait()
+            captured.put_nowait(_END)
+
+    async def _detect(self, captured: asyncio.Queue, detected: asyncio.Queue) -> None:
+        """ Detection stage: detects the Arucos of the latest captured frame (poses are left to the tracker if it estimates them). """
+        loop = asyncio.get_event_loop()
+        estimate_pose = self.tracker.marker_length is None
+        try:
+            while True:
+                item = await captured.get()
+                if item is _END:
+                    break
+                arucos = await loop.run_in_executor(self._detect_executor, lambda frame=item[2]: self.scheduler.detect(frame, estimate_pose=estimate_pose))
+                await detected.put(item + (arucos,))
+        except Exception:
+            # Ends the rendering stage
+            if detected.full():
+                detected.get_nowait()
+            detected.put_nowait(_END)
+            raise
+        await detected.put(_END)
+
+    async def _render(self, detected: asyncio.Queue) -> None:
+        """ Rendering stage: tracks (and renders) the detections and publishes the track events and rendered frames. """
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                item = await detected.get()
+                if item is _END:
+                    break
+                frame_number, timestamp, frame, arucos = item
+                image, updates, events = await loop.run_in_executor(self._render_executor, self._track, frame_number, timestamp, frame, arucos)
+                self.stats["processed"] += 1
+                for event in events:
+                    self._publish(_EVENTS, event)
+                if image is not None:
+                    self._publish(_RENDERED, (frame_number, timestamp, image, updates))
+        finally:
+            self._end()
+
+    def _track(self, frame_number: int, timestamp: float, frame: np.ndarray, arucos: List[Aruco]) -> Tuple[np.ndarray, List[Tuple[str, Aruco]], List[TrackEvent]]:
+        """ Updates the tracker (through the renderer, that renders a copy of the frame) and returns the rendered image, the updates
+        and the track events of the frame. """
+        previous = dict(self.tracker.register())
+        image = None
+        if self.renderer is not None:
+            # Captured frames are shared with the frames consumers
+            image = frame.copy()
+            updates = self.renderer.render(image, arucos)
+        else:
+            updates = self.tracker.update(arucos)
+        register = self.tracker.register()
+        events = [TrackEvent(MOVE if uid in previous else APPEAR, uid, aruco, frame_number, timestamp) for uid, aruco in updates]
+        events += [TrackEvent(DISAPPEAR, uid, entry["aruco"], frame_number, timestamp) for uid, entry in previous.items() if uid not in register]
+        return image, updates, events
+
+    def report(self) -> Dict[str, int]:
+        """ Returns the captured, dropped (capture stage), processed frames and dropped consumer items counters. """
+        return dict(self.stats)
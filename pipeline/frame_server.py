@@ -0,0 +1,228 @@
+import os
+import socketserver
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+from typing import Dict, Tuple
+import cv2
+import numpy as np
+
+# Server host (local connections only, unless set otherwise)
+HOST = "127.0.0.1"
+# Default JPEG encoding workers and quality
+DEFAULT_WORKERS = 2
+DEFAULT_QUALITY = 80
+# Max wait (s) of the clients for a new frame (they check the server is still running between waits)
+CLIENT_WAIT = 1.0
+# Raw frame header: sequence number, width, height, channels, frame bytes
+RAW_HEADER = struct.Struct("<QIIII")
+# Multipart boundary of the MJPEG streams
+BOUNDARY = b"frame"
+
+class _Channel():
+    """ Latest frames of a stream. `condition` guards all the fields and wakes the clients on each new frame. """
+
+    def __init__(self) -> None:
+        self.condition = Condition()
+        # Latest published (sequence, frame) and latest encoded (sequence, JPEG bytes)
+        self.sequence = 0
+        self.raw = (0, None)
+        self.jpeg = (0, None)
+        # Frame waiting for an encoding worker (replaced by newer frames)
+        self.pending = None
+        self.encoding = 0
+        # Connected clients
+        self.jpeg_clients = 0
+        self.raw_clients = 0
+
+class FrameServer():
+    """ Local streaming server of the rendered frames. Each named stream is served as:
+        * MJPEG over HTTP: `http://<host>:<port>/<name>.mjpg` (ex. in a browser or `<img>` tag) and single JPEG `/<name>.jpg`
+        * Raw frames over TCP (`raw_port`): the client sends the stream name and a newline, then receives each frame as a
+        `RAW_HEADER` (sequence, width, height, channels, bytes) followed by the frame bytes (BGR, row major)
+
+    `publish` never blocks the render loop: it copies the frame (only while the stream has clients) and hands it to the JPEG encoding
+    workers, and a frame arriving while all the workers are busy replaces the one waiting. Every client is sent the latest frame
+    when it is ready for one (latest frame wins), so slow viewers skip frames instead of adding latency. Constructor params:
+        * port: HTTP MJPEG port (`None` or 0 -> no HTTP server)
+        * raw_port: Raw frames TCP port (`None` or 0 -> no raw server)
+        * workers: JPEG encoding workers
+        * quality: JPEG quality
+        * host: Listening address
+    """
+
+    def __init__(self, port: int = None, raw_port: int = None, workers: int = DEFAULT_WORKERS, quality: int = DEFAULT_QUALITY, host: str = HOST) -> None:
+        self.workers = workers
+        self.quality = quality
+        self.running = True
+        self._channels = {}
+        self._encoder = ThreadPoolExecutor(workers, thread_name_prefix="jpeg")
+        self.stats = {"published": 0, "encoded": 0, "dropped": 0}
+        self._servers = []
+        if port:
+            self._start(ThreadingHTTPServer((host, port), _StreamHandler), "MJPEG")
+        if raw_port:
+            self._start(_RawServer((host, raw_port), _RawHandler), "raw")
+
+    def _start(self, server: socketserver.BaseServer, kind: str) -> None:
+        """ Serves the server on a daemon thread. """
+        server.frame_server = self
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        self._servers.append(server)
+        print(f"[Frame Server]: Serving {kind} frames on {server.server_address[0]}:{server.server_address[1]}")
+
+    def channel(self, name: str) -> _Channel:
+        """ Returns the channel of the named stream (created on first use). """
+        if name not in self._channels:
+            self._channels.setdefault(name, _Channel())
+        return self._channels[name]
+
+    def clients(self, name: str = "camera") -> int:
+        """ Returns the number of clients of the named stream. """
+        channel = self.channel(name)
+        return channel.jpeg_clients + channel.raw_clients
+
+    def publish(self, image: np.ndarray, name: str = "camera") -> bool:
+        """ Publishes a frame of the named stream, without blocking. The image can be reused by the caller afterwards. Returns
+        `False` if the stream has no clients (the frame is ignored). """
+        channel = self.channel(name)
+        if not channel.jpeg_clients and not channel.raw_clients:
+            return False
+        # Render and display buffers are reused by the caller
+        frame = image.copy()
+        with channel.condition:
+            channel.sequence += 1
+            channel.raw = (channel.sequence, frame)
+            self.stats["published"] += 1
+            if channel.jpeg_clients:
+                if channel.encoding < self.workers:
+                    channel.encoding += 1
+                    self._encoder.submit(self._encode, channel, channel.sequence, frame)
+                else:
+                    # Latest frame wins
+                    if channel.pending is not None:
+                        self.stats["dropped"] += 1
+                    channel.pending = (channel.sequence, frame)
+            channel.condition.notify_all()
+        return True
+
+    def _encode(self, channel: _Channel, sequence: int, frame: np.ndarray) -> None:
+        """ Encoding worker: encodes the frame, then the frames left pending meanwhile. Only newer frames replace the latest JPEG. """
+        while True:
+            jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes()
+            with channel.condition:
+                self.stats["encoded"] += 1
+                if sequence > channel.jpeg[0]:
+                    channel.jpeg = (sequence, jpeg)
+                    channel.condition.notify_all()
+                if channel.pending is None:
+                    channel.encoding -= 1
+                    return
+                (sequence, frame), channel.pending = channel.pending, None
+
+    def wait_frame(self, channel: _Channel, field: str, last: int) -> Tuple[int, object]:
+        """ Waits for a frame newer than `last` (`raw` or `jpeg`) and returns its (sequence, data), or `last` and `None` after
+        `CLIENT_WAIT` seconds or if the server stopped. """
+        with channel.condition:
+            channel.condition.wait_for(lambda: getattr(channel, field)[0] > last or not self.running, timeout=CLIENT_WAIT)
+            sequence, data = getattr(channel, field)
+        return (sequence, data) if sequence > last else (last, None)
+
+    def report(self) -> Dict[str, int]:
+        """ Returns the published, encoded and dropped (not encoded) frames counters and the number of clients. """
+        return {**self.stats, "clients": sum(channel.jpeg_clients + channel.raw_clients for channel in self._channels.values())}
+
+    def close(self) -> None:
+        """ Disconnects the clients and stops the servers and the encoding workers. """
+        self.running = False
+        for channel in self._channels.values():
+            with channel.condition:
+                channel.condition.notify_all()
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._encoder.shutdown(wait=False)
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    """ HTTP client: MJPEG stream (`/<name>.mjpg`) or single JPEG (`/<name>.jpg`). """
+
+    def do_GET(self) -> None:
+        server = self.server.frame_server
+        name, extension = os.path.splitext(self.path.split("?")[0].strip("/"))
+        if extension not in (".mjpg", ".jpg") or not name:
+            self.send_error(404, "Streams: /<name>.mjpg, /<name>.jpg")
+            return
+        channel = server.channel(name)
+        with channel.condition:
+            channel.jpeg_clients += 1
+        try:
+            if extension == ".jpg":
+                self._send_snapshot(server, channel)
+            else:
+                self._send_stream(server, channel)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            with channel.condition:
+                channel.jpeg_clients -= 1
+
+    def _send_snapshot(self, server: FrameServer, channel: _Channel) -> None:
+        """ Sends the latest JPEG (waiting for one if the stream had no clients). """
+        sequence, jpeg = channel.jpeg
+        if jpeg is None:
+            sequence, jpeg = server.wait_frame(channel, "jpeg", 0)
+        if jpeg is None:
+            self.send_error(503, "No frame")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(jpeg)))
+        self.end_headers()
+        self.wfile.write(jpeg)
+
+    def _send_stream(self, server: FrameServer, channel: _Channel) -> None:
+        """ Sends the latest JPEG each time a newer one is encoded. """
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY.decode()}")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        last = 0
+        while server.running:
+            last, jpeg = server.wait_frame(channel, "jpeg", last)
+            if jpeg is None:
+                continue
+            self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+
+    def log_message(self, format: str, *args) -> None:
+        """ Requests are not logged. """
+
+class _RawServer(socketserver.ThreadingTCPServer):
+    """ Raw frames TCP server. """
+
+    allow_reuse_address = True
+
+class _RawHandler(socketserver.StreamRequestHandler):
+    """ Raw frames client: reads the stream name, then sends the latest frame each time a newer one is published. """
+
+    def handle(self) -> None:
+        server = self.server.frame_server
+        name = self.rfile.readline().decode("utf-8", errors="replace").strip() or "camera"
+        channel = server.channel(name)
+        with channel.condition:
+            channel.raw_clients += 1
+        try:
+            last = 0
+            while server.running:
+                last, frame = server.wait_frame(channel, "raw", last)
+                if frame is None:
+                    continue
+                channels = frame.shape[2] if frame.ndim == 3 else 1
+                self.wfile.write(RAW_HEADER.pack(last, frame.shape[1], frame.shape[0], channels, frame.nbytes))
+                self.wfile.write(np.ascontiguousarray(frame).data)
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            with channel.condition:
+                channel.raw_clients -= 1